@@ -0,0 +1,89 @@
+"""Compare the frame latency and poll count of the frame wait strategies.
+
+Frames are scheduled on a MockTutkLibrary at a fixed framerate, with some
+jitter, and received through P2PSession.recv_video_buffers; latency is the
+time between a frame becoming readable and the generator yielding it.  The
+idle measurement counts polls per second on a channel that never sends a frame.
+
+Run with `python -m examples.benchmark_frame_wait`.
+"""
+
+import random
+import statistics
+import time
+
+from p2pcam.frame_wait import (
+    AdaptiveFrameWait,
+    FixedIntervalWait,
+    FrameWaitStrategy,
+)
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import MockTutkLibrary, mock_session
+from p2pcam.tutk import tutk
+
+
+def measure(frame_wait: FrameWaitStrategy, framerate=20, num_frames=100):
+    lib = MockTutkLibrary()
+    session = mock_session(lib, frame_wait=frame_wait)
+    start = time.monotonic() + 0.1
+    schedule = []
+    for i in range(num_frames):
+        available_at = start + (i + random.uniform(-0.2, 0.2)) / framerate
+        schedule.append(available_at)
+        lib.push_frame(
+            b"\x00" * 1024,
+            tutk.FrameInfoStruct(framerate=framerate, frame_no=i),
+            available_at=available_at,
+        )
+
+    latencies = []
+    try:
+        for i, buffer in enumerate(session.recv_video_buffers()):
+            latencies.append(time.monotonic() - schedule[i])
+            buffer.release()
+            if i == num_frames - 1:
+                break
+    finally:
+        P2PPlatform.unload_Platform()
+    latencies.sort()
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "polls_per_frame": lib.recv_frame_calls / num_frames,
+    }
+
+
+def measure_idle(frame_wait: FrameWaitStrategy, seconds=2.0):
+    lib = MockTutkLibrary()
+    session = mock_session(lib, frame_wait=frame_wait)
+    try:
+        for _ in session.recv_video_buffers(timeout=seconds):
+            pass
+    except tutk.TutkError as e:
+        assert e.args[0] == tutk.AV_ER_TIMEOUT
+    finally:
+        P2PPlatform.unload_Platform()
+    return lib.recv_frame_calls / seconds
+
+
+def main():
+    for framerate in (10, 20, 30):
+        for frame_wait in (FixedIntervalWait(), AdaptiveFrameWait()):
+            stats = measure(frame_wait, framerate)
+            print(
+                f"{framerate:>2} fps {type(frame_wait).__name__:<18} "
+                f"mean {stats['mean_ms']:5.1f} ms  "
+                f"p95 {stats['p95_ms']:5.1f} ms  "
+                f"max {stats['max_ms']:5.1f} ms  "
+                f"polls/frame {stats['polls_per_frame']:4.1f}"
+            )
+    for frame_wait in (FixedIntervalWait(), AdaptiveFrameWait()):
+        print(
+            f"idle   {type(frame_wait).__name__:<18} "
+            f"polls/second {measure_idle(frame_wait):4.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,29 @@ try:
 except PackageNotFoundError:  # pragma: no cover
     __version__ = "unknown"
 
+from .activity import FrameSizeActivity, FrameSizeBaseline
+from .catalog import ArchiveCatalog, Marker, SeekPoint
+from .decoder import (
+    DecodeSelection,
+    EveryNthFrame,
+    FrameDecoder,
+    FrameInterval,
+    KeyframesOnly,
+)
+from .event_recorder import EventRecorder, PacketBuffer
+from .frame_ring import FrameRing, OverflowPolicy
+from .frame_wait import AdaptiveFrameWait, FixedIntervalWait
+from .hls import HlsPackager, HlsPart, HlsSegment
+from .hls_server import HlsServer
 from .iotc import P2PPlatform, P2PSession, WyzeIOTCSessionState
 from .models import P2PCamera, P2PSettings, ServiceAccount, ServiceCredential
+from .motion_pool import MotionEvent, MotionPool
+from .recorder import Segment, SegmentRecorder
+from .rtsp import RtpPacketizer, RtspServer
 from .service_broker import ServiceBroker
+from .shared_ring import (
+    SharedFramePublisher,
+    SharedFrameReader,
+    SharedFrameRing,
+)
+from .stream_hub import StreamHub, Subscription
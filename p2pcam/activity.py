@@ -0,0 +1,148 @@
+from typing import Optional
+
+import math
+
+from .decoder import DecodeSelection
+from .tutk import tutk
+
+
+class FrameSizeBaseline:
+    """
+    A running baseline of the sizes of the inter-coded (non-key) frames of one
+    camera's stream.
+
+    An inter-coded frame only encodes what changed since the frames before
+    it, so while a camera watches a still scene its P-frames are small and
+    steady, and anything moving makes them jump.  The baseline keeps an
+    exponentially weighted mean and variance of `frame_len`, and scores each
+    frame by how many standard deviations it lies above the mean.  Frames
+    scored as outliers update the baseline `outlier_weight` times as slowly, so
+    a long stretch of motion does not become the new normal, while a lasting
+    change, such as the lights going on, is still learned eventually.
+
+    :var mean: the mean P-frame size, in bytes.
+    :var variance: the variance of the P-frame size, in bytes squared.
+    :var frames: the number of P-frames seen.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.02,
+        sigmas: float = 4.0,
+        min_ratio: float = 1.5,
+        warmup: int = 30,
+        outlier_weight: float = 0.1,
+    ) -> None:
+        """Construct a baseline.
+
+        :param alpha: the weight of each new frame in the mean and variance.
+        :param sigmas: the number of standard deviations above the mean at
+                       which a frame is an outlier.
+        :param min_ratio: the least multiple of the mean that is an outlier,
+                          so that a very steady stream does not flag frames a
+                          few bytes larger than usual.
+        :param warmup: the number of P-frames to see before flagging any.
+        :param outlier_weight: how much outliers count towards the baseline,
+                               relative to other frames.
+        """
+        self.alpha = alpha
+        self.sigmas = sigmas
+        self.min_ratio = min_ratio
+        self.warmup = warmup
+        self.outlier_weight = outlier_weight
+        self.mean = 0.0
+        self.variance = 0.0
+        self.frames = 0
+
+    def update(self, frame_len: int) -> bool:
+        """Add the size of one P-frame to the baseline.
+
+        :returns: True if the frame is an outlier, i.e. a sign of motion.
+        """
+        self.frames += 1
+        if self.frames == 1:
+            self.mean = float(frame_len)
+            return False
+        outlier = self.frames > self.warmup and (
+            frame_len > self.mean + self.sigmas * math.sqrt(self.variance)
+            and frame_len > self.min_ratio * self.mean
+        )
+        alpha = self.alpha * self.outlier_weight if outlier else self.alpha
+        diff = frame_len - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.variance = (1 - alpha) * (self.variance + diff * increment)
+        return outlier
+
+
+class FrameSizeActivity(DecodeSelection):
+    """
+    A [DecodeSelection][wyzecam.decoder.DecodeSelection] that selects frames
+    only while the sizes of the received frames suggest something is moving,
+    judged by a [FrameSizeBaseline][wyzecam.activity.FrameSizeBaseline].
+
+    A camera becomes a motion candidate at an outlying P-frame, and stays one
+    until `hold` seconds of stream time after the last outlier.  Outside those
+    windows, nothing is decoded: the [FrameDecoder][wyzecam.decoder.FrameDecoder]
+    holds back the frames of the current GOP without decoding them, and only
+    decodes them, skipping their output, when a candidate frame needs them as
+    references.  For a mostly static camera, decoding and motion detection
+    then cost almost nothing; use one selection per camera, and run the
+    [MotionDetector][wyzecam.motion.MotionDetector] on what it selects:
+
+    ```python
+    activity = FrameSizeActivity()
+    detector = MotionDetector(analysis_width=320)
+    for img, frame_info in sess.recv_video_frame_ndarray(
+        selection=activity, output_format="y"
+    ):
+        detector.detect_boxes(img)
+    ```
+
+    :var baseline: the frame size baseline of the camera.
+    :var frames: the number of frames seen.
+    :var selected: the number of frames selected for decoding.
+    """
+
+    def __init__(
+        self,
+        baseline: Optional[FrameSizeBaseline] = None,
+        hold: float = 3.0,
+    ) -> None:
+        """Construct a selection.
+
+        :param baseline: the baseline to use; a new
+                         [FrameSizeBaseline][wyzecam.activity.FrameSizeBaseline]
+                         with its default settings if not specified.
+        :param hold: how long a camera stays a candidate after the last
+                     outlying frame, in seconds.
+        """
+        self.baseline = (
+            baseline if baseline is not None else FrameSizeBaseline()
+        )
+        self.hold = hold
+        self.frames = 0
+        self.selected = 0
+        self._last_outlier: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        """True while the camera is a motion candidate."""
+        return self._last_outlier is not None
+
+    def wants(self, frame_info: tutk.FrameInfoStruct) -> bool:
+        self.frames += 1
+        timestamp = frame_info.timestamp_seconds
+        if not frame_info.is_keyframe and self.baseline.update(
+            frame_info.frame_len
+        ):
+            self._last_outlier = timestamp
+        if self._last_outlier is not None and not (
+            0 <= timestamp - self._last_outlier < self.hold
+        ):
+            # expired, or the camera's clock stepped backwards
+            self._last_outlier = None
+        if self._last_outlier is None:
+            return False
+        self.selected += 1
+        return True
@@ -0,0 +1,314 @@
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Tuple
+
+import logging
+import sqlite3
+import threading
+
+from .models import P2PCamera
+from .recorder import Segment
+
+try:
+    import av
+except ImportError:
+    av = None
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    mac TEXT NOT NULL,
+    p2p_id TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    codec TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    frames INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_by_time ON segments (mac, start);
+CREATE TABLE IF NOT EXISTS keyframes (
+    segment_id INTEGER NOT NULL REFERENCES segments (id) ON DELETE CASCADE,
+    mac TEXT NOT NULL,
+    time REAL NOT NULL,
+    offset INTEGER NOT NULL,
+    pts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS keyframes_by_time ON keyframes (mac, time);
+CREATE TABLE IF NOT EXISTS markers (
+    id INTEGER PRIMARY KEY,
+    mac TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS markers_by_time ON markers (mac, start);
+"""
+
+
+class SeekPoint:
+    """
+    The keyframe to start reading a recording from to reach a point in time.
+
+    :var path: the path of the segment file holding the keyframe.
+    :var time: the timestamp of the keyframe, in seconds.
+    :var offset: the byte offset of the keyframe in the segment file.
+    :var pts: the presentation timestamp of the keyframe, in the time base of
+              the segment's video stream.
+    :var segment: the [Segment][wyzecam.recorder.Segment] holding the keyframe.
+    """
+
+    def __init__(
+        self, segment: Segment, time: float, offset: int, pts: int
+    ) -> None:
+        self.segment = segment
+        self.path = segment.path
+        self.time = time
+        self.offset = offset
+        self.pts = pts
+
+    def __repr__(self) -> str:
+        return f"<SeekPoint {self.path} @{self.offset} t={self.time:.3f}>"
+
+
+class Marker:
+    """
+    An event, such as detected motion, noted in an
+    [ArchiveCatalog][wyzecam.catalog.ArchiveCatalog].
+
+    :var mac: the MAC address of the camera.
+    :var kind: what happened, e.g. "motion".
+    :var start: the timestamp of the start of the event, in seconds.
+    :var end: the timestamp of the end of the event, in seconds.
+    """
+
+    def __init__(self, mac: str, kind: str, start: float, end: float) -> None:
+        self.mac = mac
+        self.kind = kind
+        self.start = start
+        self.end = end
+
+    def __repr__(self) -> str:
+        return (
+            f"<Marker {self.kind} {self.mac} {self.start:.3f}-{self.end:.3f}>"
+        )
+
+
+def keyframe_index(path: str, start: float) -> List[Tuple[float, int, int]]:
+    """Read the keyframes of a recorded segment, without decoding it.
+
+    :param path: the segment file.
+    :param start: the timestamp of the first frame of the segment, in seconds.
+    :returns: a list of `(time, byte offset, pts)` tuples, one per keyframe.
+    """
+    keyframes = []
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        first_pts = None
+        for packet in container.demux(stream):
+            if packet.pts is None or not packet.is_keyframe:
+                continue
+            if first_pts is None:
+                first_pts = packet.pts
+            time = start + float((packet.pts - first_pts) * stream.time_base)
+            keyframes.append((time, packet.pos, packet.pts))
+    return keyframes
+
+
+class ArchiveCatalog:
+    """
+    A SQLite index of recorded segments, their keyframes, and events, for
+    finding the footage of a camera at a given time without scanning the
+    recordings.
+
+    Segments are added as [SegmentRecorder][wyzecam.recorder.SegmentRecorder]
+    finishes them, by passing `indexer()` as its `on_segment` callback.  Each
+    segment is read once, without decoding, for the timestamp and byte offset of
+    each of its keyframes; `seek()` then finds the keyframe to start playing
+    from with a single indexed lookup, however much footage is catalogued.
+
+    ```python
+    catalog = ArchiveCatalog("/recordings/catalog.db")
+    with SegmentRecorder(sess, "/recordings", on_segment=catalog.indexer(sess)):
+        ...
+    for frame, timestamp in catalog.frames_around(camera.mac, t):
+        ...
+    ```
+
+    The catalog may be used from several threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open a catalog, creating it if missing.
+
+        :param path: the SQLite database file, or ":memory:".
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> "ArchiveCatalog":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def indexer(self, session: "P2PSession") -> Callable[[Segment], None]:
+        """A callback adding each segment recorded from `session`, for
+        [SegmentRecorder][wyzecam.recorder.SegmentRecorder]'s `on_segment`."""
+        camera = session.camera
+
+        def on_segment(segment: Segment) -> None:
+            try:
+                self.add_segment(segment, camera)
+            except Exception as e:
+                _Logger.warning(f"Could not catalog {segment}: {e!r}")
+
+        return on_segment
+
+    def add_segment(self, segment: Segment, camera: P2PCamera) -> None:
+        """Add a finished segment of `camera`'s video, indexing its keyframes."""
+        if av is None:
+            raise RuntimeError(
+                "ArchiveCatalog requires PyAv to index recordings. "
+                "Install with `pip install av` and try again."
+            )
+        keyframes = keyframe_index(segment.path, segment.start)
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM segments WHERE path = ?", (segment.path,)
+            )
+            segment_id = self._db.execute(
+                "INSERT INTO segments "
+                "(mac, p2p_id, path, codec, start, end, frames, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    camera.mac,
+                    camera.p2p_id,
+                    segment.path,
+                    segment.codec_name,
+                    segment.start,
+                    segment.end,
+                    segment.frames,
+                    segment.size,
+                ),
+            ).lastrowid
+            self._db.executemany(
+                "INSERT INTO keyframes (segment_id, mac, time, offset, pts) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(segment_id, camera.mac, *keyframe) for keyframe in keyframes],
+            )
+
+    def remove_segments(self, before: float, mac: Optional[str] = None) -> int:
+        """Forget the segments that ended before `before`, e.g. once their
+        files are deleted; returns the number removed."""
+        query = "DELETE FROM segments WHERE end < ?"
+        args: Tuple = (before,)
+        if mac is not None:
+            query += " AND mac = ?"
+            args = (before, mac)
+        with self._lock, self._db:
+            return self._db.execute(query, args).rowcount
+
+    def add_marker(
+        self,
+        mac: str,
+        start: float,
+        end: Optional[float] = None,
+        kind: str = "motion",
+    ) -> None:
+        """Note an event of camera `mac` from `start` to `end` (timestamps in
+        seconds), such as the span of an event clip or detected motion."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO markers (mac, kind, start, end) "
+                "VALUES (?, ?, ?, ?)",
+                (mac, kind, start, start if end is None else end),
+            )
+
+    def markers(
+        self,
+        mac: str,
+        start: float,
+        end: float,
+        kind: Optional[str] = None,
+    ) -> List[Marker]:
+        """The events of camera `mac` overlapping `start` to `end`, oldest
+        first."""
+        query = (
+            "SELECT mac, kind, start, end FROM markers "
+            "WHERE mac = ? AND start <= ? AND end >= ?"
+        )
+        args: Tuple = (mac, end, start)
+        if kind is not None:
+            query += " AND kind = ?"
+            args += (kind,)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY start", args).fetchall()
+        return [Marker(*row) for row in rows]
+
+    def segments(self, mac: str, start: float, end: float) -> List[Segment]:
+        """The segments of camera `mac` overlapping `start` to `end`, oldest
+        first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, codec, start, end, frames, size FROM segments "
+                "WHERE mac = ? AND start <= ? AND end >= ? ORDER BY start",
+                (mac, end, start),
+            ).fetchall()
+        return [Segment(*row) for row in rows]
+
+    def seek(self, mac: str, time: float) -> Optional[SeekPoint]:
+        """The last keyframe of camera `mac` at or before `time`, within a
+        segment that extends to `time`; None if there is no footage of then."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT k.time, k.offset, k.pts, "
+                "s.path, s.codec, s.start, s.end, s.frames, s.size "
+                "FROM keyframes k JOIN segments s ON s.id = k.segment_id "
+                "WHERE k.mac = ? AND k.time <= ? "
+                "ORDER BY k.time DESC LIMIT 1",
+                (mac, time),
+            ).fetchone()
+        if row is None or row[6] < time:
+            return None
+        return SeekPoint(Segment(*row[3:]), *row[:3])
+
+    def frames_around(
+        self,
+        mac: str,
+        time: float,
+        before: float = 1.0,
+        after: float = 1.0,
+    ) -> Iterator[Tuple["av.VideoFrame", float]]:
+        """Decode the recorded frames of camera `mac` from `before` seconds
+        before `time` until `after` seconds after it, within one segment.
+
+        :returns: a generator of `(frame, timestamp)` tuples.
+        """
+        point = self.seek(mac, time - before)
+        if point is None:
+            point = self.seek(mac, time)
+            if point is None:
+                return
+        with av.open(point.path) as container:
+            stream = container.streams.video[0]
+            container.seek(point.pts, stream=stream)
+            for frame in container.decode(stream):
+                timestamp = point.time + float(
+                    (frame.pts - point.pts) * stream.time_base
+                )
+                if timestamp > time + after:
+                    return
+                if timestamp >= time - before:
+                    yield frame, timestamp
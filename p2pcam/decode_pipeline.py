@@ -0,0 +1,210 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+import logging
+import threading
+import time
+
+from .decoder import DecodeSelection, FrameDecoder
+from .frame_convert import frame_to_ndarray
+from .frame_ring import FrameRing, OverflowPolicy
+from .tutk import tutk
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    """
+    Throughput counters for one stage of a [DecodePipeline][wyzecam.decode_pipeline.DecodePipeline].
+
+    :var name: the name of the stage.
+    :var frames: the number of frames the stage has handed on.
+    :var busy_seconds: the time the stage has spent working, rather than waiting
+                       for input.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.frames = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+
+    def record(self, busy_seconds: float, frames: int = 1) -> None:
+        self.frames += frames
+        self.busy_seconds += busy_seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "frames": self.frames,
+            "frames_per_second": self.frames / elapsed,
+            "busy_seconds": self.busy_seconds,
+            "utilization": self.busy_seconds / elapsed,
+        }
+
+
+class DecodePipeline:
+    """
+    Receives, decodes and color-converts the video stream of a
+    [P2PSession][wyzecam.iotc.P2PSession] on three threads, connected by bounded
+    [FrameRing][wyzecam.frame_ring.FrameRing]s.
+
+    Unlike `recv_video_frame_ndarray`, which runs every step on the caller's thread,
+    the receive stage here is never blocked by decoding: if decoding falls behind,
+    frames are dropped from the receive ring according to `receive_policy`.  The
+    decode and convert stages apply backpressure to each other, and to the caller,
+    by blocking.  PyAV releases the GIL while decoding and converting, so the
+    stages run in parallel.
+
+    ```python
+    with DecodePipeline(sess, thread_type="FRAME", thread_count=4) as pipeline:
+        for img, frame_info in pipeline:
+            ...
+        print(pipeline.stats())
+    ```
+
+    :var stages: the [StageStats][wyzecam.decode_pipeline.StageStats] of the receive,
+                 decode and convert stages.
+    """
+
+    def __init__(
+        self,
+        session: "P2PSession",
+        output_format: Optional[str] = "bgr24",
+        thread_type: Optional[str] = "AUTO",
+        thread_count: int = 0,
+        queue_size: int = 8,
+        receive_policy: OverflowPolicy = OverflowPolicy.DROP_GOP,
+        selection: Optional[DecodeSelection] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        interpolation: Optional[str] = None,
+    ) -> None:
+        """Construct a decode pipeline; call `start()`, or use it as a context manager.
+
+        :param session: the connected session to receive video from.
+        :param output_format: the format of the numpy arrays produced (see
+                              [frame_to_ndarray][wyzecam.frame_convert.frame_to_ndarray]);
+                              if None, the pipeline yields PyAV VideoFrames and has
+                              no convert stage.
+        :param thread_type: the PyAV decoder `thread_type`; one of "NONE", "SLICE",
+                            "FRAME" or "AUTO".
+        :param thread_count: the PyAV decoder `thread_count`; 0 lets FFmpeg decide.
+        :param queue_size: the capacity of each ring between stages.
+        :param receive_policy: how the receive stage drops frames while decoding is
+                               behind; since the decode stage reads them, this
+                               should be `DROP_GOP` or `BLOCK`, which keep every
+                               decoded frame's references intact.
+        :param selection: if specified, only decode the frames chosen by this
+                          [DecodeSelection][wyzecam.decoder.DecodeSelection].
+        :param width: if specified, the convert stage scales frames to this width.
+        :param height: if specified, the convert stage scales frames to this height.
+        :param interpolation: if specified, the swscale interpolation used for
+                              scaling, e.g. "BILINEAR" or "AREA".
+        """
+        self.session = session
+        self.output_format = output_format
+        self.thread_type = thread_type
+        self.thread_count = thread_count
+        self.selection = selection
+        self.width = width
+        self.height = height
+        self.interpolation = interpolation
+        self.received = FrameRing(queue_size, receive_policy)
+        self.decoded = FrameRing(queue_size, OverflowPolicy.BLOCK)
+        self.converted = FrameRing(queue_size, OverflowPolicy.BLOCK)
+        self.stages = {
+            name: StageStats(name) for name in ("receive", "decode", "convert")
+        }
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        assert not self._threads, "DecodePipeline already started!"
+        targets = [self._receive_stage, self._decode_stage]
+        if self.output_format is not None:
+            targets.append(self._convert_stage)
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stopping.set()
+        for ring in (self.received, self.decoded, self.converted):
+            ring.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self) -> "DecodePipeline":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def __iter__(self) -> Iterator[Tuple[Any, tutk.FrameInfoStruct]]:
+        output = self.decoded if self.output_format is None else self.converted
+        return iter(output)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage throughput, plus the frames dropped by the receive stage."""
+        stats = {name: stage.as_dict() for name, stage in self.stages.items()}
+        stats["receive"]["dropped"] = sum(self.received.dropped.values())
+        return stats
+
+    def _receive_stage(self) -> None:
+        stage = self.stages["receive"]
+        error: Optional[BaseException] = None
+        try:
+            for frame_data, frame_info in self.session.recv_video_data(
+                copy=True, stop=self._stopping
+            ):
+                started = time.monotonic()
+                if not self.received.put(frame_data, frame_info):
+                    break
+                stage.record(time.monotonic() - started)
+        except Exception as e:
+            error = e
+        self.received.close(error)
+
+    def _decode_stage(self) -> None:
+        stage = self.stages["decode"]
+        decoder = FrameDecoder(
+            self.selection, self.thread_type, self.thread_count
+        )
+        error: Optional[BaseException] = None
+        try:
+            for frame_data, frame_info in self.received:
+                started = time.monotonic()
+                frames = decoder.decode(frame_data, frame_info)
+                stage.record(time.monotonic() - started, len(frames))
+                for frame, info in frames:
+                    if not self.decoded.put(frame, info):
+                        return
+        except Exception as e:
+            error = e
+        self.decoded.close(error)
+
+    def _convert_stage(self) -> None:
+        stage = self.stages["convert"]
+        error: Optional[BaseException] = None
+        try:
+            for frame, frame_info in self.decoded:
+                started = time.monotonic()
+                img = frame_to_ndarray(
+                    frame,
+                    self.output_format,
+                    self.width,
+                    self.height,
+                    self.interpolation,
+                )
+                stage.record(time.monotonic() - started)
+                if not self.converted.put(img, frame_info):
+                    return
+        except Exception as e:
+            error = e
+        self.converted.close(error)
@@ -0,0 +1,215 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+from fractions import Fraction
+
+from .tutk import tutk
+
+try:
+    import av
+    import av.video.frame
+except ImportError:
+    av = None
+
+FrameData = Union[bytes, memoryview]
+
+TIME_BASE = Fraction(1, 1_000_000)
+"""The time base of decoded frames' `pts`; `timestamp_ms` is in microseconds"""
+
+_MAX_IN_FLIGHT = 64
+
+
+def codec_name(frame_info: tutk.FrameInfoStruct) -> str:
+    """The FFmpeg name of the codec described by `frame_info.codec_id`."""
+    if frame_info.codec_id == 78:
+        return "h264"
+    elif frame_info.codec_id == 80:
+        return "hevc"
+    print(f"Unexpected codec! got {frame_info.codec_id}.")
+    return "h264"
+
+
+def create_codec(
+    frame_info: tutk.FrameInfoStruct,
+    thread_type: Optional[str] = None,
+    thread_count: int = 0,
+) -> "av.CodecContext":
+    """Create a PyAV decoder for the codec described by `frame_info.codec_id`.
+
+    :param frame_info: the [FrameInfoStruct][wyzecam.tutk.tutk.FrameInfoStruct] of a
+                       frame of the stream to decode.
+    :param thread_type: if specified, the decoder `thread_type` ("SLICE", "FRAME"
+                        or "AUTO").
+    :param thread_count: the decoder `thread_count`; 0 lets FFmpeg decide.
+    """
+    # noinspection PyUnresolvedReferences
+    codec = av.CodecContext.create(codec_name(frame_info), "r")
+    if thread_type is not None:
+        codec.thread_type = thread_type
+        codec.thread_count = thread_count
+    return codec
+
+
+class DecodeSelection:
+    """
+    Chooses which frames of a stream a [FrameDecoder][wyzecam.decoder.FrameDecoder]
+    produces.  The base class selects every frame.
+    """
+
+    keyframes_only = False
+    """True if only keyframes are ever selected, so other frames need no decoding at all"""
+
+    def wants(self, frame_info: tutk.FrameInfoStruct) -> bool:
+        """Called once per received frame, in order; True if it should be decoded."""
+        return True
+
+
+class KeyframesOnly(DecodeSelection):
+    """Select only keyframes; every other frame is discarded without decoding."""
+
+    keyframes_only = True
+
+    def wants(self, frame_info: tutk.FrameInfoStruct) -> bool:
+        return bool(frame_info.is_keyframe)
+
+
+class EveryNthFrame(DecodeSelection):
+    """Select one frame out of every `n`."""
+
+    def __init__(self, n: int) -> None:
+        assert n > 0, "n must be positive"
+        self.n = n
+        self.count = 0
+
+    def wants(self, frame_info: tutk.FrameInfoStruct) -> bool:
+        wanted = self.count % self.n == 0
+        self.count += 1
+        return wanted
+
+
+class FrameInterval(DecodeSelection):
+    """Select at most one frame every `interval_ms` milliseconds of stream time."""
+
+    def __init__(self, interval_ms: int) -> None:
+        self.interval = interval_ms / 1000
+        self.last_selected: Optional[float] = None
+
+    def wants(self, frame_info: tutk.FrameInfoStruct) -> bool:
+        timestamp = frame_info.timestamp_seconds
+        if (
+            self.last_selected is not None
+            and 0 <= timestamp - self.last_selected < self.interval
+        ):
+            return False
+        self.last_selected = timestamp
+        return True
+
+
+class FrameDecoder:
+    """
+    Decodes the frames of one stream, as received by
+    [P2PSession.recv_video_data][wyzecam.iotc.P2PSession.recv_video_data].
+
+    The camera sends whole access units, so each received frame is handed to the
+    decoder as one packet, with no bitstream parser in between.  Packets carry the
+    frame's timestamp as their `pts` (in [TIME_BASE][wyzecam.decoder.TIME_BASE]
+    units) and its keyframe flag, so decoded frames have correct timestamps, and
+    each is returned with the `frame_info` it was received with, even when frame
+    threading delays the decoder's output.
+
+    The decoder is created from the first keyframe; frames received before it
+    cannot be decoded and are skipped.
+
+    With a [DecodeSelection][wyzecam.decoder.DecodeSelection], only the frames it
+    selects are produced, and the decoder only does the work needed to produce
+    them: frames are held back (undecoded) until a selected frame arrives, then
+    the frames it depends on are decoded with the decoder's `skip_frame` set to
+    skip non-reference frames, and their output is discarded.  Held-back frames
+    are dropped at every keyframe, so a selection coarser than the keyframe
+    interval decodes little more than the keyframes themselves.  With a
+    [KeyframesOnly][wyzecam.decoder.KeyframesOnly] selection, non-keyframes are
+    never handed to the decoder at all.
+    """
+
+    def __init__(
+        self,
+        selection: Optional[DecodeSelection] = None,
+        thread_type: Optional[str] = None,
+        thread_count: int = 0,
+    ) -> None:
+        if selection is not None and thread_type in ("FRAME", "AUTO"):
+            # frame threading delays output, which would mix up the frames
+            # decoded to catch up with the frames actually selected
+            thread_type = "SLICE"
+        self.selection = selection
+        self.thread_type = thread_type
+        self.thread_count = thread_count
+        self.codec: Optional["av.CodecContext"] = None
+        self._held_back: List[Tuple[bytes, tutk.FrameInfoStruct]] = []
+        self._in_flight: Dict[int, tutk.FrameInfoStruct] = {}
+
+    def decode(
+        self, frame_data: FrameData, frame_info: tutk.FrameInfoStruct
+    ) -> List[Tuple["av.VideoFrame", tutk.FrameInfoStruct]]:
+        """Decode one received frame.
+
+        :returns: the decoded frames now available, possibly none, each with the
+                  `frame_info` it was received with.
+        """
+        if self.codec is None:
+            if not frame_info.is_keyframe:
+                return []
+            self.codec = create_codec(
+                frame_info, self.thread_type, self.thread_count
+            )
+            if self.selection is not None and self.selection.keyframes_only:
+                self.codec.skip_frame = "NONKEY"
+        codec = self.codec
+
+        if self.selection is not None:
+            if frame_info.is_keyframe:
+                self._held_back = []
+            if not self.selection.wants(frame_info):
+                if not self.selection.keyframes_only:
+                    self._held_back.append((bytes(frame_data), frame_info))
+                return []
+
+            if self._held_back:
+                codec.skip_frame = "NONREF"
+                for held_back in self._held_back:
+                    codec.decode(make_packet(*held_back))
+                codec.skip_frame = "DEFAULT"
+                self._held_back = []
+
+        packet = make_packet(frame_data, frame_info)
+        self._in_flight[packet.pts] = frame_info
+        if len(self._in_flight) > _MAX_IN_FLIGHT:
+            # the decoder dropped a frame without output; forget the oldest
+            del self._in_flight[next(iter(self._in_flight))]
+        return [
+            (frame, self._in_flight.pop(frame.pts, frame_info))
+            for frame in codec.decode(packet)
+        ]
+
+
+def make_packet(
+    frame_data: FrameData, frame_info: tutk.FrameInfoStruct
+) -> "av.Packet":
+    """Wrap one received frame in a decoder packet, without parsing it.
+
+    :param frame_data: the frame data, which is copied into the packet.
+    :param frame_info: the frame's metadata, which provides the packet's `pts` and
+                       keyframe flag.
+    """
+    # copy into a buffer owned by FFmpeg: a packet wrapping a Python object can
+    # deadlock a frame-threaded decoder that releases it while being closed
+    packet = av.Packet(len(frame_data))
+    packet.update(frame_data)
+    packet.pts = packet.dts = pts_from_frameinfo(frame_info)
+    packet.time_base = TIME_BASE
+    packet.is_keyframe = bool(frame_info.is_keyframe)
+    return packet
+
+
+def pts_from_frameinfo(frame_info: tutk.FrameInfoStruct) -> int:
+    """The timestamp of a frame, in [TIME_BASE][wyzecam.decoder.TIME_BASE] units."""
+    return frame_info.timestamp * 1_000_000 + frame_info.timestamp_ms
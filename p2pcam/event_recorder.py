@@ -0,0 +1,243 @@
+from typing import TYPE_CHECKING, Callable, Deque, List, Optional
+
+import logging
+import os
+import threading
+from collections import deque
+
+from .decoder import pts_from_frameinfo
+from .frame_ring import Frame
+from .recorder import (
+    CONTAINER_FORMATS,
+    Segment,
+    SegmentWriter,
+    segment_filename,
+    unused_path,
+)
+from .tutk import tutk
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+
+class PacketBuffer:
+    """
+    Holds the last `seconds` of a stream as encoded frames, always starting with
+    a keyframe, so that it can be written out or decoded on its own.
+
+    Frames are dropped a whole GOP at a time, once the keyframe after it is old
+    enough to cover `seconds` by itself; the buffer therefore holds between
+    `seconds` and `seconds` plus one keyframe interval of video.  Its memory cost
+    is that much video at the stream's bitrate.
+
+    :var seconds: the length of stream time to keep.
+    :var byte_size: the size of the frame data currently held, in bytes.
+    """
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.byte_size = 0
+        self._frames: Deque[Frame] = deque()
+        self._keyframe_pts: Deque[int] = deque()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def add(self, frame_data: bytes, frame_info: tutk.FrameInfoStruct) -> None:
+        if not self._frames and not frame_info.is_keyframe:
+            return
+        pts = pts_from_frameinfo(frame_info)
+        self._frames.append((frame_data, frame_info))
+        self.byte_size += len(frame_data)
+        if frame_info.is_keyframe:
+            self._keyframe_pts.append(pts)
+        horizon = pts - self.seconds * 1_000_000
+        while len(self._keyframe_pts) > 1 and self._keyframe_pts[1] <= horizon:
+            self._drop_gop()
+
+    def _drop_gop(self) -> None:
+        self._keyframe_pts.popleft()
+        while True:
+            frame_data, _ = self._frames.popleft()
+            self.byte_size -= len(frame_data)
+            if self._frames[0][1].is_keyframe:
+                return
+
+    def frames(self) -> List[Frame]:
+        """A snapshot of the buffered frames, starting with a keyframe."""
+        return list(self._frames)
+
+    def clear(self) -> None:
+        self._frames.clear()
+        self._keyframe_pts.clear()
+        self.byte_size = 0
+
+
+class EventRecorder:
+    """
+    Records short clips of the video stream of a [P2PSession][wyzecam.iotc.P2PSession]
+    around events, such as detected motion, including the seconds before the
+    event was detected.
+
+    The recorder keeps the last `pre_roll` seconds of encoded frames in a
+    [PacketBuffer][wyzecam.event_recorder.PacketBuffer], which costs only as much
+    memory as that much video at the camera's bitrate.  When `trigger()` is
+    called, a clip is started with the buffered frames, and continues until
+    `post_roll` seconds of stream time after the last trigger.  Frames are
+    remuxed without decoding, as by [SegmentRecorder][wyzecam.recorder.SegmentRecorder].
+
+    ```python
+    with StreamHub(sess) as hub, EventRecorder(sess, "/events") as events:
+        raw, decoded = hub.subscribe(), hub.subscribe(decoded=True)
+        threading.Thread(target=lambda: [events.write(*f) for f in raw]).start()
+        detector = MotionDetector()
+        for frame, frame_info in decoded:
+            motion = detector.detect(frame_to_ndarray(frame, "y"))
+            if motion is not None and motion[1].any():
+                events.trigger()
+    ```
+
+    `start()` makes the recorder receive frames from the session itself, instead
+    of having them fed with `write`.
+
+    :var clips: the finished clips, as [Segment][wyzecam.recorder.Segment]s.
+    """
+
+    def __init__(
+        self,
+        session: "P2PSession",
+        directory: str,
+        pre_roll: float = 5.0,
+        post_roll: float = 10.0,
+        container: str = "mp4",
+        filename: str = "{mac}-event-{start:%Y%m%d-%H%M%S}.{ext}",
+        on_clip: Optional[Callable[[Segment], None]] = None,
+    ) -> None:
+        """Construct an event recorder.
+
+        :param session: the session to record.
+        :param directory: the directory to write clips to; created if missing.
+        :param pre_roll: the seconds of video to include before each trigger.
+        :param post_roll: the seconds of video to include after the last trigger.
+        :param container: "mp4" or "mkv".
+        :param filename: the name of each clip file; see
+                         [SegmentRecorder][wyzecam.recorder.SegmentRecorder].
+        :param on_clip: if specified, called with each finished clip.
+        """
+        assert (
+            container in CONTAINER_FORMATS
+        ), f"container must be one of {list(CONTAINER_FORMATS)}"
+        self.session = session
+        self.directory = directory
+        self.post_roll = post_roll
+        self.container = container
+        self.filename = filename
+        self.on_clip = on_clip
+        self.buffer = PacketBuffer(pre_roll)
+        self.clips: List[Segment] = []
+        self._writer: Optional[SegmentWriter] = None
+        self._triggered = False
+        self._end_pts = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> None:
+        assert self._thread is None, "EventRecorder already started!"
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._record, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop recording, and finish the current clip, if any."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.close()
+
+    def __enter__(self) -> "EventRecorder":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _record(self) -> None:
+        try:
+            for frame_data, frame_info in self.session.recv_video_data(
+                copy=True, stop=self._stopping
+            ):
+                self.write(frame_data, frame_info)  # type: ignore
+        except Exception as e:
+            _Logger.warning(f"EventRecorder stopped: {e!r}")
+
+    @property
+    def recording(self) -> bool:
+        """True while a clip is being written, or is about to be."""
+        return self._triggered or self._writer is not None
+
+    def trigger(self) -> None:
+        """Record a clip from `pre_roll` seconds before now, until `post_roll`
+        seconds after now; if a clip is already being recorded, extend it."""
+        with self._lock:
+            self._triggered = True
+
+    def write(
+        self, frame_data: bytes, frame_info: tutk.FrameInfoStruct
+    ) -> None:
+        """Add one received frame; `frame_data` must not be reused by the caller."""
+        with self._lock:
+            self.buffer.add(frame_data, frame_info)
+            pts = pts_from_frameinfo(frame_info)
+            if self._triggered:
+                self._triggered = False
+                end_pts = pts + int(self.post_roll * 1_000_000)
+                if self._writer is None:
+                    self._end_pts = end_pts
+                    # writes the buffered frames, including this one
+                    self._open()
+                    return
+                self._end_pts = max(self._end_pts, end_pts)
+            if self._writer is not None:
+                self._writer.write(frame_data, frame_info)
+                if pts >= self._end_pts:
+                    self._finish()
+
+    def close(self) -> None:
+        """Finish the current clip, if any."""
+        with self._lock:
+            self._triggered = False
+            self._finish()
+
+    def _open(self) -> None:
+        frames = self.buffer.frames()
+        if not frames:
+            # no keyframe yet; try again with the next frame
+            self._triggered = True
+            return
+        keyframe, keyframe_info = frames[0]
+        name = segment_filename(
+            self.filename, self.session, keyframe_info, self.container
+        )
+        self._writer = SegmentWriter(
+            unused_path(os.path.join(self.directory, name)),
+            self.container,
+            keyframe,
+            keyframe_info,
+        )
+        for frame_data, frame_info in frames:
+            self._writer.write(frame_data, frame_info)
+
+    def _finish(self) -> None:
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        clip = writer.finish()
+        self.clips.append(clip)
+        _Logger.info(f"Recorded event clip {clip}")
+        if self.on_clip is not None:
+            self.on_clip(clip)
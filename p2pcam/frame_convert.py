@@ -0,0 +1,94 @@
+from typing import Any, Optional
+
+try:
+    import av
+    import av.video.frame
+except ImportError:
+    av = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+OUTPUT_FORMATS = ("bgr24", "rgb24", "gray", "y", "yuv420p")
+"""The `output_format`s understood by [frame_to_ndarray][wyzecam.frame_convert.frame_to_ndarray]"""
+
+_PLANAR_YUV_FORMATS = ("yuv420p", "yuvj420p")
+
+
+def frame_to_ndarray(
+    frame: "av.VideoFrame",
+    output_format: str = "bgr24",
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    interpolation: Optional[str] = None,
+) -> Any:
+    """Convert a decoded frame to numpy, scaling and converting it in a single
+    swscale pass.
+
+    - "bgr24" and "rgb24" produce a `(height, width, 3)` array.
+    - "gray" produces a `(height, width)` array, converted by swscale.
+    - "y" produces the luma plane of the frame as a `(height, width)` array, in
+      the range of the frame's YUV format whether scaled or not (16-235 for
+      "yuv420p").  If the frame is planar YUV and no scaling is asked for, this
+      is a read-only view of the decoded frame, with no conversion or copy at
+      all.
+    - "yuv420p" produces a `(y, u, v)` tuple of plane arrays; like "y", these are
+      read-only views of the decoded frame where possible.
+
+    Views keep the decoded frame alive for as long as they are referenced; copy
+    them if they are to be kept for long.
+
+    :param frame: the decoded frame.
+    :param output_format: one of [OUTPUT_FORMATS][wyzecam.frame_convert.OUTPUT_FORMATS].
+    :param width: if specified, the width to scale the frame to.
+    :param height: if specified, the height to scale the frame to.
+    :param interpolation: if specified, the swscale interpolation used for scaling,
+                          e.g. "BILINEAR", "AREA" or "BICUBIC".
+    """
+    assert (
+        output_format in OUTPUT_FORMATS
+    ), f"output_format must be one of {OUTPUT_FORMATS}"
+    scaled = (width is not None and width != frame.width) or (
+        height is not None and height != frame.height
+    )
+
+    if output_format in ("y", "yuv420p"):
+        if scaled or frame.format.name not in _PLANAR_YUV_FORMATS:
+            # never "gray" for "y": its full range luma would differ from the
+            # unscaled plane's
+            frame = frame.reformat(
+                width,
+                height,
+                (
+                    frame.format.name
+                    if frame.format.name in _PLANAR_YUV_FORMATS
+                    else "yuv420p"
+                ),
+                interpolation=interpolation,
+            )
+        if output_format == "y":
+            return plane_view(frame.planes[0])
+        return tuple(plane_view(plane) for plane in frame.planes)
+
+    return frame.to_ndarray(
+        width=width,
+        height=height,
+        format=output_format,
+        interpolation=interpolation,
+    )
+
+
+def plane_view(plane: "av.video.plane.VideoPlane") -> "np.ndarray":
+    """A read-only `(height, width)` numpy view of an 8-bit plane of a frame.
+
+    The view skips the padding at the end of each line, so it is not contiguous
+    unless the plane has none.
+    """
+    lines = np.frombuffer(
+        plane, np.uint8, count=plane.line_size * plane.height
+    ).reshape(plane.height, plane.line_size)
+    view = lines[:, : plane.width]
+    view.flags.writeable = False
+    return view
@@ -0,0 +1,222 @@
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterator, Optional, Tuple
+
+import enum
+import logging
+import threading
+from collections import deque
+from queue import Empty
+
+from .tutk import tutk
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+Frame = Tuple[Any, tutk.FrameInfoStruct]
+
+
+class OverflowPolicy(enum.Enum):
+    """What a [FrameRing][wyzecam.frame_ring.FrameRing] does with a new frame when it is full"""
+
+    DROP_OLDEST = "drop_oldest"
+    """Discard the oldest frame in the ring to make room"""
+
+    DROP_NON_KEYFRAMES = "drop_non_keyframes"
+    """Discard the oldest non-keyframe in the ring, or the oldest frame if all are keyframes.
+
+    This breaks the reference chain of the GOP the frame belonged to, so it is only
+    for consumers that do not decode, such as a recorder of keyframes; use
+    `DROP_GOP` to feed a decoder."""
+
+    DROP_GOP = "drop_gop"
+    """Discard the oldest frame and every frame after it up to the next keyframe, so
+    a decoding consumer only ever misses whole GOPs.  If no keyframe is left in the
+    ring, new frames are discarded too until the next keyframe arrives."""
+
+    BLOCK = "block"
+    """Block the producer until the consumer makes room"""
+
+
+class FrameRing:
+    """
+    A bounded, thread-safe ring of received video frames; the point of
+    backpressure between a [FrameReceiver][wyzecam.frame_ring.FrameReceiver]
+    and whatever consumes its frames.
+
+    :var capacity: the maximum number of frames held.
+    :var policy: the [OverflowPolicy][wyzecam.frame_ring.OverflowPolicy] applied when full.
+    :var received: the number of frames put into the ring.
+    :var dropped: the number of frames discarded, keyed by the policy that discarded them.
+    :var blocked: the number of frames whose producer had to wait for room (`BLOCK` policy).
+    """
+
+    def __init__(
+        self,
+        capacity: int = 60,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> None:
+        assert capacity > 0, "capacity must be positive"
+        self.capacity = capacity
+        self.policy = policy
+        self.frames: Deque[Frame] = deque()
+        self.received = 0
+        self.dropped: Dict[OverflowPolicy, int] = {
+            OverflowPolicy.DROP_OLDEST: 0,
+            OverflowPolicy.DROP_NON_KEYFRAMES: 0,
+            OverflowPolicy.DROP_GOP: 0,
+        }
+        self.blocked = 0
+        self.error: Optional[BaseException] = None
+        self.closed = False
+        self._awaiting_keyframe = False
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def put(self, frame_data: Any, frame_info: tutk.FrameInfoStruct) -> bool:
+        """Add a frame to the ring, applying the overflow policy if it is full.
+
+        :returns: False if the ring was closed before the frame could be added.
+        """
+        with self._cond:
+            if self._awaiting_keyframe and not self.closed:
+                if not frame_info.is_keyframe:
+                    self.dropped[OverflowPolicy.DROP_GOP] += 1
+                    return True
+                self._awaiting_keyframe = False
+            if len(self.frames) >= self.capacity and not self.closed:
+                if self.policy == OverflowPolicy.BLOCK:
+                    self.blocked += 1
+                    self._cond.wait_for(
+                        lambda: len(self.frames) < self.capacity or self.closed
+                    )
+                elif self.policy == OverflowPolicy.DROP_NON_KEYFRAMES:
+                    self._drop_non_keyframe()
+                elif self.policy == OverflowPolicy.DROP_GOP:
+                    self._drop_gop(frame_info)
+                    if self._awaiting_keyframe:
+                        return True
+                else:
+                    self.frames.popleft()
+                    self.dropped[OverflowPolicy.DROP_OLDEST] += 1
+            if self.closed:
+                return False
+            self.frames.append((frame_data, frame_info))
+            self.received += 1
+            self._cond.notify_all()
+            return True
+
+    def _drop_non_keyframe(self) -> None:
+        for i, (_, frame_info) in enumerate(self.frames):
+            if not frame_info.is_keyframe:
+                del self.frames[i]
+                self.dropped[OverflowPolicy.DROP_NON_KEYFRAMES] += 1
+                return
+        self.frames.popleft()
+        self.dropped[OverflowPolicy.DROP_OLDEST] += 1
+
+    def _drop_gop(self, frame_info: tutk.FrameInfoStruct) -> None:
+        self.frames.popleft()
+        dropped = 1
+        while self.frames and not self.frames[0][1].is_keyframe:
+            self.frames.popleft()
+            dropped += 1
+        # with the whole GOP gone, the new frame's references are gone too
+        self._awaiting_keyframe = not self.frames and not frame_info.is_keyframe
+        if self._awaiting_keyframe:
+            dropped += 1
+        self.dropped[OverflowPolicy.DROP_GOP] += dropped
+
+    def get(
+        self, block: bool = True, timeout: Optional[float] = None
+    ) -> Optional[Frame]:
+        """Remove and return the oldest frame in the ring.
+
+        :param block: wait for a frame if the ring is empty.
+        :param timeout: the maximum number of seconds to wait, after which
+                        queue.Empty is raised.
+        :returns: the oldest frame, or None once the ring is closed and drained.
+                  If the ring was closed because of an error, that error is raised
+                  instead.
+        """
+        with self._cond:
+            if block:
+                ready = self._cond.wait_for(
+                    lambda: self.frames or self.closed, timeout
+                )
+                if not ready:
+                    raise Empty()
+            if self.frames:
+                frame = self.frames.popleft()
+                self._cond.notify_all()
+                return frame
+            if self.closed:
+                if self.error is not None:
+                    raise self.error
+                return None
+            raise Empty()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Close the ring, waking any blocked producer or consumer."""
+        with self._cond:
+            self.closed = True
+            if error is not None:
+                self.error = error
+            self._cond.notify_all()
+
+    def __iter__(self) -> Iterator[Frame]:
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+
+class FrameReceiver(threading.Thread):
+    """
+    A thread draining the video channel of a
+    [P2PSession][wyzecam.iotc.P2PSession] into a [FrameRing][wyzecam.frame_ring.FrameRing],
+    so that receiving frames never waits on a slow consumer.
+
+    Frames are copied out of the session's pooled receive buffers into `bytes`
+    sized to the frame, since they outlive the buffer they were received into.
+    If the session keeps a `gop_cache`, it is filled from this thread.
+
+    See: [wyzecam.iotc.P2PSession.start_receiver][]
+    """
+
+    def __init__(self, session: "P2PSession", ring: FrameRing) -> None:
+        super().__init__(daemon=True)
+        self.session = session
+        self.ring = ring
+        self.stopping = threading.Event()
+
+    def run(self) -> None:
+        _Logger.info(f"Receiving on channel id {self.session.av_chan_id}")
+        gop_cache = self.session.gop_cache
+        try:
+            for buffer in self.session.recv_video_buffers(stop=self.stopping):
+                with buffer:
+                    frame_data = buffer.tobytes()
+                    frame_info = tutk.FrameInfoStruct.from_buffer_copy(
+                        buffer.frame_info
+                    )
+                if gop_cache is not None:
+                    gop_cache.add(frame_data, frame_info)
+                if not self.ring.put(frame_data, frame_info):
+                    break
+        except Exception as e:
+            _Logger.warning(f"Receiver stopped: {e!r}")
+            self.ring.close(e)
+            return
+        _Logger.info(
+            f"No longer receiving on channel id {self.session.av_chan_id}"
+        )
+        self.ring.close()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        self.ring.close()
+        self.join()
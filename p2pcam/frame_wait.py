@@ -0,0 +1,113 @@
+from typing import Optional
+
+import abc
+import time
+
+from .tutk import tutk
+
+DEFAULT_FRAMERATE = 20
+"""
+The framerate assumed by `AdaptiveFrameWait` until the camera reports one.
+"""
+
+
+class FrameWaitStrategy(abc.ABC):
+    """
+    Decides how long [P2PSession.recv_video_buffers][wyzecam.iotc.P2PSession.recv_video_buffers]
+    waits before polling `avRecvFrameData2` again after it reports
+    `AV_ER_DATA_NOREADY`.
+
+    The TUTK library has no blocking or timed variant of `avRecvFrameData2`, so
+    receiving video is always a poll; a strategy trades off the latency added to
+    frames that arrive between polls against the number of wakeups spent on an
+    idle channel.  A strategy holds per-stream state, so each stream needs its
+    own instance.
+    """
+
+    def on_frame(self, frame_info: tutk.FrameInfoStruct) -> None:
+        """Called every time a frame is received."""
+
+    @abc.abstractmethod
+    def next_delay(self) -> float:
+        """The number of seconds to sleep after a poll that found no frame."""
+
+
+class FixedIntervalWait(FrameWaitStrategy):
+    """
+    Sleep a fixed interval between polls.  With the default interval of 1/40th
+    of a second this is the historical behavior of `recv_video_data`: up to
+    25 ms of added latency per frame, and 40 wakeups per second when idle.
+
+    :var interval: the number of seconds to sleep between polls.
+    """
+
+    def __init__(self, interval: float = 1.0 / 40) -> None:
+        self.interval = interval
+
+    def next_delay(self) -> float:
+        return self.interval
+
+
+class AdaptiveFrameWait(FrameWaitStrategy):
+    """
+    Sleep according to when the next frame is expected, given the framerate
+    reported in the last [FrameInfoStruct][wyzecam.tutk.tutk.FrameInfoStruct].
+
+    After a frame arrives, the first sleep lasts half a frame interval; from then
+    on the channel is polled every `min_delay` seconds, doubling the delay on
+    every empty poll up to `active_max_delay` (or an eighth of the frame
+    interval, if smaller).  Once the stream has been quiet for `idle_frames` frame intervals,
+    the delay keeps doubling up to `max_delay`, so idle cameras wake up rarely.
+
+    :var min_delay: the shortest sleep between polls, in seconds.
+    :var active_max_delay: the longest sleep between polls while frames are
+                           arriving, in seconds.
+    :var max_delay: the longest sleep between polls of an idle stream, in seconds.
+    :var idle_frames: the number of missed frame intervals after which the stream
+                      is considered idle.
+    """
+
+    def __init__(
+        self,
+        min_delay: float = 0.001,
+        active_max_delay: float = 0.004,
+        max_delay: float = 0.1,
+        idle_frames: int = 4,
+    ) -> None:
+        self.min_delay = min_delay
+        self.active_max_delay = active_max_delay
+        self.max_delay = max_delay
+        self.idle_frames = idle_frames
+        self.frame_interval = 1.0 / DEFAULT_FRAMERATE
+        self.last_frame_at: Optional[float] = None
+        self.delay = min_delay
+
+    def on_frame(self, frame_info: tutk.FrameInfoStruct) -> None:
+        if frame_info.framerate > 0:
+            self.frame_interval = 1.0 / frame_info.framerate
+        self.last_frame_at = time.monotonic()
+        self.delay = 0.0
+
+    def next_delay(self) -> float:
+        if self.last_frame_at is None:
+            self.delay = self._backoff(self.max_delay)
+            return self.delay
+
+        since_last = time.monotonic() - self.last_frame_at
+        if self.delay == 0.0:
+            # first poll after a frame: skip ahead towards the next one
+            until_next = self.frame_interval * 0.5 - since_last
+            if until_next > self.min_delay:
+                self.delay = self.min_delay
+                return until_next
+
+        if since_last > self.frame_interval * self.idle_frames:
+            self.delay = self._backoff(self.max_delay)
+        else:
+            self.delay = self._backoff(
+                min(self.active_max_delay, self.frame_interval / 8)
+            )
+        return self.delay
+
+    def _backoff(self, ceiling: float) -> float:
+        return max(self.min_delay, min(ceiling, self.delay * 2))
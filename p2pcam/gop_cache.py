@@ -0,0 +1,61 @@
+from typing import List
+
+import threading
+
+from .frame_ring import Frame
+from .tutk import tutk
+
+
+class GopCache:
+    """
+    Holds the most recent group of pictures (GOP) of a stream: the latest keyframe
+    and every frame received after it.
+
+    Replaying the cached GOP lets a consumer that joins a running stream decode
+    its first frame immediately, instead of waiting for the camera to send the
+    next keyframe.  If a GOP grows past `max_bytes`, its tail is truncated: the
+    keyframe and the frames that fit are kept, and the rest of the GOP is not
+    cached, so late joiners still start from a keyframe.  A keyframe larger than
+    `max_bytes` is not cached at all.
+
+    :var max_bytes: the most frame data, in bytes, held by the cache.
+    :var byte_size: the size of the frame data currently cached, in bytes.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.byte_size = 0
+        self._frames: List[Frame] = []
+        self._truncated = False
+        self._lock = threading.Lock()
+
+    def add(self, frame_data: bytes, frame_info: tutk.FrameInfoStruct) -> None:
+        with self._lock:
+            if frame_info.is_keyframe:
+                self._frames = []
+                self.byte_size = 0
+                self._truncated = False
+            elif not self._frames or self._truncated:
+                return
+            if self.byte_size + len(frame_data) > self.max_bytes:
+                # later frames reference this one, so none of them can follow
+                self._truncated = True
+                return
+            self._frames.append((frame_data, frame_info))
+            self.byte_size += len(frame_data)
+
+    def frames(self) -> List[Frame]:
+        """A snapshot of the cached GOP, starting with its keyframe."""
+        with self._lock:
+            return list(self._frames)
+
+    @property
+    def gop_length(self) -> int:
+        """The number of frames currently cached."""
+        return len(self._frames)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames = []
+            self.byte_size = 0
+            self._truncated = False
@@ -0,0 +1,506 @@
+from typing import TYPE_CHECKING, Callable, Deque, Dict, List, Optional, Tuple
+
+import datetime
+import logging
+import math
+import struct
+import threading
+from collections import deque
+
+from .decoder import FrameData, codec_name, make_packet, pts_from_frameinfo
+from .recorder import add_stream_from_keyframe
+from .tutk import tutk
+
+try:
+    import av
+except ImportError:
+    av = None
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+_SAMPLE_IS_NON_SYNC = 0x10000
+
+
+class HlsPart:
+    """
+    One LL-HLS partial segment: a single fMP4 fragment (`moof` + `mdat`).
+
+    :var index: the index of the part within its segment.
+    :var duration: the duration of the part, in seconds.
+    :var independent: True if the part starts with a keyframe.
+    :var data: the fMP4 fragment.
+    """
+
+    def __init__(
+        self, index: int, duration: float, independent: bool, data: bytes
+    ) -> None:
+        self.index = index
+        self.duration = duration
+        self.independent = independent
+        self.data = data
+
+
+class HlsSegment:
+    """
+    One HLS media segment, made up of [HlsPart][wyzecam.hls.HlsPart]s; every
+    segment starts with a keyframe.
+
+    :var msn: the media sequence number of the segment.
+    :var init_id: the number of the initialization section the segment needs.
+    :var start: the timestamp of the first frame of the segment, in seconds.
+    :var parts: the parts of the segment so far.
+    :var complete: True once the segment has all of its parts.
+    """
+
+    def __init__(self, msn: int, init_id: int, start: float) -> None:
+        self.msn = msn
+        self.init_id = init_id
+        self.start = start
+        self.parts: List[HlsPart] = []
+        self.complete = False
+
+    @property
+    def duration(self) -> float:
+        return sum(part.duration for part in self.parts)
+
+    @property
+    def size(self) -> int:
+        return sum(len(part.data) for part in self.parts)
+
+    @property
+    def data(self) -> bytes:
+        return b"".join(part.data for part in self.parts)
+
+
+class HlsPackager:
+    """
+    Packages the video stream of a [P2PSession][wyzecam.iotc.P2PSession] as
+    fMP4 HLS, with LL-HLS partial segments, without decoding or transcoding it.
+
+    Frames are remuxed by FFmpeg's fragmenting MP4 muxer, which starts a new
+    fragment at every keyframe, and otherwise every `part_duration` seconds.
+    Each fragment is an LL-HLS part; parts are grouped into segments of at least
+    `segment_duration` seconds, each starting with a keyframe, so segments are
+    only as short as the camera's keyframe interval allows.
+
+    Segments are kept in memory.  The playlist lists the last `playlist_length`
+    segments; older segments stay available for clients still fetching them
+    until there are more than `max_segments` or `max_bytes` in total.
+
+    The packager only produces the playlist and the segments; serve them with
+    [HlsServer][wyzecam.hls_server.HlsServer].
+
+    :var init_sections: the fMP4 initialization sections (`ftyp` + `moov`), by
+                        number; a new one is started whenever the codec or frame
+                        size of the stream changes.
+    :var segments: the cached segments, oldest first; the last may be still
+                   incomplete.
+    """
+
+    def __init__(
+        self,
+        session: "P2PSession",
+        segment_duration: float = 2.0,
+        part_duration: float = 0.5,
+        playlist_length: int = 6,
+        max_segments: int = 10,
+        max_bytes: int = 32 * 1024 * 1024,
+    ) -> None:
+        """Construct a packager; call `start()`, or feed it frames with `write`.
+
+        :param session: the session to package.
+        :param segment_duration: the target duration of each segment, in
+                                 seconds.
+        :param part_duration: the target duration of each part, in seconds.
+        :param playlist_length: the number of complete segments in the playlist.
+        :param max_segments: the number of segments kept in memory.
+        :param max_bytes: the most segment data kept in memory, in bytes.
+        """
+        if av is None:
+            raise RuntimeError(
+                "HlsPackager requires PyAv to package video. "
+                "Install with `pip install av` and try again."
+            )
+        assert part_duration <= segment_duration, "parts must fit in segments"
+        assert max_segments > playlist_length, "segments must outlive playlists"
+        self.session = session
+        self.segment_duration = segment_duration
+        self.part_duration = part_duration
+        self.playlist_length = playlist_length
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+        self.init_sections: Dict[int, bytes] = {}
+        self.segments: Deque[HlsSegment] = deque()
+        self.listeners: List[Callable[[], None]] = []
+        self._output: Optional["av.container.OutputContainer"] = None
+        self._stream: Optional["av.video.stream.VideoStream"] = None
+        self._sink: Optional[_FragmentSink] = None
+        self._first_info: Optional[tutk.FrameInfoStruct] = None
+        self._pending_starts: Deque[float] = deque()
+        self._init_id = 0
+        self._init_buffer = b""
+        self._moof = b""
+        self._timescale = 0
+        self._start_pts = 0
+        self._last_pts = -1
+        self._next_msn = 0
+        self._max_segment_duration = segment_duration
+        self._max_part_duration = part_duration
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        assert self._thread is None, "HlsPackager already started!"
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._package, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.close()
+
+    def __enter__(self) -> "HlsPackager":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _package(self) -> None:
+        try:
+            for frame_data, frame_info in self.session.recv_video_data(
+                stop=self._stopping
+            ):
+                self.write(frame_data, frame_info)
+        except Exception as e:
+            _Logger.warning(f"HlsPackager stopped: {e!r}")
+
+    def write(
+        self, frame_data: FrameData, frame_info: tutk.FrameInfoStruct
+    ) -> None:
+        """Add one received frame to the stream."""
+        with self._lock:
+            first = self._first_info
+            if (
+                first is not None
+                and frame_info.is_keyframe
+                and (
+                    frame_info.codec_id != first.codec_id
+                    or frame_info.frame_size != first.frame_size
+                )
+            ):
+                self._close_output()
+            if self._output is None:
+                if not frame_info.is_keyframe:
+                    return
+                self._open_output(frame_data, frame_info)
+
+            packet = make_packet(frame_data, frame_info)
+            pts = packet.pts - self._start_pts
+            if pts <= self._last_pts:
+                pts = self._last_pts + 1
+            packet.pts = packet.dts = pts
+            packet.stream = self._stream
+            self._output.mux(packet)  # type: ignore
+            self._last_pts = pts
+            self._first_info = self._first_info or frame_info
+            self._pending_starts.append(frame_info.timestamp_seconds)
+            updated = self._collect_fragments()
+        if updated:
+            self._notify()
+
+    def close(self) -> None:
+        """Flush the last part, and complete the last segment."""
+        with self._lock:
+            self._close_output()
+        self._notify()
+
+    def _open_output(
+        self, keyframe: FrameData, frame_info: tutk.FrameInfoStruct
+    ) -> None:
+        self._sink = _FragmentSink()
+        self._output = av.open(
+            self._sink,
+            "w",
+            format="mp4",
+            options={
+                "movflags": "frag_keyframe+empty_moov+default_base_moof",
+                "frag_duration": str(int(self.part_duration * 1_000_000)),
+                "flush_packets": "1",
+            },
+        )
+        self._stream = add_stream_from_keyframe(
+            self._output, codec_name(frame_info), keyframe
+        )
+        self._first_info = frame_info
+        self._start_pts = pts_from_frameinfo(frame_info)
+        self._last_pts = -1
+        self._init_id = max(self.init_sections, default=-1) + 1
+        self._timescale = 0
+        self._pending_starts.clear()
+
+    def _close_output(self) -> None:
+        output, self._output = self._output, None
+        if output is None:
+            return
+        output.close()
+        self._collect_fragments()
+        if self.segments and not self.segments[-1].complete:
+            self.segments[-1].complete = True
+        self._first_info = None
+
+    def _collect_fragments(self) -> bool:
+        assert self._sink is not None
+        updated = False
+        for box_type, data in self._sink.take_boxes():
+            if box_type == b"ftyp":
+                self._init_buffer = data
+            elif box_type == b"moov":
+                self._timescale = _mdhd_timescale(data)
+                self.init_sections[self._init_id] = self._init_buffer + data
+            elif box_type == b"moof":
+                self._moof = data
+            elif box_type == b"mdat":
+                self._add_part(self._moof, data)
+                updated = True
+        return updated
+
+    def _add_part(self, moof: bytes, mdat: bytes) -> None:
+        sample_count, ticks, independent = _moof_samples(moof)
+        duration = ticks / self._timescale if self._timescale else 0.0
+        start = self._pending_starts[0] if self._pending_starts else 0.0
+        for _ in range(min(sample_count, len(self._pending_starts))):
+            self._pending_starts.popleft()
+
+        segment = self.segments[-1] if self.segments else None
+        if (
+            segment is None
+            or segment.complete
+            or segment.init_id != self._init_id
+            or (independent and segment.duration >= self.segment_duration)
+        ):
+            if segment is not None:
+                segment.complete = True
+                self._max_segment_duration = max(
+                    self._max_segment_duration, segment.duration
+                )
+            segment = HlsSegment(self._next_msn, self._init_id, start)
+            self._next_msn += 1
+            self.segments.append(segment)
+            self._evict()
+        segment.parts.append(
+            HlsPart(len(segment.parts), duration, independent, moof + mdat)
+        )
+        self._max_part_duration = max(self._max_part_duration, duration)
+
+    def _evict(self) -> None:
+        while len(self.segments) > self.max_segments or (
+            len(self.segments) > self.playlist_length + 1
+            and sum(s.size for s in self.segments) > self.max_bytes
+        ):
+            self.segments.popleft()
+        init_ids = {segment.init_id for segment in self.segments}
+        for init_id in list(self.init_sections):
+            if init_id not in init_ids and init_id != self._init_id:
+                del self.init_sections[init_id]
+
+    def _notify(self) -> None:
+        for listener in self.listeners:
+            listener()
+
+    def segment(self, msn: int) -> Optional[HlsSegment]:
+        """The cached segment `msn`, if any."""
+        with self._lock:
+            for segment in self.segments:
+                if segment.msn == msn:
+                    return segment
+        return None
+
+    def part(self, msn: int, index: int) -> Optional[HlsPart]:
+        """Part `index` of segment `msn`, if it is produced and still cached."""
+        segment = self.segment(msn)
+        if segment is None or index >= len(segment.parts):
+            return None
+        return segment.parts[index]
+
+    @property
+    def last_msn(self) -> int:
+        """The msn of the last complete segment, or -1 if there is none."""
+        with self._lock:
+            if not self.segments:
+                return -1
+            last = self.segments[-1]
+            return last.msn if last.complete else last.msn - 1
+
+    def has_part(self, msn: int, index: Optional[int] = None) -> bool:
+        """True if the playlist already includes part `index` of segment `msn`
+        (or, without `index`, all of segment `msn`)."""
+        with self._lock:
+            if not self.segments:
+                return False
+            last = self.segments[-1]
+        if msn < last.msn:
+            return True
+        if msn > last.msn:
+            return False
+        return last.complete or (index is not None and index < len(last.parts))
+
+    def playlist(self) -> str:
+        """The LL-HLS media playlist of the segments currently available."""
+        with self._lock:
+            segments = list(self.segments)
+            if segments and segments[-1].complete:
+                next_part: Optional[Tuple[int, int]] = (segments[-1].msn + 1, 0)
+            elif segments:
+                next_part = (segments[-1].msn, len(segments[-1].parts))
+            else:
+                next_part = None
+            complete = [s for s in segments if s.complete]
+            listed = complete[-self.playlist_length :] + [
+                s for s in segments if not s.complete
+            ]
+            target = math.ceil(self._max_segment_duration)
+            part_target = self._max_part_duration
+
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{target}",
+            f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,"
+            f"PART-HOLD-BACK={3 * part_target:.3f}",
+            f"#EXT-X-PART-INF:PART-TARGET={part_target:.3f}",
+        ]
+        if listed:
+            lines.append(f"#EXT-X-MEDIA-SEQUENCE:{listed[0].msn}")
+        # parts are only listed near the live edge
+        part_horizon = len(listed) - 3
+        init_id = None
+        for i, segment in enumerate(listed):
+            if segment.init_id != init_id:
+                if init_id is not None:
+                    lines.append("#EXT-X-DISCONTINUITY")
+                init_id = segment.init_id
+                lines.append(f'#EXT-X-MAP:URI="init{init_id}.mp4"')
+            lines.append(
+                "#EXT-X-PROGRAM-DATE-TIME:"
+                + datetime.datetime.fromtimestamp(
+                    segment.start, datetime.timezone.utc
+                ).isoformat(timespec="milliseconds")
+            )
+            if i >= part_horizon:
+                for part in segment.parts:
+                    independent = ",INDEPENDENT=YES" if part.independent else ""
+                    lines.append(
+                        f"#EXT-X-PART:DURATION={part.duration:.5f},"
+                        f'URI="part{segment.msn}.{part.index}.m4s"{independent}'
+                    )
+            if segment.complete:
+                lines.append(f"#EXTINF:{segment.duration:.5f},")
+                lines.append(f"segment{segment.msn}.m4s")
+        if next_part is not None:
+            msn, index = next_part
+            lines.append(
+                f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part{msn}.{index}.m4s"'
+            )
+        return "\n".join(lines) + "\n"
+
+
+class _FragmentSink:
+    """A file-like object collecting the top-level boxes the muxer writes."""
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        return len(data)
+
+    def take_boxes(self) -> List[Tuple[bytes, bytes]]:
+        boxes = []
+        offset = 0
+        while len(self.buffer) - offset >= 8:
+            size, box_type = struct.unpack_from(">I4s", self.buffer, offset)
+            if size == 1:
+                size = struct.unpack_from(">Q", self.buffer, offset + 8)[0]
+            if size < 8 or len(self.buffer) - offset < size:
+                break
+            boxes.append((box_type, bytes(self.buffer[offset : offset + size])))
+            offset += size
+        del self.buffer[:offset]
+        return boxes
+
+
+def _child_boxes(data: bytes, offset: int = 8) -> Dict[bytes, bytes]:
+    children = {}
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        if size < 8:
+            break
+        children[box_type] = data[offset : offset + size]
+        offset += size
+    return children
+
+
+def _mdhd_timescale(moov: bytes) -> int:
+    trak = _child_boxes(moov)[b"trak"]
+    mdhd = _child_boxes(_child_boxes(trak)[b"mdia"])[b"mdhd"]
+    version = mdhd[8]
+    return struct.unpack_from(">I", mdhd, 20 if version == 0 else 28)[0]
+
+
+def _moof_samples(moof: bytes) -> Tuple[int, int, bool]:
+    """The number of samples in a fragment, their total duration in timescale
+    units, and whether the first is a sync sample."""
+    traf = _child_boxes(_child_boxes(moof)[b"traf"])
+    tfhd = traf[b"tfhd"]
+    tfhd_flags = struct.unpack_from(">I", tfhd, 8)[0] & 0xFFFFFF
+    offset = 16
+    if tfhd_flags & 0x01:
+        offset += 8  # base data offset
+    if tfhd_flags & 0x02:
+        offset += 4  # sample description index
+    default_duration = default_flags = 0
+    if tfhd_flags & 0x08:
+        default_duration = struct.unpack_from(">I", tfhd, offset)[0]
+        offset += 4
+    if tfhd_flags & 0x10:
+        offset += 4  # default sample size
+    if tfhd_flags & 0x20:
+        default_flags = struct.unpack_from(">I", tfhd, offset)[0]
+
+    trun = traf[b"trun"]
+    flags = struct.unpack_from(">I", trun, 8)[0] & 0xFFFFFF
+    sample_count = struct.unpack_from(">I", trun, 12)[0]
+    offset = 16
+    if flags & 0x01:
+        offset += 4  # data offset
+    first_flags = None
+    if flags & 0x04:
+        first_flags = struct.unpack_from(">I", trun, offset)[0]
+        offset += 4
+    total = 0
+    for i in range(sample_count):
+        duration = default_duration
+        sample_flags = default_flags
+        if flags & 0x100:
+            duration = struct.unpack_from(">I", trun, offset)[0]
+            offset += 4
+        if flags & 0x200:
+            offset += 4  # sample size
+        if flags & 0x400:
+            sample_flags = struct.unpack_from(">I", trun, offset)[0]
+            offset += 4
+        if flags & 0x800:
+            offset += 4  # composition time offset
+        if i == 0 and first_flags is None:
+            first_flags = sample_flags
+        total += duration
+    independent = not (first_flags or 0) & _SAMPLE_IS_NON_SYNC
+    return sample_count, total, independent
@@ -0,0 +1,185 @@
+from typing import Callable, Dict, List, Optional
+
+import asyncio
+import logging
+
+from aiohttp import web
+
+from .hls import HlsPackager
+
+_Logger = logging.getLogger(__name__)
+
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+MEDIA_CONTENT_TYPE = "video/mp4"
+
+
+class HlsServer:
+    """
+    Serves the streams of one or more [HlsPackager][wyzecam.hls.HlsPackager]s
+    over HTTP, as LL-HLS, on an asyncio event loop.
+
+    Each packager is served under its name, e.g. `/front-door/index.m3u8`.
+    Playlist requests with `_HLS_msn` (and `_HLS_part`) block until that segment
+    (or part) is available, and requests for the part named in the playlist's
+    preload hint block until it is produced, so players receive new video as
+    soon as it is muxed, without polling.  Playlist requests for a segment more
+    than two past the last complete one are answered 400 at once, as LL-HLS
+    requires.  Blocked requests wait on asyncio events, which the packagers'
+    threads set with `loop.call_soon_threadsafe`.
+
+    ```python
+    packager = HlsPackager(sess)
+    server = HlsServer({"front-door": packager})
+    packager.start()
+    await server.start("0.0.0.0", 8080)
+    ```
+    """
+
+    def __init__(
+        self,
+        packagers: Dict[str, HlsPackager],
+        block_timeout: float = 10.0,
+    ) -> None:
+        """Construct a server.
+
+        :param packagers: the packagers to serve, by name.
+        :param block_timeout: the longest time to hold a blocking request, in
+                              seconds, before answering 503.
+        """
+        self.packagers = packagers
+        self.block_timeout = block_timeout
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/{camera}/index.m3u8", self._playlist),
+                web.get(r"/{camera}/init{init:\d+}.mp4", self._init),
+                web.get(r"/{camera}/segment{msn:\d+}.m4s", self._segment),
+                web.get(r"/{camera}/part{msn:\d+}.{part:\d+}.m4s", self._part),
+            ]
+        )
+        self.app.on_response_prepare.append(self._add_headers)
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._updated: Dict[str, asyncio.Event] = {}
+        self._listeners: Dict[str, Callable[[], None]] = {}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """Start serving; returns once the server is listening."""
+        assert self._runner is None, "HlsServer already started!"
+        self._loop = asyncio.get_running_loop()
+        for name, packager in self.packagers.items():
+            self._updated[name] = asyncio.Event()
+            self._listeners[name] = self._listener(name)
+            packager.listeners.append(self._listeners[name])
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        for name, listener in self._listeners.items():
+            self.packagers[name].listeners.remove(listener)
+        self._listeners.clear()
+        runner, self._runner = self._runner, None
+        if runner is not None:
+            await runner.cleanup()
+
+    @property
+    def ports(self) -> List[int]:
+        """The ports the server is listening on."""
+        if self._runner is None:
+            return []
+        return [
+            sock.getsockname()[1]
+            for site in self._runner.sites
+            for sock in site._server.sockets  # type: ignore
+        ]
+
+    def _listener(self, name: str):
+        def notify() -> None:
+            loop = self._loop
+            if loop is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(self._wake, name)
+
+        return notify
+
+    def _wake(self, name: str) -> None:
+        # waiters hold the old event; the next waiters get a fresh one
+        self._updated.pop(name).set()
+        self._updated[name] = asyncio.Event()
+
+    async def _wait_for(
+        self, name: str, msn: int, part: Optional[int] = None
+    ) -> None:
+        packager = self.packagers[name]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.block_timeout
+        while not packager.has_part(msn, part):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise web.HTTPServiceUnavailable()
+            try:
+                await asyncio.wait_for(self._updated[name].wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def _packager(self, request: web.Request) -> HlsPackager:
+        name = request.match_info["camera"]
+        if name not in self.packagers:
+            raise web.HTTPNotFound()
+        return self.packagers[name]
+
+    async def _playlist(self, request: web.Request) -> web.Response:
+        packager = self._packager(request)
+        if "_HLS_msn" in request.query:
+            try:
+                msn = int(request.query["_HLS_msn"])
+                part = (
+                    int(request.query["_HLS_part"])
+                    if "_HLS_part" in request.query
+                    else None
+                )
+            except ValueError:
+                raise web.HTTPBadRequest()
+            # LL-HLS: more than two segments ahead will not be produced soon
+            if msn > packager.last_msn + 2:
+                raise web.HTTPBadRequest()
+            await self._wait_for(request.match_info["camera"], msn, part)
+        return web.Response(
+            text=packager.playlist(), content_type=PLAYLIST_CONTENT_TYPE
+        )
+
+    async def _init(self, request: web.Request) -> web.Response:
+        packager = self._packager(request)
+        data = packager.init_sections.get(int(request.match_info["init"]))
+        if data is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=data, content_type=MEDIA_CONTENT_TYPE)
+
+    async def _segment(self, request: web.Request) -> web.Response:
+        packager = self._packager(request)
+        msn = int(request.match_info["msn"])
+        await self._wait_for(request.match_info["camera"], msn)
+        segment = packager.segment(msn)
+        if segment is None or not segment.complete:
+            raise web.HTTPNotFound()
+        return web.Response(body=segment.data, content_type=MEDIA_CONTENT_TYPE)
+
+    async def _part(self, request: web.Request) -> web.Response:
+        packager = self._packager(request)
+        msn = int(request.match_info["msn"])
+        index = int(request.match_info["part"])
+        await self._wait_for(request.match_info["camera"], msn, index)
+        part = packager.part(msn, index)
+        if part is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=part.data, content_type=MEDIA_CONTENT_TYPE)
+
+    @staticmethod
+    async def _add_headers(
+        request: web.Request, response: web.StreamResponse
+    ) -> None:
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        if request.path.endswith(".m3u8"):
+            response.headers["Cache-Control"] = "no-cache"
+        else:
+            response.headers["Cache-Control"] = "max-age=60"
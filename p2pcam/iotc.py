@@ -1,16 +1,35 @@
-from typing import Dict, Iterator, Optional, Tuple, Union
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
+import asyncio
 import atexit
+import concurrent.futures
 import enum
 import logging
 import os
 import pathlib
 import platform
+import threading
 import time
 import warnings
 from ctypes import CDLL, RTLD_GLOBAL, c_int
+from queue import Empty
 
+from .decoder import DecodeSelection, FrameDecoder, create_codec
+from .frame_convert import frame_to_ndarray
+from .frame_ring import Frame, FrameReceiver, FrameRing, OverflowPolicy
+from .frame_wait import AdaptiveFrameWait, FrameWaitStrategy
+from .gop_cache import GopCache
 from .models import P2PCamera, P2PSettings
+from .shared_ring import SharedFramePublisher
 
 _Logger = logging.getLogger(__name__)
 
@@ -38,6 +57,8 @@ from .tutk.tutk_protocol import (
     respond_to_ioctrl_10001,
 )
 
+T = TypeVar("T")
+
 LIBRARY_FILES = ["libIOTCAPIs_ALL"]
 LIBRARY_FILE_EXT = [".so", ".dyall"]
 AV_LIBRARY_FILE = "libAVAPIs.so"
@@ -119,7 +140,7 @@ class P2PPlatform:
             tutk_platform_lib = tutk.load_library(str(path.absolute()))
             self.iotc_lib = tutk_platform_lib
             self.av_lib = tutk_platform_lib
-        elif isinstance(tutk_platform_lib, CDLL):
+        else:
             self.iotc_lib = tutk_platform_lib
             self.av_lib = tutk_platform_lib
 
@@ -297,6 +318,11 @@ class P2PSession:
                               See [wyzecam.tutk.tutk.BITRATE_HD][].
     :var session_id: The id of this session, once connected.
     :var av_chan_id: The AV channel of this session, once connected.
+    :var frame_buffer_pool: The pool of receive buffers used for video frames on this
+                            session's AV channel, once connected.
+    :var receiver: The background thread receiving video frames, if started with
+                   `start_receiver()`.
+    :var gop_cache: The most recent GOP of the video stream, if enabled.
     :var state: The current connection state of this session.  See
                 [WyzeIOTCSessionState](../iotc_session_state/).
     """
@@ -307,6 +333,8 @@ class P2PSession:
         camera: Union[int, str, P2PCamera],
         frame_size: int = tutk.FRAME_SIZE_1080P,
         bitrate: int = tutk.BITRATE_HD,
+        frame_wait: Optional[FrameWaitStrategy] = None,
+        gop_cache_max_bytes: Optional[int] = None,
     ) -> None:
         """Construct a wyze iotc session
 
@@ -320,6 +348,11 @@ class P2PSession:
                            See [wyzecam.tutk.tutk.FRAME_SIZE_1080P][].
         :param bitrate: Configures the bitrate of the video stream returned by the camera.
                         See [wyzecam.tutk.tutk.BITRATE_HD][].
+        :param frame_wait: How to wait for the next video frame when none is ready yet.
+                           Defaults to an [AdaptiveFrameWait][wyzecam.frame_wait.AdaptiveFrameWait].
+        :param gop_cache_max_bytes: If specified, keep the most recent GOP of the video
+                                    stream in a [GopCache][wyzecam.gop_cache.GopCache]
+                                    of at most this many bytes.
         """
         P2PSession.load_Platform()
         self.settings = settings
@@ -336,10 +369,17 @@ class P2PSession:
         self.camera: P2PCamera = camera
         self.session_id: Optional[c_int] = None
         self.av_chan_id: Optional[c_int] = None
+        self.frame_buffer_pool: Optional[tutk.FrameBufferPool] = None
+        self.receiver: Optional[FrameReceiver] = None
+        self._async_producers: Dict[threading.Thread, threading.Event] = {}
         self.state: WyzeIOTCSessionState = WyzeIOTCSessionState.DISCONNECTED
 
         self.preferred_frame_size: int = frame_size
         self.preferred_bitrate: int = bitrate
+        self.frame_wait: FrameWaitStrategy = frame_wait or AdaptiveFrameWait()
+        self.gop_cache: Optional[GopCache] = (
+            GopCache(gop_cache_max_bytes) if gop_cache_max_bytes else None
+        )
 
     @property
     def av_lib(self):
@@ -421,6 +461,13 @@ class P2PSession:
             assert future.result() == True, "Change bitrate failed!"
         ```
 
+        From asyncio, use it as an async context manager and await `send`:
+
+        ```python
+        async with session.iotctrl_mux() as mux:
+            assert await mux.send(msg), "Change bitrate failed!"
+        ```
+
         """
         assert self.av_chan_id is not None, "Please call _connect() first!"
         return TutkIOCtrlMux(self.av_lib, self.av_chan_id)
@@ -433,19 +480,266 @@ class P2PSession:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._disconnect()
 
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.connect_and_auth)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        loop = asyncio.get_running_loop()
+        # the threads of unfinished async generators may still be receiving
+        await loop.run_in_executor(None, self._stop_async_producers)
+        await loop.run_in_executor(None, self._disconnect)
+
+    def _stop_async_producers(self) -> None:
+        producers = list(self._async_producers.items())
+        for _, stop in producers:
+            stop.set()
+        for thread, _ in producers:
+            thread.join()
+
+    def arecv_video_data(
+        self, queue_size: int = 30
+    ) -> AsyncIterator[Tuple[bytes, tutk.FrameInfoStruct]]:
+        """An async generator for returning raw video frames.
+
+        The asyncio counterpart of `recv_video_data`: frames are received on a
+        worker thread, off the event loop, and handed over through an
+        `asyncio.Queue` of at most `queue_size` frames.  Frame data is always a
+        `bytes` copy, since it outlives the receive buffer.
+
+        ```python
+        async with P2PSession(settings, camera) as sess:
+            async for frame, frame_info in sess.arecv_video_data():
+                ...
+        ```
+
+        :param queue_size: the number of frames buffered between the worker thread
+                           and the event loop; the worker waits when it is full.
+        :returns: An async generator yielding the same tuples as `recv_video_data`.
+        """
+        return _aiter_in_thread(
+            lambda stop: self.recv_video_data(copy=True, stop=stop),  # type: ignore
+            queue_size,
+            self._async_producers,
+        )
+
+    def arecv_video_frame(
+        self, queue_size: int = 30
+    ) -> AsyncIterator[Tuple["av.VideoFrame", tutk.FrameInfoStruct]]:
+        """An async generator for returning decoded video frames.
+
+        The asyncio counterpart of `recv_video_frame`; receiving and decoding both
+        happen on a worker thread.
+
+        :param queue_size: the number of frames buffered between the worker thread
+                           and the event loop; the worker waits when it is full.
+        :returns: An async generator yielding the same tuples as `recv_video_frame`.
+        """
+        return _aiter_in_thread(
+            self.recv_video_frame, queue_size, self._async_producers
+        )
+
+    def arecv_video_frame_ndarray(
+        self, queue_size: int = 30
+    ) -> AsyncIterator[Tuple["np.ndarray", tutk.FrameInfoStruct]]:
+        """An async generator for returning decoded video frames as numpy arrays.
+
+        The asyncio counterpart of `recv_video_frame_ndarray`; receiving, decoding
+        and color conversion all happen on a worker thread.
+
+        :param queue_size: the number of frames buffered between the worker thread
+                           and the event loop; the worker waits when it is full.
+        :returns: An async generator yielding the same tuples as
+                  `recv_video_frame_ndarray`.
+        """
+        return _aiter_in_thread(
+            self.recv_video_frame_ndarray, queue_size, self._async_producers
+        )
+
+    def start_receiver(
+        self,
+        capacity: int = 60,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> FrameRing:
+        """Start receiving video frames on a background thread.
+
+        The thread drains this session's AV channel into a bounded
+        [FrameRing][wyzecam.frame_ring.FrameRing], so that a slow consumer no longer
+        stalls `avRecvFrameData2` (and overflows the camera-side buffer).  While the
+        receiver is running, `recv_video_data` and the generators built on it read from
+        the ring instead of the channel.
+
+        ```python
+        ring = sess.start_receiver(capacity=30, policy=OverflowPolicy.DROP_GOP)
+        for frame, frame_info in sess.recv_video_frame_ndarray():
+            ...  # slow processing no longer stalls the network
+        print(ring.dropped)
+        ```
+
+        :param capacity: the maximum number of frames buffered.
+        :param policy: what to do when the ring is full; see
+                       [OverflowPolicy][wyzecam.frame_ring.OverflowPolicy].
+        :returns: the [FrameRing][wyzecam.frame_ring.FrameRing] being filled.
+        """
+        assert self.av_chan_id is not None, "Please call _connect() first!"
+        assert self.receiver is None, "Receiver already started!"
+        self.receiver = FrameReceiver(self, FrameRing(capacity, policy))
+        self.receiver.start()
+        return self.receiver.ring
+
+    def publish_shared_frames(
+        self,
+        name: Optional[str] = None,
+        slots: int = 8,
+        output_format: str = "bgr24",
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        raw_slots: int = 0,
+    ) -> SharedFramePublisher:
+        """Start publishing decoded frames into shared memory, for consumers in
+        other processes.
+
+        ```python
+        publisher = sess.publish_shared_frames("front-door", output_format="gray")
+        # in another process:
+        with SharedFrameReader("front-door", timeout=10) as reader:
+            for frame in reader:
+                analyze(frame.array, frame.frame_no, frame.timestamp)
+        ```
+
+        :param name: the name readers attach with; a random name if not specified.
+        :param slots: the number of decoded frames held.
+        :param output_format: the format of the published frames; see
+                              [frame_to_ndarray][wyzecam.frame_convert.frame_to_ndarray].
+        :param width: if specified, the width to scale frames to.
+        :param height: if specified, the height to scale frames to.
+        :param raw_slots: if specified, also publish the encoded frames into a ring
+                          of this many slots, named `{name}-raw`.
+        :returns: the running
+                  [SharedFramePublisher][wyzecam.shared_ring.SharedFramePublisher];
+                  `stop()` it when done.
+        """
+        assert self.av_chan_id is not None, "Please call _connect() first!"
+        publisher = SharedFramePublisher(
+            self,
+            name,
+            slots,
+            output_format,
+            width,
+            height,
+            raw_slots=raw_slots,
+        )
+        publisher.start()
+        return publisher
+
+    def stop_receiver(self) -> None:
+        """Stop the background thread started by `start_receiver`."""
+        if self.receiver is None:
+            return
+        self.receiver.stop()
+        self.receiver = None
+
+    def recv_video_buffers(
+        self,
+        timeout: Optional[float] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Iterator[tutk.FrameBuffer]:
+        """A generator for returning raw video frames in pooled buffers.
+
+        This is the zero-copy building block underneath `recv_video_data`.  Each
+        frame is received into a [tutk.FrameBuffer][wyzecam.tutk.tutk.FrameBuffer]
+        checked out of this session's `frame_buffer_pool`; the caller owns the
+        yielded buffer and must `release()` it (or use it as a context manager)
+        once done with it, so that it can be reused for a later frame.
+
+        ```python
+        for buffer in sess.recv_video_buffers():
+            with buffer:
+                process(buffer.data, buffer.frame_info)
+        ```
+
+        While no frame is ready, the channel is polled according to this session's
+        `frame_wait` strategy.
+
+        :param timeout: if specified, raise a `TutkError` with `AV_ER_TIMEOUT` when no
+                        frame has been received for this many seconds.
+        :param stop: if specified, the generator returns once this event is set.
+        :returns: A generator, which when iterated over, yields
+                  [tutk.FrameBuffer][wyzecam.tutk.tutk.FrameBuffer]s holding a
+                  complete video frame.
+        """
+        assert self.av_chan_id is not None, "Please call _connect() first!"
+        assert self.frame_buffer_pool is not None, "No frame buffer pool!"
+
+        pool = self.frame_buffer_pool
+        frame_wait = self.frame_wait
+        buffer: Optional[tutk.FrameBuffer] = pool.acquire()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while stop is None or not stop.is_set():
+                assert buffer is not None
+                errno = tutk.av_recv_frame_data_into(
+                    self.av_lib, self.av_chan_id, buffer
+                )
+                if errno < 0:
+                    if errno == tutk.AV_ER_DATA_NOREADY:
+                        delay = frame_wait.next_delay()
+                        if deadline is not None:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise tutk.TutkError(tutk.AV_ER_TIMEOUT)
+                            delay = min(delay, remaining)
+                        if stop is not None:
+                            stop.wait(delay)
+                        else:
+                            time.sleep(delay)
+                        continue
+                    elif errno == tutk.AV_ER_INCOMPLETE_FRAME:
+                        warnings.warn("Received incomplete frame")
+                        continue
+                    elif errno == tutk.AV_ER_LOSED_THIS_FRAME:
+                        warnings.warn("Lost complete frame")
+                        continue
+                    else:
+                        raise tutk.TutkError(errno)
+                frame_wait.on_frame(buffer.frame_info)
+                if timeout is not None:
+                    deadline = time.monotonic() + timeout
+                if buffer.frame_info.frame_size != self.preferred_frame_size:
+                    print("skipping smaller frame at start of stream")
+                    continue
+                received, buffer = buffer, None
+                yield received
+                buffer = pool.acquire()
+        finally:
+            if buffer is not None:
+                buffer.release()
+
     def recv_video_data(
         self,
-    ) -> Iterator[Tuple[Optional[bytes], tutk.FrameInfoStruct]]:
+        copy: bool = False,
+        timeout: Optional[float] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Iterator[Tuple[Union[bytes, memoryview], tutk.FrameInfoStruct]]:
         """A generator for returning raw video frames!
 
         By iterating over the return value of this function, you will
-        get raw video frame data in the form of a bytes object.  This
+        get raw video frame data in the form of a bytes-like object.  This
         is convenient for accessing the raw video data without doing
         the work of decoding or transcoding the actual video feed.  If
         you want to save the video to disk, display it, or otherwise process
         the video, I highly recommend using `recv_video_frame` or
         `recv_video_frame_nparray` instead of this function.
 
+        Frames are received into this session's pooled buffers, and by default the
+        frame data is a `memoryview` into that buffer rather than a copy.  The view
+        is only valid until the generator is advanced; pass `copy=True` (or call
+        `bytes()` on the frames you keep) if you need the data for longer.  If a
+        background receiver was started with `start_receiver`, frames are read from
+        its ring instead, and are always `bytes`.  Frames are also always `bytes`
+        when the session keeps a `gop_cache`, which this generator fills.
+
         The second item in the tuple returned by this function, 'frame_info', is a useful
         set of metadata about the frame as returned by the camera.  See
         [tutk.FrameInfoStruct][wyzecam.tutk.tutk.FrameInfoStruct] for more details about
@@ -462,41 +756,63 @@ class P2PSession:
                     # do something with the video data! :)
         ```
 
-        In order to use this, you will need to install [PyAV](https://pyav.org/docs/stable/).
-
-        :returns: A generator, which when iterated over, yields a tuple containing the decoded image
-                 (as a [PyAV VideoFrame](https://pyav.org/docs/stable/api/video.html#av.video.frame.VideoFrame)),
-                 as well as metadata about the frame (in the form of a
+        :param copy: if True, yield each frame as a `bytes` copy instead of a view
+                     into the pooled receive buffer.
+        :param timeout: if specified, raise a `TutkError` with `AV_ER_TIMEOUT` when no
+                        frame has been received for this many seconds.
+        :param stop: if specified, the generator returns once this event is set.
+        :returns: A generator, which when iterated over, yields a tuple containing the raw
+                 frame data, as well as metadata about the frame (in the form of a
                  [tutk.FrameInfoStruct][wyzecam.tutk.tutk.FrameInfoStruct]).
 
 
         """
-        assert self.av_chan_id is not None, "Please call _connect() first!"
+        if self.receiver is not None:
+            yield from self._recv_ring_frames(self.receiver.ring, timeout, stop)
+            return
 
-        while True:
-            errno, frame_data, frame_info, frame_idx = tutk.av_recv_frame_data(
-                self.av_lib, self.av_chan_id
-            )
-            if errno < 0:
-                if errno == tutk.AV_ER_DATA_NOREADY:
-                    time.sleep(1.0 / 40)
-                    continue
-                elif errno == tutk.AV_ER_INCOMPLETE_FRAME:
-                    warnings.warn("Received incomplete frame")
-                    continue
-                elif errno == tutk.AV_ER_LOSED_THIS_FRAME:
-                    warnings.warn("Lost complete frame")
-                    continue
+        gop_cache = self.gop_cache
+        for buffer in self.recv_video_buffers(timeout, stop):
+            with buffer:
+                frame_info = tutk.FrameInfoStruct.from_buffer_copy(
+                    buffer.frame_info
+                )
+                if gop_cache is not None:
+                    frame_bytes = buffer.tobytes()
+                    gop_cache.add(frame_bytes, frame_info)
+                    yield frame_bytes, frame_info
                 else:
-                    raise tutk.TutkError(errno)
-            assert frame_info is not None, "Got no frame info without an error!"
-            if frame_info.frame_size != self.preferred_frame_size:
-                print("skipping smaller frame at start of stream")
+                    yield buffer.tobytes() if copy else buffer.data, frame_info
+
+    def _recv_ring_frames(
+        self,
+        ring: FrameRing,
+        timeout: Optional[float],
+        stop: Optional[threading.Event],
+    ) -> Iterator[Frame]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while stop is None or not stop.is_set():
+            wait = None if deadline is None else deadline - time.monotonic()
+            if stop is not None:
+                wait = 0.1 if wait is None else min(wait, 0.1)
+            try:
+                frame = ring.get(timeout=wait)
+            except Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise tutk.TutkError(tutk.AV_ER_TIMEOUT)
                 continue
-            yield frame_data, frame_info
+            if frame is None:
+                return
+            yield frame
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
 
     def recv_video_frame(
         self,
+        stop: Optional[threading.Event] = None,
+        thread_type: Optional[str] = None,
+        thread_count: int = 0,
+        selection: Optional[DecodeSelection] = None,
     ) -> Iterator[Tuple["av.VideoFrame", tutk.FrameInfoStruct]]:
         """A generator for returning decoded video frames!
 
@@ -518,6 +834,14 @@ class P2PSession:
 
         In order to use this, you will need to install [PyAV](https://pyav.org/docs/stable/).
 
+        :param stop: if specified, the generator returns once this event is set.
+        :param thread_type: if specified, the PyAV decoder `thread_type` ("SLICE",
+                            "FRAME" or "AUTO").
+        :param thread_count: the PyAV decoder `thread_count`; 0 lets FFmpeg decide.
+        :param selection: if specified, only decode the frames chosen by this
+                          [DecodeSelection][wyzecam.decoder.DecodeSelection], e.g.
+                          `KeyframesOnly()` or `FrameInterval(1000)`, skipping as much
+                          decoding work as possible for the rest.
         :returns: A generator, which when iterated over, yields a tuple containing the decoded image
                  (as a [PyAV VideoFrame](https://pyav.org/docs/stable/api/video.html#av.video.frame.VideoFrame)),
                  as well as metadata about the frame (in the form of a
@@ -529,18 +853,18 @@ class P2PSession:
                 "Install with `pip install av` and try again."
             )
 
-        codec = None
-        for frame_data, frame_info in self.recv_video_data():
-            if codec is None:
-                codec = self._av_codec_from_frameinfo(frame_info)
-            packets = codec.parse(frame_data)
-            for packet in packets:
-                frames = codec.decode(packet)
-                for frame in frames:
-                    yield frame, frame_info
+        decoder = FrameDecoder(selection, thread_type, thread_count)
+        for frame_data, frame_info in self.recv_video_data(stop=stop):
+            yield from decoder.decode(frame_data, frame_info)
 
     def recv_video_frame_ndarray(
         self,
+        stop: Optional[threading.Event] = None,
+        selection: Optional[DecodeSelection] = None,
+        output_format: str = "bgr24",
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        interpolation: Optional[str] = None,
     ) -> Iterator[Tuple["np.ndarray", tutk.FrameInfoStruct]]:
         """A generator for returning decoded video frames!
 
@@ -564,6 +888,25 @@ class P2PSession:
         In order to use this, you will need to install [PyAV](https://pyav.org/docs/stable/)
         and [numpy](https://numpy.org/).
 
+        Receiving, decoding and color conversion all run on the caller's thread; to
+        run them as separate stages, see
+        [DecodePipeline][wyzecam.decode_pipeline.DecodePipeline].
+
+        Converting a full-size frame to "bgr24" costs about as much as decoding it;
+        if the consumer only needs a smaller or grayscale image, ask for it here, so
+        scaling and conversion happen in a single swscale pass.  The "y" format costs
+        nothing at all at full size: it is a view of the luma plane of the decoded frame.
+
+        :param stop: if specified, the generator returns once this event is set.
+        :param selection: if specified, only decode the frames chosen by this
+                          [DecodeSelection][wyzecam.decoder.DecodeSelection].
+        :param output_format: the format of the images produced; one of "bgr24",
+                              "rgb24", "gray", "y" or "yuv420p".  See
+                              [frame_to_ndarray][wyzecam.frame_convert.frame_to_ndarray].
+        :param width: if specified, the width to scale images to.
+        :param height: if specified, the height to scale images to.
+        :param interpolation: if specified, the swscale interpolation used for
+                              scaling, e.g. "BILINEAR" or "AREA".
         :returns: A generator, which when iterated over, yields a tuple containing the decoded image
                  (as a numpy array), as well as metadata about the frame (in the form of a
                  [tutk.FrameInfoStruct][wyzecam.tutk.tutk.FrameInfoStruct]).
@@ -574,8 +917,12 @@ class P2PSession:
                 "Install with `pip install numpy` and try again."
             )
 
-        for frame, frame_info in self.recv_video_frame():
-            img = frame.to_ndarray(format="bgr24")
+        for frame, frame_info in self.recv_video_frame(
+            stop, selection=selection
+        ):
+            img = frame_to_ndarray(
+                frame, output_format, width, height, interpolation
+            )
             yield img, frame_info
 
     def recv_video_frame_ndarray_with_stats(
@@ -637,14 +984,8 @@ class P2PSession:
                 stat_window = stat_window[len(stat_window) - stat_window_size :]
 
             if len(stat_window) > 1:
-                stat_window_start = (
-                    stat_window[0].timestamp
-                    + stat_window[0].timestamp_ms / 1_000_000
-                )
-                stat_window_end = (
-                    stat_window[-1].timestamp
-                    + stat_window[-1].timestamp_ms / 1_000_000
-                )
+                stat_window_start = stat_window[0].timestamp_seconds
+                stat_window_end = stat_window[-1].timestamp_seconds
                 stat_window_duration = stat_window_end - stat_window_start
                 stat_window_total_size = sum(
                     b.frame_len for b in stat_window[:-1]
@@ -692,17 +1033,13 @@ class P2PSession:
 
             yield frame_ndarray, frame_info, stats
 
-    def _av_codec_from_frameinfo(self, frame_info):
-        if frame_info.codec_id == 78:
-            codec_name = "h264"
-        elif frame_info.codec_id == 80:
-            codec_name = "hevc"
-        else:
-            codec_name = "h264"
-            print(f"Unexpected codec! got {frame_info.codec_id}.")
-        # noinspection PyUnresolvedReferences
-        codec = av.CodecContext.create(codec_name, "r")
-        return codec
+    def _av_codec_from_frameinfo(
+        self,
+        frame_info,
+        thread_type: Optional[str] = None,
+        thread_count: int = 0,
+    ):
+        return create_codec(frame_info, thread_type, thread_count)
 
     def _connect(
         self,
@@ -711,6 +1048,7 @@ class P2PSession:
         username=b"admin",
         password=b"888888",
         max_buf_size=5 * 1024 * 1024,
+        frame_buffer_count=2,
     ):
         self.state = WyzeIOTCSessionState.IOTC_CONNECTING
         self.session_id = tutk.iotc_connect_by_uid(
@@ -741,12 +1079,86 @@ class P2PSession:
         )
 
         tutk.av_client_set_max_buf_size(self.av_lib, max_buf_size)
+        self.frame_buffer_pool = tutk.FrameBufferPool(frame_buffer_count)
 
     def _disconnect(self):
+        self.stop_receiver()
         if self.av_chan_id:
             tutk.av_client_stop(self.av_lib, self.av_chan_id)
         self.av_chan_id = None
+        self.frame_buffer_pool = None
         if self.session_id:
             tutk.iotc_session_close(self.iotc_lib, self.session_id)
         self.session_id = None
         self.state = WyzeIOTCSessionState.DISCONNECTED
+
+
+class _ThreadError:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_END_OF_STREAM = object()
+
+
+async def _aiter_in_thread(
+    iterator_factory: Callable[[threading.Event], Iterator[T]],
+    queue_size: int,
+    producers: Dict[threading.Thread, threading.Event],
+) -> AsyncIterator[T]:
+    """Run a blocking generator on a worker thread, feeding an asyncio queue.
+
+    The factory is passed a `threading.Event` that is set once the consumer stops
+    iterating, which the generator should use to return promptly.  The thread is
+    registered in `producers` while it runs, so the session can stop and join it
+    before disconnecting, even if the consumer never closes the generator.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[object]" = asyncio.Queue(queue_size)
+    stop = threading.Event()
+
+    def put(item: object) -> bool:
+        """Wait for room in the queue, unless the consumer goes away."""
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:  # the loop is closed
+            return False
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set() or loop.is_closed():
+                    future.cancel()
+                    return False
+
+    def produce() -> None:
+        try:
+            for item in iterator_factory(stop):
+                if stop.is_set() or not put(item):
+                    break
+            else:
+                if not stop.is_set():
+                    put(_END_OF_STREAM)
+        except BaseException as e:
+            if not stop.is_set():
+                put(_ThreadError(e))
+        finally:
+            producers.pop(threading.current_thread(), None)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    producers[thread] = stop
+    thread.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, _ThreadError):
+                raise item.error
+            yield item  # type: ignore
+    finally:
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
+        await loop.run_in_executor(None, thread.join)
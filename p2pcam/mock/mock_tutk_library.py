@@ -1,16 +1,52 @@
 # type: ignore
 
 import ctypes
+import threading
+import time
+from collections import deque
+
+from p2pcam.tutk import tutk
 
 
 # noinspection PyPep8Naming,PyMethodMayBeStatic
 class MockTutkLibrary:
-    """A mock tutk_platform_lib, for testing"""
+    """A mock tutk_platform_lib, for testing
+
+    Video frames queued with `push_frame` are handed out, in order, by
+    `avRecvFrameData2`; when the queue is empty, or the next frame is scheduled
+    to arrive later (see `available_at`), it reports `AV_ER_DATA_NOREADY` just
+    like a camera that has not sent the next frame yet.  `recv_frame_calls`
+    counts every poll.
+
+    IOCtrl messages queued with `push_ioctrl` are handed out by `avRecvIOCtrl`,
+    which, like the real library, waits up to its timeout for one to arrive.
+    Messages sent with `avSendIOCtrl` are recorded in `sent_ioctrl`, and passed
+    to `ioctrl_responder`, if set, whose return value, if not None, is queued as
+    the camera's response.  `close_ioctrl` makes the camera hang up.
+    """
+
+    def __init__(self):
+        self.frames = deque()
+        self.frame_index = 0
+        self.recv_frame_calls = 0
+        self.ioctrl = deque()
+        self.ioctrl_closed = False
+        self.ioctrl_ready = threading.Condition()
+        self.sent_ioctrl = []
+        self.ioctrl_responder = None
+
+    def push_frame(self, data, frame_info=None, available_at=None):
+        """Queue a video frame, optionally not readable until the
+        `time.monotonic()` value `available_at`."""
+        if frame_info is None:
+            frame_info = tutk.FrameInfoStruct(frame_len=len(data))
+        self.frames.append((data, frame_info, available_at))
 
     def avRecvFrameData2(
         self,
+        av_chan_id,
         frame_data_ptr,
-        frame_data_max_ptr,
+        frame_data_max_len,
         frame_data_actual_len_ptr,
         frame_data_expected_len_ptr,
         frame_info_ptr,
@@ -18,7 +54,40 @@ class MockTutkLibrary:
         frame_info_actual_len_ptr,
         frame_index_ptr,
     ):
-        pass
+        self.recv_frame_calls += 1
+        if not self.frames:
+            return tutk.AV_ER_DATA_NOREADY
+        data, frame_info, available_at = self.frames[0]
+        if available_at is not None and time.monotonic() < available_at:
+            return tutk.AV_ER_DATA_NOREADY
+        self.frames.popleft()
+        assert len(data) <= frame_data_max_len.value
+        ctypes.memmove(frame_data_ptr, data, len(data))
+        frame_data_actual_len_ptr.contents.value = len(data)
+        frame_data_expected_len_ptr.contents.value = len(data)
+        ctypes.memmove(
+            frame_info_ptr, ctypes.byref(frame_info), ctypes.sizeof(frame_info)
+        )
+        frame_info_actual_len_ptr.contents.value = ctypes.sizeof(frame_info)
+        frame_index_ptr.contents.value = self.frame_index
+        self.frame_index += 1
+        return len(data)
+
+    def push_ioctrl(self, data, io_ctrl_type=tutk.IOTYPE_USER_DEFINED_START):
+        """Queue an IOCtrl message from the camera."""
+        with self.ioctrl_ready:
+            self.ioctrl.append((io_ctrl_type, data))
+            self.ioctrl_ready.notify_all()
+
+    def push_ioctrl_error(self, errno):
+        """Make `avRecvIOCtrl` fail with `errno` once the queued messages are
+        read."""
+        self.push_ioctrl(errno)
+
+    def close_ioctrl(self):
+        with self.ioctrl_ready:
+            self.ioctrl_closed = True
+            self.ioctrl_ready.notify_all()
 
     def avRecvIOCtrl(
         self,
@@ -28,7 +97,21 @@ class MockTutkLibrary:
         ctl_data_len,
         timeout_ms,
     ):
-        pass
+        with self.ioctrl_ready:
+            if not self.ioctrl_ready.wait_for(
+                lambda: self.ioctrl or self.ioctrl_closed,
+                timeout_ms.value / 1000,
+            ):
+                return tutk.AV_ER_TIMEOUT
+            if not self.ioctrl:
+                return tutk.AV_ER_SESSION_CLOSE_BY_REMOTE
+            io_ctrl_type, data = self.ioctrl.popleft()
+        if isinstance(data, int):
+            return data
+        assert len(data) <= ctl_data_len.value
+        ctypes.memmove(ctl_data, data, len(data))
+        pn_io_ctrl_type_ptr.contents.value = io_ctrl_type
+        return len(data)
 
     def avClientSetMaxBufSize(self, size):
         pass
@@ -37,7 +120,13 @@ class MockTutkLibrary:
         pass
 
     def avSendIOCtrl(self, av_chan_id, ctrl_type, cdata, length):
-        pass
+        data = ctypes.string_at(cdata, length) if length else b""
+        self.sent_ioctrl.append((ctrl_type.value, data))
+        if self.ioctrl_responder is not None:
+            response = self.ioctrl_responder(data)
+            if response is not None:
+                self.push_ioctrl(response)
+        return 0
 
     def avClientStart(
         self,
@@ -48,7 +137,7 @@ class MockTutkLibrary:
         user_defined_service_type_ptr,
         chan_id,
     ):
-        pass
+        return 0
 
     def avInitialize(self, max_num_channels):
         return 0
@@ -56,14 +145,14 @@ class MockTutkLibrary:
     def avDeInitialize(self):
         pass
 
-    def IOTC_Session_Check(session_id, sess_info_ptr):
-        pass
+    def IOTC_Session_Check(self, session_id, sess_info_ptr):
+        return 0
 
     def IOTC_Session_Close(self, session_id):
         pass
 
     def IOTC_Connect_ByUID(self, p2p_id):
-        pass
+        return 1
 
     def IOTC_Set_Log_Path(self, path, max_size):
         pass
@@ -76,3 +165,81 @@ class MockTutkLibrary:
 
     def IOTC_DeInitialize(self):
         pass
+
+
+def encode_test_video(
+    num_frames, width=64, height=48, framerate=20, gop_size=10, codec="h264"
+):
+    """Encode a synthetic video, returning `(frame_data, frame_info)` tuples
+    shaped like the frames a camera sends, for pushing into a MockTutkLibrary.
+
+    Requires PyAV and numpy.
+    """
+    import av
+    import numpy as np
+
+    encoder = av.CodecContext.create(
+        "libx264" if codec == "h264" else "libx265", "w"
+    )
+    encoder.width = width
+    encoder.height = height
+    encoder.pix_fmt = "yuv420p"
+    encoder.framerate = framerate
+    encoder.gop_size = gop_size
+    if codec == "h264":
+        encoder.options = {
+            "tune": "zerolatency",
+            "x264-params": "scenecut=0:bframes=0:repeat-headers=1",
+        }
+    else:
+        encoder.options = {
+            "tune": "zerolatency",
+            "x265-params": "scenecut=0:bframes=0:repeat-headers=1:log-level=none",
+        }
+
+    packets = []
+    for i in range(num_frames):
+        image = np.zeros((height, width, 3), np.uint8)
+        image[:, (i * 4) % width :] = 255
+        frame = av.VideoFrame.from_ndarray(image, format="rgb24")
+        frame.pts = i
+        packets.extend(encoder.encode(frame))
+    packets.extend(encoder.encode(None))
+
+    frames = []
+    for i, packet in enumerate(packets):
+        micros = i * 1_000_000 // framerate
+        frame_info = tutk.FrameInfoStruct(
+            codec_id=78 if codec == "h264" else 80,
+            is_keyframe=packet.is_keyframe,
+            framerate=framerate,
+            frame_size=tutk.FRAME_SIZE_1080P,
+            timestamp=1_600_000_000 + micros // 1_000_000,
+            timestamp_ms=micros % 1_000_000,
+            frame_len=packet.size,
+            frame_no=i,
+        )
+        frames.append((bytes(packet), frame_info))
+    return frames
+
+
+def mock_session(tutk_platform_lib, **kwargs):
+    """Construct a connected P2PSession backed by `tutk_platform_lib`, for testing
+
+    The platform singleton is loaded with `tutk_platform_lib`; call
+    `P2PPlatform.unload_Platform()` when finished.
+    """
+    from p2pcam.iotc import P2PPlatform, P2PSession
+    from p2pcam.models import P2PCamera, P2PSettings
+
+    P2PPlatform.load_Platform(tutk_platform_lib)
+    camera = P2PCamera(
+        p2p_id="MOCKP2PID0000000000A",
+        enr="0123456789abcdef",
+        mac="000000000000",
+        product_model="WYZEC1-JZ",
+    )
+    settings = P2PSettings.construct(cameras=[camera])
+    session = P2PSession(settings, camera, **kwargs)
+    session._connect()
+    return session
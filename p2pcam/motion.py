@@ -1,46 +1,339 @@
-from typing import Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
 
+Box = Tuple[int, int, int, int]
+"""A rectangle in frame coordinates: x, y, width, height"""
+
+BACKGROUND_MODELS = ("previous", "average", "mog2")
+"""The background models a [MotionDetector][wyzecam.motion.MotionDetector] compares frames with"""
+
 
 class MotionDetector:
-    def __init__(self) -> None:
+    """
+    Detects moving objects by comparing each frame with a model of the
+    background.
+
+    The background model is one of:
+
+    - "previous": the previous frame.  Reacts instantly, but misses objects
+      that move slowly, and flags every frame of camera noise.
+    - "average": a running average of past frames, updated by `learning_rate`
+      with every frame, so slow motion accumulates against it and noise averages
+      out.
+    - "mog2": OpenCV's per-pixel mixture of Gaussians model, which also learns
+      backgrounds that move, such as foliage; `threshold` is its variance
+      threshold.
+
+    Frames are analysed as grayscale, and optionally downscaled to
+    `analysis_width` pixels wide first: finding a person or a car does not need
+    every pixel of a 1080p frame, and the cost of the analysis falls with the
+    square of the scale.  Boxes are always reported in the coordinates of the
+    full frame.  If `regions` are given, motion outside them is ignored.
+
+    Every intermediate image is written into buffers allocated for the first
+    frame (and again only if the frame size changes), so detecting motion in a
+    steady stream allocates no image memory.
+
+    :var boxes: the boxes around moving objects found by the last call to
+                `detect` or `detect_boxes`.
+    """
+
+    def __init__(
+        self,
+        analysis_width: Optional[int] = None,
+        regions: Optional[Sequence[Box]] = None,
+        min_area: int = 1000,
+        threshold: int = 20,
+        background: str = "previous",
+        learning_rate: float = 0.05,
+    ) -> None:
+        """Construct a detector.
+
+        :param analysis_width: if specified, the width to downscale frames to
+                               before analysing them, e.g. 320.
+        :param regions: if specified, the only parts of the frame to detect
+                        motion in, as (x, y, width, height) boxes in full-frame
+                        coordinates.
+        :param min_area: the smallest area of motion reported, in full-frame
+                         pixels.
+        :param threshold: the difference in brightness from the background
+                          that counts as motion.
+        :param background: the background model; see above.
+        :param learning_rate: how quickly the "average" or "mog2" background
+                              adapts to each new frame, from 0 to 1.
+        """
+        assert (
+            background in BACKGROUND_MODELS
+        ), f"background must be one of {BACKGROUND_MODELS}"
+        self.analysis_width = analysis_width
+        self.regions = list(regions) if regions is not None else None
+        self.min_area = min_area
+        self.threshold = threshold
+        self.background = background
+        self.learning_rate = learning_rate
         self.last_frame: Optional[np.ndarray] = None
+        self.boxes: List[Box] = []
+        self._input_shape: Optional[Tuple[int, ...]] = None
+        self._scale = 1.0
+        self._mask: Optional[np.ndarray] = None
+        self._warm = False
+
+    def _allocate(self, frame: np.ndarray) -> None:
+        """Allocate the working set for frames shaped like `frame`."""
+        height, width = frame.shape[:2]
+        if self.analysis_width is not None and self.analysis_width < width:
+            self._scale = self.analysis_width / width
+            size = (self.analysis_width, max(1, round(height * self._scale)))
+            self._resized: Optional[np.ndarray] = np.empty(
+                (size[1], size[0]) + frame.shape[2:], np.uint8
+            )
+        else:
+            self._scale = 1.0
+            size = (width, height)
+            self._resized = None
+        shape = (size[1], size[0])
+        self._size = size
+        self._gray = np.empty(shape, np.uint8)
+        self._blurred = np.empty(shape, np.uint8)
+        self._reference = np.empty(shape, np.uint8)
+        self._diff = np.empty(shape, np.uint8)
+        self._thresh = np.empty(shape, np.uint8)
+        self._dilated = np.empty(shape, np.uint8)
+        self._average = np.empty(shape, np.float32)
+        self._subtractor = None
+        if self.background == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(
+                varThreshold=self.threshold, detectShadows=False
+            )
+        self._mask = (
+            self._region_mask(shape) if self.regions is not None else None
+        )
+        self._input_shape = frame.shape
+        self._warm = False
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Downscale and gray `frame` for analysis, and blur it, so that noise
+        and compression artifacts do not count as motion."""
+        if frame.shape != self._input_shape:
+            self._allocate(frame)
+        if self._resized is not None:
+            frame = cv2.resize(
+                frame,
+                self._size,
+                dst=self._resized,
+                interpolation=cv2.INTER_AREA,
+            )
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        return cv2.GaussianBlur(frame, (5, 5), 0, dst=self._blurred)
+
+    def _region_mask(self, shape: Tuple[int, ...]) -> np.ndarray:
+        mask = np.zeros(shape, np.uint8)
+        for x, y, w, h in self.regions or ():
+            x0, y0 = int(x * self._scale), int(y * self._scale)
+            x1 = int(np.ceil((x + w) * self._scale))
+            y1 = int(np.ceil((y + h) * self._scale))
+            mask[y0:y1, x0:x1] = 255
+        return mask
+
+    def _foreground(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        """Compare `gray` with the background model, and update the model."""
+        if self._subtractor is not None:
+            thresh = self._subtractor.apply(
+                gray, fgmask=self._thresh, learningRate=self.learning_rate
+            )
+            if not self._warm:
+                self._warm = True
+                return None
+            return thresh
+
+        if not self._warm:
+            self._warm = True
+            self._reference[:] = gray
+            self._average[:] = gray
+            return None
+        diff = cv2.absdiff(self._reference, gray, dst=self._diff)
+        if self.background == "average":
+            cv2.accumulateWeighted(gray, self._average, self.learning_rate)
+            cv2.convertScaleAbs(self._average, dst=self._reference)
+        else:
+            self._reference[:] = gray
+
+        # If pixel value is greater than threshold, it is assigned white(255)
+        # otherwise black
+        _, thresh = cv2.threshold(
+            diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self._thresh
+        )
+        return thresh
+
+    def detect_boxes(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        """Compare `frame` with the background, setting `boxes`.
+
+        :returns: the thresholded difference image, at the analysis resolution,
+                  or None for the first frame.  The image is overwritten by the
+                  next call; copy it to keep it.
+        """
+        gray = self._prepare(frame)
+        self.boxes = []
+        thresh = self._foreground(gray)
+        if thresh is None:
+            return None
+        if self._mask is not None:
+            cv2.bitwise_and(thresh, self._mask, dst=thresh)
+
+        iterations = max(1, round(4 * self._scale))
+        dilated = cv2.dilate(
+            thresh, None, dst=self._dilated, iterations=iterations
+        )
+
+        # only the outlines of moving objects are needed, not their insides
+        contours, _ = cv2.findContours(
+            dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        scale = self._scale
+        min_area = self.min_area * scale * scale
+        for contour in contours:
+            if cv2.contourArea(contour) < min_area:
+                continue
+            (x, y, w, h) = cv2.boundingRect(contour)
+            self.boxes.append(
+                (
+                    int(x / scale),
+                    int(y / scale),
+                    int(np.ceil(w / scale)),
+                    int(np.ceil(h / scale)),
+                )
+            )
+        return thresh
 
     """ Returns original frame and difference frame"""
 
     def detect(
         self, frame: np.ndarray
     ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Compare `frame` with the background.
+
+        Frames may be BGR images, or single-channel grayscale images such as the
+        Y plane produced by `recv_video_frame_ndarray(output_format="y")`, which
+        needs no color conversion at all.  Grayscale frames are returned as BGR
+        copies, so the boxes drawn around moving objects are visible.
+
+        :returns: the previous frame with boxes drawn around moving objects, and
+                  the thresholded difference image at the analysis resolution
+                  (overwritten by the next call); or None for the first frame.
+        """
         last_frame = self.last_frame
         self.last_frame = frame
-        if last_frame is None:
+        thresh = self.detect_boxes(frame)
+        if last_frame is None or thresh is None:
             return None
 
-        # Difference between frame1(image) and frame2(image)
-        diff = cv2.absdiff(last_frame, frame)
+        if last_frame.ndim == 2:
+            # draw on a color copy, since the frame may be a read-only view of
+            # the decoded picture
+            last_frame = cv2.cvtColor(last_frame, cv2.COLOR_GRAY2BGR)
+
+        # making rectangle around moving object
+        for x, y, w, h in self.boxes:
+            cv2.rectangle(last_frame, (x, y), (x + w, y + h), (0, 255, 255), 2)
+
+        return last_frame, thresh
+
+
+class MotionGrid:
+    """
+    Measures motion per cell of a `rows` by `cols` grid, for zone rules that
+    need to know where there is activity rather than the outline of each
+    moving object.
 
-        # Converting color image to gray_scale image
-        gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+    Each frame is compared with the previous one, and the score of a cell is
+    the fraction of its pixels that changed by more than `threshold`.  There
+    is no blurring, contour finding or drawing: the difference image is
+    reshaped into blocks and summed by NumPy in one pass.  Scores are also
+    accumulated into `heatmap`, which decays by `decay` with every frame.
 
-        # Converting gray scale image to GaussianBlur, so that change can be find easily
-        blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    Frames from several cameras can be analysed together as one batch, by
+    stacking same-sized grayscale frames into an `(N, height, width)` array,
+    e.g. from `frame_to_ndarray(frame, "y", width, height)`; the grid keeps
+    the previous frame of each camera in the batch.
 
-        # If pixel value is greater than 20, it is assigned white(255) otherwise black
-        _, thresh = cv2.threshold(blur, 20, 255, cv2.THRESH_BINARY)
-        dilated = cv2.dilate(thresh, None, iterations=4)
+    """
 
-        # finding contours of moving object
-        contours, hirarchy = cv2.findContours(
-            dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
+    def __init__(
+        self,
+        rows: int = 9,
+        cols: int = 16,
+        threshold: int = 20,
+        decay: float = 0.95,
+    ) -> None:
+        """Construct a motion grid.
+
+        :param rows: the number of rows of cells.
+        :param cols: the number of columns of cells.
+        :param threshold: the difference in brightness that counts as motion.
+        :param decay: the factor the heatmap is multiplied by with each frame,
+                      from 0 (only the latest scores) to 1 (never forget).
+        """
+        self.rows = rows
+        self.cols = cols
+        self.threshold = threshold
+        self.decay = decay
+        self._heatmap: Optional[np.ndarray] = None
+        self._batched = False
+        self._previous: Optional[np.ndarray] = None
+        self._changed: Optional[np.ndarray] = None
+
+    def update(self, frames: np.ndarray) -> Optional[np.ndarray]:
+        """Score the motion in one grayscale frame, or a batch of them.
+
+        :param frames: a `(height, width)` frame, or an `(N, height, width)`
+                       batch with one frame per camera.
+        :returns: the score of each cell, from 0 to 1, shaped `(rows, cols)`,
+                  or `(N, rows, cols)` for a batch; None for the first frame.
+        """
+        batch = frames if frames.ndim == 3 else frames[np.newaxis]
+        count, height, width = batch.shape
+        cell_height, cell_width = height // self.rows, width // self.cols
+        assert cell_height and cell_width, "frames are smaller than the grid"
+        # cv2 works on 2-D images, so treat the batch as one tall image
+        flat = batch.reshape(count * height, width)
+        previous = self._previous
+        if previous is None or previous.shape != flat.shape:
+            self._previous = flat.copy()
+            self._changed = np.empty_like(flat)
+            self._heatmap = None
+            self._batched = frames.ndim == 3
+            return None
+
+        changed = cv2.absdiff(previous, flat, dst=self._changed)
+        previous[:] = flat
+        cv2.threshold(
+            changed, self.threshold, 1, cv2.THRESH_BINARY, dst=changed
         )
+        blocks = changed.reshape(count, height, width)[
+            :, : self.rows * cell_height, : self.cols * cell_width
+        ].reshape(count, self.rows, cell_height, self.cols, cell_width)
+        scores = blocks.sum(axis=(2, 4), dtype=np.uint32).astype(np.float32)
+        scores /= cell_height * cell_width
 
-        # making rectangle around moving object
-        for contour in contours:
-            if cv2.contourArea(contour) < 1000:
-                continue
-            (x, y, w, h) = cv2.boundingRect(contour)
-            cv2.rectangle(last_frame, (x, y), (x + w, y + h), (0, 255, 255), 2)
+        if self._heatmap is None:
+            self._heatmap = np.zeros_like(scores)
+        self._heatmap *= self.decay
+        self._heatmap += scores
+        return scores if self._batched else scores[0]
 
-        return last_frame, thresh
+    @property
+    def heatmap(self) -> Optional[np.ndarray]:
+        """The decayed sum of the scores of every frame so far, shaped like the
+        scores; None until two frames have been compared."""
+        if self._heatmap is None or self._batched:
+            return self._heatmap
+        return self._heatmap[0]
+
+    def active_cells(self, min_score: float = 0.02) -> Optional[np.ndarray]:
+        """The cells whose heatmap is at least `min_score`, as a boolean array
+        shaped like the scores."""
+        heatmap = self.heatmap
+        return None if heatmap is None else heatmap >= min_score
@@ -0,0 +1,313 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+import logging
+import multiprocessing
+import queue
+import time
+
+from .shared_ring import SharedFramePublisher, SharedFrameReader
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+
+class MotionEvent:
+    """
+    Motion found in one frame by a [MotionPool][wyzecam.motion_pool.MotionPool].
+
+    :var camera: the name the camera was added to the pool with.
+    :var frame_no: the `frame_no` of the frame.
+    :var timestamp: the timestamp of the frame, in seconds.
+    :var boxes: the boxes around moving objects, in the coordinates of the
+                published frames.
+    :var score: the fraction of the analysed image that changed, from 0 to 1.
+    """
+
+    def __init__(
+        self,
+        camera: str,
+        frame_no: int,
+        timestamp: float,
+        boxes: List[Tuple[int, int, int, int]],
+        score: float,
+    ) -> None:
+        self.camera = camera
+        self.frame_no = frame_no
+        self.timestamp = timestamp
+        self.boxes = boxes
+        self.score = score
+
+    def __repr__(self) -> str:
+        return (
+            f"<MotionEvent {self.camera} #{self.frame_no} "
+            f"{len(self.boxes)} boxes score={self.score:.3f}>"
+        )
+
+
+def _analyse(
+    commands: "multiprocessing.Queue",
+    events: "multiprocessing.Queue",
+    poll_interval: float,
+) -> None:
+    """The loop of one pool worker: attach to the rings of the cameras it is
+    given, run each camera's detector on every new frame, and report motion.
+
+    A camera whose detector fails is logged and dropped, so it cannot take the
+    other cameras of the worker down with it."""
+    from .motion import MotionDetector
+
+    pending: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    cameras: Dict[str, Tuple[SharedFrameReader, MotionDetector]] = {}
+    try:
+        while True:
+            idle = True
+            for camera, (ring_name, options) in list(pending.items()):
+                try:
+                    reader = SharedFrameReader(ring_name)
+                except FileNotFoundError:
+                    # the publisher creates the ring with its first frame
+                    continue
+                del pending[camera]
+                try:
+                    detector = MotionDetector(**options)
+                except Exception:
+                    _Logger.exception(f"Cannot detect motion for {camera}")
+                    reader.close()
+                    continue
+                cameras[camera] = (reader, detector)
+
+            for camera, (reader, detector) in list(cameras.items()):
+                try:
+                    frame = reader.get(timeout=0)
+                except queue.Empty:
+                    continue
+                if frame is None:
+                    _Logger.info(f"{camera} stopped publishing; dropping it")
+                    del cameras[camera]
+                    reader.close()
+                    continue
+                idle = False
+                try:
+                    thresh = detector.detect_boxes(frame.array)
+                    # discard the result if the frame was overwritten meanwhile
+                    if frame.valid() and detector.boxes:
+                        assert thresh is not None
+                        events.put(
+                            MotionEvent(
+                                camera,
+                                frame.frame_no,
+                                frame.timestamp,
+                                detector.boxes,
+                                float(thresh.astype(bool).mean()),
+                            )
+                        )
+                except Exception:
+                    _Logger.exception(
+                        f"Motion detection failed for {camera}; dropping it"
+                    )
+                    del cameras[camera]
+                    del frame
+                    reader.close()
+                    continue
+                del frame
+
+            try:
+                command = commands.get(timeout=poll_interval if idle else 0)
+            except queue.Empty:
+                continue
+            if command is None:
+                return
+            action, camera, ring_name, options = command
+            if action == "add":
+                pending[camera] = (ring_name, options)
+            elif camera in cameras:
+                cameras.pop(camera)[0].close()
+            else:
+                pending.pop(camera, None)
+    finally:
+        for reader, _ in cameras.values():
+            reader.close()
+
+
+class MotionPool:
+    """
+    Runs [MotionDetector][wyzecam.motion.MotionDetector]s for many cameras on a
+    pool of worker processes, so motion detection is spread over every core
+    instead of contending for one interpreter's GIL.
+
+    Frames reach the workers through shared memory, published by a
+    [SharedFramePublisher][wyzecam.shared_ring.SharedFramePublisher] per camera,
+    so no image is ever pickled.  Each camera is assigned to one worker, which
+    keeps its detector, and with it the camera's background model, for as long
+    as the camera is in the pool; cameras are assigned to the worker with the
+    fewest.  Only frames with motion produce anything: a small
+    [MotionEvent][wyzecam.motion_pool.MotionEvent] on the pool's event queue.
+
+    ```python
+    with MotionPool() as pool:
+        for sess in sessions:
+            pool.watch(sess, width=640, height=360, analysis_width=320)
+        for event in pool:
+            print(event.camera, event.boxes)
+    ```
+
+    A worker that falls behind a camera skips to its newest frames (see
+    [SharedFrameReader][wyzecam.shared_ring.SharedFrameReader]), so a busy pool
+    analyses fewer frames rather than falling ever further behind.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        start_method: Optional[str] = None,
+        poll_interval: float = 0.005,
+    ) -> None:
+        """Construct a pool; call `start()`, or use it as a context manager.
+
+        :param processes: the number of worker processes; the number of CPUs if
+                          not specified.
+        :param start_method: the multiprocessing start method, e.g. "spawn";
+                             the platform's default if not specified.
+        :param poll_interval: how long an idle worker waits before checking its
+                              cameras for new frames again, in seconds.
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.poll_interval = poll_interval
+        self._context = multiprocessing.get_context(start_method)
+        self._events = self._context.Queue()
+        self._commands: List["multiprocessing.Queue"] = []
+        self._workers: List["multiprocessing.process.BaseProcess"] = []
+        self._assignments: Dict[str, int] = {}
+        self._publishers: Dict[str, SharedFramePublisher] = {}
+
+    def start(self) -> None:
+        assert not self._workers, "MotionPool already started!"
+        for _ in range(self.processes):
+            commands = self._context.Queue()
+            worker = self._context.Process(
+                target=_analyse,
+                args=(commands, self._events, self.poll_interval),
+                daemon=True,
+            )
+            worker.start()
+            self._commands.append(commands)
+            self._workers.append(worker)
+
+    def stop(self) -> None:
+        """Stop the workers, and any publishers started by `watch`."""
+        for publisher in self._publishers.values():
+            publisher.stop()
+        self._publishers = {}
+        for commands in self._commands:
+            commands.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._commands = []
+        self._workers = []
+        self._assignments = {}
+
+    def __enter__(self) -> "MotionPool":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add_camera(self, camera: str, ring_name: str, **options: Any) -> int:
+        """Start detecting motion in the frames of a shared frame ring.
+
+        :param camera: the name to report the camera's events with.
+        :param ring_name: the name of the
+                          [SharedFrameRing][wyzecam.shared_ring.SharedFrameRing]
+                          the camera's frames are published to; it may be created
+                          later.
+        :param options: the arguments of the camera's
+                        [MotionDetector][wyzecam.motion.MotionDetector].
+        :returns: the index of the worker the camera was assigned to.
+        """
+        assert self._workers, "MotionPool not started!"
+        assert camera not in self._assignments, f"{camera} already added"
+        loads = [0] * len(self._workers)
+        for worker in self._assignments.values():
+            loads[worker] += 1
+        worker = loads.index(min(loads))
+        self._assignments[camera] = worker
+        self._commands[worker].put(("add", camera, ring_name, options))
+        return worker
+
+    def remove_camera(self, camera: str) -> None:
+        worker = self._assignments.pop(camera)
+        self._commands[worker].put(("remove", camera, None, None))
+        publisher = self._publishers.pop(camera, None)
+        if publisher is not None:
+            publisher.stop()
+
+    def watch(
+        self,
+        session: "P2PSession",
+        camera: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        slots: int = 4,
+        **options: Any,
+    ) -> SharedFramePublisher:
+        """Publish the grayscale frames of `session` into shared memory, and
+        detect motion in them.
+
+        :param session: the session to watch.
+        :param camera: the name to report the camera's events with; its MAC
+                       address if not specified.
+        :param width: if specified, the width to scale published frames to.
+        :param height: if specified, the height to scale published frames to.
+        :param slots: the number of frames the shared ring holds.
+        :param options: the arguments of the camera's
+                        [MotionDetector][wyzecam.motion.MotionDetector].
+        :returns: the running publisher; it is stopped with the pool, or by
+                  `remove_camera`.
+        """
+        camera = camera or session.camera.mac
+        publisher = session.publish_shared_frames(
+            slots=slots, output_format="gray", width=width, height=height
+        )
+        self._publishers[camera] = publisher
+        self.add_camera(camera, publisher.name, **options)
+        return publisher
+
+    @property
+    def cameras(self) -> Dict[str, int]:
+        """The worker each camera is assigned to."""
+        return dict(self._assignments)
+
+    def get(self, timeout: Optional[float] = None) -> MotionEvent:
+        """Return the next motion event, waiting up to `timeout` seconds for it;
+        raises queue.Empty if none arrives, and RuntimeError if a worker has
+        died, since its cameras no longer report anything."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = 0.5
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            try:
+                return self._events.get(timeout=wait)
+            except queue.Empty:
+                self._check_workers()
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+    def _check_workers(self) -> None:
+        for i, worker in enumerate(self._workers):
+            if worker.exitcode is not None:
+                raise RuntimeError(
+                    f"MotionPool worker {i} exited with code {worker.exitcode}"
+                )
+
+    def __iter__(self) -> Iterator[MotionEvent]:
+        while self._workers:
+            try:
+                yield self.get(timeout=1)
+            except queue.Empty:
+                continue
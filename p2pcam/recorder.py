@@ -0,0 +1,352 @@
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+import datetime
+import io
+import logging
+import os
+import threading
+
+from .decoder import FrameData, codec_name, make_packet, pts_from_frameinfo
+from .tutk import tutk
+
+try:
+    import av
+except ImportError:
+    av = None
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+CONTAINER_FORMATS = {"mp4": "mp4", "mkv": "matroska"}
+"""The containers a [SegmentRecorder][wyzecam.recorder.SegmentRecorder] writes, by file extension"""
+
+
+class Segment:
+    """
+    A finished recording segment.
+
+    :var path: the path of the segment file.
+    :var codec_name: the codec of the video, "h264" or "hevc".
+    :var start: the timestamp of the first frame, in seconds.
+    :var end: the timestamp of the last frame, in seconds.
+    :var frames: the number of frames in the segment.
+    :var size: the size of the frame data in the segment, in bytes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        codec_name: str,
+        start: float,
+        end: float,
+        frames: int,
+        size: int,
+    ) -> None:
+        self.path = path
+        self.codec_name = codec_name
+        self.start = start
+        self.end = end
+        self.frames = frames
+        self.size = size
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return (
+            f"<Segment {self.path} {self.duration:.1f}s {self.frames} frames>"
+        )
+
+
+class SegmentWriter:
+    """
+    Writes one segment: a keyframe and the frames that follow it, remuxed into a
+    container file without decoding.  The file is written under a hidden
+    temporary name, and only renamed to `path` by `finish()`.
+
+    :var path: the final path of the segment file.
+    :var first_info: the frame info of the keyframe the segment starts with.
+    :var last_info: the frame info of the last frame written.
+    :var frames: the number of frames written.
+    :var size: the size of the frame data written, in bytes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        container: str,
+        keyframe: FrameData,
+        frame_info: tutk.FrameInfoStruct,
+    ) -> None:
+        """Open a new segment.
+
+        :param path: the path of the finished segment file.
+        :param container: "mp4" or "mkv".
+        :param keyframe: the keyframe the segment starts with; it is read for the
+                         stream parameters, but not written until `write`.
+        :param frame_info: the frame info of `keyframe`.
+        """
+        assert frame_info.is_keyframe, "a segment must start with a keyframe"
+        directory, name = os.path.split(path)
+        self.path = path
+        self.temp_path = os.path.join(directory, f".{name}.part")
+        self.codec_name = codec_name(frame_info)
+        self.output = av.open(
+            self.temp_path, "w", format=CONTAINER_FORMATS[container]
+        )
+        self.stream = add_stream_from_keyframe(
+            self.output, self.codec_name, keyframe
+        )
+        self.first_info = self.last_info = frame_info
+        self.start_pts = pts_from_frameinfo(frame_info)
+        self.last_pts = -1
+        self.frames = 0
+        self.size = 0
+
+    def write(
+        self, frame_data: FrameData, frame_info: tutk.FrameInfoStruct
+    ) -> None:
+        packet = make_packet(frame_data, frame_info)
+        pts = packet.pts - self.start_pts
+        if pts <= self.last_pts:
+            # the muxer needs increasing timestamps, even if the camera's
+            # clock steps backwards
+            pts = self.last_pts + 1
+        packet.pts = packet.dts = pts
+        packet.stream = self.stream
+        self.output.mux(packet)
+        self.last_pts = pts
+        self.last_info = frame_info
+        self.frames += 1
+        self.size += len(frame_data)
+
+    def elapsed(self, frame_info: tutk.FrameInfoStruct) -> float:
+        """The time from the start of the segment to `frame_info`, in seconds."""
+        return (pts_from_frameinfo(frame_info) - self.start_pts) / 1_000_000
+
+    def finish(self) -> Segment:
+        """Close the file, and move it into place."""
+        self.output.close()
+        with open(self.temp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(self.temp_path, self.path)
+        return Segment(
+            self.path,
+            self.codec_name,
+            self.first_info.timestamp_seconds,
+            self.last_info.timestamp_seconds,
+            self.frames,
+            self.size,
+        )
+
+
+def segment_filename(
+    template: str,
+    session: "P2PSession",
+    frame_info: tutk.FrameInfoStruct,
+    ext: str,
+) -> str:
+    """Format a segment file name; see [SegmentRecorder][wyzecam.recorder.SegmentRecorder]."""
+    return template.format(
+        mac=session.camera.mac,
+        p2p_id=session.camera.p2p_id,
+        start=datetime.datetime.fromtimestamp(frame_info.timestamp_seconds),
+        ext=ext,
+    )
+
+
+def unused_path(path: str) -> str:
+    """Return `path`, or, if a file already exists there, `path` with the first
+    free "-1", "-2", ... suffix, so a recording never overwrites another; file
+    names only resolve the start time to the second."""
+    root, ext = os.path.splitext(path)
+    n = 0
+    while os.path.exists(path):
+        n += 1
+        path = f"{root}-{n}{ext}"
+    return path
+
+
+class SegmentRecorder:
+    """
+    Records the video stream of a [P2PSession][wyzecam.iotc.P2PSession] into a
+    rolling series of MP4 or MKV files, without decoding or re-encoding it.
+
+    The camera's H.264/HEVC frames are remuxed as they are, with timestamps taken
+    from their [FrameInfoStruct][wyzecam.tutk.tutk.FrameInfoStruct], so recording
+    costs little more than copying the bytes.  A new segment is started at the
+    first keyframe after the current one reaches `segment_seconds` or
+    `segment_bytes`, or when the codec or frame size changes, so every segment
+    starts with a keyframe and plays on its own.  Each segment is written to a
+    hidden temporary file, and only renamed to its final name once complete.
+
+    ```python
+    with SegmentRecorder(sess, "/recordings/front-door", segment_seconds=300):
+        time.sleep(3600)
+    ```
+
+    Frames can also be fed with `write`, e.g. from a
+    [StreamHub][wyzecam.stream_hub.StreamHub] subscription, instead of having the
+    recorder receive them itself with `start`.
+
+    :var segments: the finished [Segment][wyzecam.recorder.Segment]s, oldest first.
+    :var skipped: the number of frames dropped while waiting for a keyframe to
+                  start a segment with.
+    """
+
+    def __init__(
+        self,
+        session: "P2PSession",
+        directory: str,
+        container: str = "mp4",
+        segment_seconds: Optional[float] = 60.0,
+        segment_bytes: Optional[int] = None,
+        filename: str = "{mac}-{start:%Y%m%d-%H%M%S}.{ext}",
+        on_segment: Optional[Callable[[Segment], None]] = None,
+    ) -> None:
+        """Construct a recorder; call `start()`, or use it as a context manager.
+
+        :param session: the session to record.
+        :param directory: the directory to write segments to; created if missing.
+        :param container: "mp4" or "mkv".
+        :param segment_seconds: if specified, the length of time after which to
+                                start a new segment.
+        :param segment_bytes: if specified, the size after which to start a new
+                              segment.
+        :param filename: the name of each segment file, formatted with the keys
+                         `mac`, `p2p_id`, `start` (a datetime) and `ext`;
+                         if that file exists, a "-1", "-2", ... suffix is added.
+        :param on_segment: if specified, called with each finished
+                           [Segment][wyzecam.recorder.Segment].
+        """
+        if av is None:
+            raise RuntimeError(
+                "SegmentRecorder requires PyAv to write video files. "
+                "Install with `pip install av` and try again."
+            )
+        assert (
+            container in CONTAINER_FORMATS
+        ), f"container must be one of {list(CONTAINER_FORMATS)}"
+        self.session = session
+        self.directory = directory
+        self.container = container
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.filename = filename
+        self.on_segment = on_segment
+        self.segments: List[Segment] = []
+        self.skipped = 0
+        self._writer: Optional[SegmentWriter] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> None:
+        assert self._thread is None, "SegmentRecorder already started!"
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._record, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop recording, and finish the current segment."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.close()
+
+    def __enter__(self) -> "SegmentRecorder":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _record(self) -> None:
+        try:
+            for frame_data, frame_info in self.session.recv_video_data(
+                stop=self._stopping
+            ):
+                self.write(frame_data, frame_info)
+        except Exception as e:
+            _Logger.warning(f"SegmentRecorder stopped: {e!r}")
+
+    def write(
+        self, frame_data: FrameData, frame_info: tutk.FrameInfoStruct
+    ) -> None:
+        """Add one received frame to the recording."""
+        with self._lock:
+            if frame_info.is_keyframe and self._should_cut(frame_info):
+                self._finish()
+            if self._writer is None:
+                if not frame_info.is_keyframe:
+                    self.skipped += 1
+                    return
+                name = segment_filename(
+                    self.filename, self.session, frame_info, self.container
+                )
+                self._writer = SegmentWriter(
+                    unused_path(os.path.join(self.directory, name)),
+                    self.container,
+                    frame_data,
+                    frame_info,
+                )
+            self._writer.write(frame_data, frame_info)
+
+    def close(self) -> None:
+        """Finish the current segment, if any; the next keyframe written starts a
+        new one."""
+        with self._lock:
+            self._finish()
+
+    def _should_cut(self, frame_info: tutk.FrameInfoStruct) -> bool:
+        writer = self._writer
+        if writer is None:
+            return False
+        first = writer.first_info
+        if (
+            frame_info.codec_id != first.codec_id
+            or frame_info.frame_size != first.frame_size
+        ):
+            return True
+        if self.segment_bytes is not None and writer.size >= self.segment_bytes:
+            return True
+        if self.segment_seconds is not None:
+            elapsed = writer.elapsed(frame_info)
+            if not 0 <= elapsed < self.segment_seconds:
+                return True
+        return False
+
+    def _finish(self) -> None:
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        segment = writer.finish()
+        self.segments.append(segment)
+        _Logger.debug(f"Finished {segment}")
+        if self.on_segment is not None:
+            self.on_segment(segment)
+
+
+def add_stream_from_keyframe(
+    output: "av.container.OutputContainer", codec: str, keyframe: FrameData
+) -> "av.video.stream.VideoStream":
+    """Add a video stream to `output` for remuxing frames of the stream `keyframe`
+    belongs to, without an encoder.
+
+    The stream parameters (dimensions, SPS/PPS extradata) come from the headers
+    in front of the keyframe, read by FFmpeg's raw bitstream demuxer.
+
+    :param output: the container to add the stream to.
+    :param codec: "h264" or "hevc".
+    :param keyframe: a keyframe of the stream, including its parameter sets.
+    """
+    with av.open(io.BytesIO(bytes(keyframe)), format=codec) as probe:
+        template = probe.streams.video[0]
+        if hasattr(output, "add_stream_from_template"):
+            return output.add_stream_from_template(template)
+        return output.add_stream(template=template)
@@ -0,0 +1,595 @@
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+
+import asyncio
+import base64
+import logging
+import random
+import struct
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+from .decoder import codec_name, pts_from_frameinfo
+from .gop_cache import GopCache
+from .tutk import tutk
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+RTP_PAYLOAD_TYPE = 96
+RTP_CLOCK_RATE = 90_000
+
+_H264_PARAMETER_SETS = {7: "sps", 8: "pps"}
+_HEVC_PARAMETER_SETS = {32: "vps", 33: "sps", 34: "pps"}
+_ACCESS_UNIT_DELIMITERS = {"h264": 9, "hevc": 35}
+
+RtpFrame = Tuple[List[bytes], int, bool]
+"""A packetized access unit: RTP payloads, 90 kHz timestamp, keyframe flag"""
+
+
+def split_nal_units(data: bytes) -> List[bytes]:
+    """Split an Annex B access unit into its NAL units, without start codes."""
+    units = []
+    start = data.find(b"\x00\x00\x01")
+    while start >= 0:
+        start += 3
+        end = data.find(b"\x00\x00\x01", start)
+        unit = data[start:] if end < 0 else data[start:end]
+        # a four-byte start code leaves a trailing zero on the previous unit
+        unit = unit.rstrip(b"\x00") if end >= 0 else unit
+        if unit:
+            units.append(unit)
+        start = end
+    return units
+
+
+def nal_unit_type(codec: str, unit: bytes) -> int:
+    if codec == "hevc":
+        return (unit[0] >> 1) & 0x3F
+    return unit[0] & 0x1F
+
+
+class RtpPacketizer:
+    """
+    Splits H.264 (RFC 6184) or HEVC (RFC 7798) access units into RTP payloads.
+
+    NAL units that fit in `mtu` bytes are sent in a single packet each; larger
+    ones are split into fragmentation units.  The payloads do not depend on the
+    RTP session, so a frame is packetized once and sent to every client, each
+    adding its own RTP header.
+    """
+
+    def __init__(self, codec: str, mtu: int = 1400) -> None:
+        assert codec in ("h264", "hevc"), "codec must be h264 or hevc"
+        self.codec = codec
+        self.mtu = mtu
+
+    def packetize(self, access_unit: bytes) -> List[bytes]:
+        payloads: List[bytes] = []
+        delimiter = _ACCESS_UNIT_DELIMITERS[self.codec]
+        for unit in split_nal_units(access_unit):
+            if nal_unit_type(self.codec, unit) == delimiter:
+                continue
+            if len(unit) <= self.mtu:
+                payloads.append(unit)
+            elif self.codec == "hevc":
+                payloads.extend(self._fragment_hevc(unit))
+            else:
+                payloads.extend(self._fragment_h264(unit))
+        return payloads
+
+    def _fragment_h264(self, unit: bytes) -> List[bytes]:
+        indicator = bytes([(unit[0] & 0xE0) | 28])
+        return self._fragment(indicator, unit[0] & 0x1F, unit[1:])
+
+    def _fragment_hevc(self, unit: bytes) -> List[bytes]:
+        header = bytes([(unit[0] & 0x81) | (49 << 1), unit[1]])
+        return self._fragment(header, (unit[0] >> 1) & 0x3F, unit[2:])
+
+    def _fragment(
+        self, header: bytes, nal_type: int, body: bytes
+    ) -> List[bytes]:
+        size = self.mtu - len(header) - 1
+        chunks = [body[i : i + size] for i in range(0, len(body), size)]
+        payloads = []
+        for i, chunk in enumerate(chunks):
+            fu_header = nal_type
+            if i == 0:
+                fu_header |= 0x80
+            if i == len(chunks) - 1:
+                fu_header |= 0x40
+            payloads.append(header + bytes([fu_header]) + chunk)
+        return payloads
+
+    def sdp_fmtp(self, keyframe: bytes) -> str:
+        """The `a=fmtp` attributes describing the stream `keyframe` belongs to,
+        taken from the parameter sets in front of it."""
+        if self.codec == "hevc":
+            sets: Dict[str, bytes] = {}
+            for unit in split_nal_units(keyframe):
+                name = _HEVC_PARAMETER_SETS.get(nal_unit_type("hevc", unit))
+                if name is not None:
+                    sets.setdefault(name, unit)
+            return ";".join(
+                f"sprop-{name}={base64.b64encode(unit).decode()}"
+                for name, unit in sets.items()
+            )
+        sps = pps = b""
+        for unit in split_nal_units(keyframe):
+            name = _H264_PARAMETER_SETS.get(nal_unit_type("h264", unit))
+            if name == "sps" and not sps:
+                sps = unit
+            elif name == "pps" and not pps:
+                pps = unit
+        fmtp = "packetization-mode=1"
+        if sps:
+            fmtp += f";profile-level-id={sps[1:4].hex().upper()}"
+            fmtp += ";sprop-parameter-sets=" + ",".join(
+                base64.b64encode(unit).decode() for unit in (sps, pps) if unit
+            )
+        return fmtp
+
+
+class _RtspMount:
+    """One camera served by an [RtspServer][wyzecam.rtsp.RtspServer]: receives
+    its stream once, and hands each packetized frame to every playing client."""
+
+    def __init__(
+        self,
+        server: "RtspServer",
+        session: "P2PSession",
+        gop_max_bytes: int,
+    ) -> None:
+        self.server = server
+        self.session = session
+        self.gop_cache = GopCache(gop_max_bytes)
+        self.packetizer: Optional[RtpPacketizer] = None
+        self.clients: List["_RtspClient"] = []
+        self._keyframe = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _receive(self) -> None:
+        try:
+            for frame_data, frame_info in self.session.recv_video_data(
+                copy=True, stop=self._stopping
+            ):
+                self.publish(frame_data, frame_info)  # type: ignore
+        except Exception as e:
+            _Logger.warning(f"RtspServer stopped receiving: {e!r}")
+
+    def publish(
+        self, frame_data: bytes, frame_info: tutk.FrameInfoStruct
+    ) -> None:
+        """Packetize a received frame, and queue it for every playing client."""
+        codec = codec_name(frame_info)
+        packetizer = self.packetizer
+        if packetizer is None or packetizer.codec != codec:
+            if not frame_info.is_keyframe:
+                return
+            packetizer = self.packetizer = RtpPacketizer(codec, self.server.mtu)
+        self.gop_cache.add(frame_data, frame_info)
+        if frame_info.is_keyframe:
+            self._keyframe.set()
+        frame = self._rtp_frame(frame_data, frame_info)
+        loop = self.server._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch, frame)
+
+    def _rtp_frame(
+        self, frame_data: bytes, frame_info: tutk.FrameInfoStruct
+    ) -> RtpFrame:
+        assert self.packetizer is not None
+        timestamp = pts_from_frameinfo(frame_info) * RTP_CLOCK_RATE // 1_000_000
+        return (
+            self.packetizer.packetize(frame_data),
+            timestamp,
+            bool(frame_info.is_keyframe),
+        )
+
+    def _dispatch(self, frame: RtpFrame) -> None:
+        for client in self.clients:
+            client.offer(frame)
+
+    async def wait_for_keyframe(self, timeout: float) -> Optional[bytes]:
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self._keyframe.wait, timeout):
+            return None
+        frames = self.gop_cache.frames()
+        return frames[0][0] if frames else None
+
+    def play(self, client: "_RtspClient") -> None:
+        """Start `client` with the cached GOP, so it begins at the latest
+        keyframe instead of waiting for the next one."""
+        if client in self.clients:
+            return
+        for frame_data, frame_info in self.gop_cache.frames():
+            client.offer(self._rtp_frame(frame_data, frame_info))
+        self.clients.append(client)
+
+    def remove(self, client: "_RtspClient") -> None:
+        if client in self.clients:
+            self.clients.remove(client)
+
+
+class _RtspClient:
+    """The RTP side of one RTSP session: a bounded queue of frames, and the task
+    sending them over interleaved TCP or UDP."""
+
+    def __init__(
+        self,
+        writer: asyncio.StreamWriter,
+        queue_size: int,
+        channel: Optional[int] = None,
+        udp: Optional[asyncio.DatagramTransport] = None,
+    ) -> None:
+        self.writer = writer
+        self.queue_size = queue_size
+        self.channel = channel
+        self.udp = udp
+        self.ssrc = random.getrandbits(32)
+        self.sequence = random.getrandbits(16)
+        self.timestamp_offset = random.getrandbits(32)
+        self.frames: Deque[RtpFrame] = deque()
+        self.dropped = 0
+        self._last_timestamp: Optional[int] = None
+        self._waiting_for_keyframe = True
+        self._ready = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def offer(self, frame: RtpFrame) -> None:
+        _, timestamp, is_keyframe = frame
+        if (
+            self._last_timestamp is not None
+            and timestamp <= self._last_timestamp
+        ):
+            # already queued from the GOP cache
+            return
+        self._last_timestamp = timestamp
+        if len(self.frames) >= self.queue_size:
+            # the client is not keeping up: skip ahead to the next keyframe
+            self.dropped += len(self.frames)
+            self.frames.clear()
+            self._waiting_for_keyframe = True
+        if self._waiting_for_keyframe and not is_keyframe:
+            self.dropped += 1
+            return
+        self._waiting_for_keyframe = False
+        self.frames.append(frame)
+        self._ready.set()
+
+    @property
+    def playing(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._send())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.udp is not None:
+            self.udp.close()
+
+    async def _send(self) -> None:
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.frames:
+                    self._send_frame(self.frames.popleft())
+                    if self.udp is None:
+                        # waits while the socket's send buffer is full, which
+                        # is what lets the queue above fill and overflow
+                        await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def _send_frame(self, frame: RtpFrame) -> None:
+        payloads, timestamp, _ = frame
+        timestamp = (timestamp + self.timestamp_offset) & 0xFFFFFFFF
+        for i, payload in enumerate(payloads):
+            marker = 0x80 if i == len(payloads) - 1 else 0
+            header = struct.pack(
+                ">BBHII",
+                0x80,
+                marker | RTP_PAYLOAD_TYPE,
+                self.sequence,
+                timestamp,
+                self.ssrc,
+            )
+            self.sequence = (self.sequence + 1) & 0xFFFF
+            if self.udp is not None:
+                self.udp.sendto(header + payload)
+            else:
+                size = len(header) + len(payload)
+                self.writer.write(
+                    struct.pack(">cBH", b"$", self.channel, size)
+                    + header
+                    + payload
+                )
+
+
+class RtspServer:
+    """
+    Restreams the video of one or more [P2PSession][wyzecam.iotc.P2PSession]s
+    over RTSP, for NVRs and players that do not speak the TUTK protocol.
+
+    Each session is served under its name, e.g. `rtsp://host:8554/front-door`,
+    and is received once, however many clients are playing it.  Frames are
+    packetized into RTP as they arrive, without decoding, and sent over
+    interleaved TCP or UDP, as each client asks in its SETUP.
+
+    Every client has its own queue of `queue_size` frames.  A client that falls
+    further behind than that has its queue emptied, and resumes at the next
+    keyframe, so it never slows the camera or the other clients down.  New
+    clients start with the GOP of the latest keyframe, so they can decode right
+    away.
+
+    ```python
+    server = RtspServer({"front-door": sess})
+    await server.start("0.0.0.0", 8554)
+    ```
+    """
+
+    def __init__(
+        self,
+        sessions: Dict[str, "P2PSession"],
+        queue_size: int = 60,
+        mtu: int = 1400,
+        gop_max_bytes: int = 8 * 1024 * 1024,
+        describe_timeout: float = 10.0,
+    ) -> None:
+        """Construct a server.
+
+        :param sessions: the sessions to serve, by name.
+        :param queue_size: the number of frames queued for each client before it
+                           is skipped ahead to the next keyframe.
+        :param mtu: the largest RTP payload sent, in bytes.
+        :param gop_max_bytes: the most frame data cached per camera to start new
+                              clients with; see
+                              [GopCache][wyzecam.gop_cache.GopCache].
+        :param describe_timeout: how long a DESCRIBE waits for the first
+                                 keyframe of a camera, in seconds.
+        """
+        self.mtu = mtu
+        self.queue_size = queue_size
+        self.describe_timeout = describe_timeout
+        self.mounts = {
+            name: _RtspMount(self, session, gop_max_bytes)
+            for name, session in sessions.items()
+        }
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._host = "127.0.0.1"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8554) -> None:
+        """Start receiving from the sessions, and serving RTSP on `port`."""
+        assert self._server is None, "RtspServer already started!"
+        self._loop = asyncio.get_running_loop()
+        self._host = host
+        for mount in self.mounts.values():
+            mount.start()
+        self._server = await asyncio.start_server(self._handle, host, port)
+
+    async def stop(self) -> None:
+        server, self._server = self._server, None
+        if server is None:
+            return
+        server.close()
+        await server.wait_closed()
+        loop = asyncio.get_running_loop()
+        for mount in self.mounts.values():
+            for client in mount.clients:
+                client.stop()
+            mount.clients = []
+            await loop.run_in_executor(None, mount.stop)
+
+    @property
+    def ports(self) -> List[int]:
+        """The ports the server is listening on."""
+        if self._server is None:
+            return []
+        return [sock.getsockname()[1] for sock in self._server.sockets]
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connection = _RtspConnection(self, reader, writer)
+        try:
+            await connection.serve()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connection.close()
+
+
+class _RtspConnection:
+    """One RTSP control connection, holding at most one RTSP session."""
+
+    def __init__(
+        self,
+        server: RtspServer,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.session_id = f"{random.getrandbits(64):016x}"
+        self.mount: Optional[_RtspMount] = None
+        self.client: Optional[_RtspClient] = None
+
+    async def serve(self) -> None:
+        while True:
+            first = await self.reader.readexactly(1)
+            if first == b"$":
+                # interleaved RTCP from the client; not used
+                _, size = struct.unpack(">BH", await self.reader.readexactly(3))
+                await self.reader.readexactly(size)
+                continue
+            request = first + await self.reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("utf-8", "replace").split("\r\n")
+            method, url, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                await self.reader.readexactly(int(headers["content-length"]))
+            status, extra, body = await self._request(method, url, headers)
+            self._respond(headers.get("cseq", "0"), status, extra, body)
+            if method == "PLAY" and status.startswith("200"):
+                self._play()
+
+    async def _request(
+        self, method: str, url: str, headers: Dict[str, str]
+    ) -> Tuple[str, Dict[str, str], bytes]:
+        if method == "OPTIONS":
+            return (
+                "200 OK",
+                {
+                    "Public": "OPTIONS, DESCRIBE, SETUP, PLAY, TEARDOWN, "
+                    "GET_PARAMETER"
+                },
+                b"",
+            )
+        if method == "GET_PARAMETER":
+            return "200 OK", {}, b""
+        mount = self._mount(url)
+        if mount is None:
+            return "404 Not Found", {}, b""
+        if method == "DESCRIBE":
+            keyframe = await mount.wait_for_keyframe(
+                self.server.describe_timeout
+            )
+            if keyframe is None or mount.packetizer is None:
+                return "503 Service Unavailable", {}, b""
+            base = url.rstrip("/") + "/"
+            return (
+                "200 OK",
+                {"Content-Base": base, "Content-Type": "application/sdp"},
+                self._sdp(mount.packetizer, keyframe).encode(),
+            )
+        if method == "SETUP":
+            return await self._setup(mount, headers.get("transport", ""))
+        if method == "PLAY":
+            if self.client is None:
+                return "455 Method Not Valid in This State", {}, b""
+            return "200 OK", {"Range": "npt=now-"}, b""
+        if method == "TEARDOWN":
+            self.close()
+            return "200 OK", {"Session": self.session_id}, b""
+        return "405 Method Not Allowed", {}, b""
+
+    def _mount(self, url: str) -> Optional[_RtspMount]:
+        path = urlparse(url).path.strip("/")
+        name = path.split("/")[0]
+        mount = self.server.mounts.get(name)
+        if mount is not None and self.mount is not None:
+            if mount is not self.mount:
+                return None
+        return mount
+
+    def _sdp(self, packetizer: RtpPacketizer, keyframe: bytes) -> str:
+        encoding = "H265" if packetizer.codec == "hevc" else "H264"
+        return "\r\n".join(
+            [
+                "v=0",
+                f"o=- {self.session_id} 1 IN IP4 {self.server._host}",
+                "s=p2pcam",
+                "c=IN IP4 0.0.0.0",
+                "t=0 0",
+                "a=control:*",
+                f"m=video 0 RTP/AVP {RTP_PAYLOAD_TYPE}",
+                f"a=rtpmap:{RTP_PAYLOAD_TYPE} {encoding}/{RTP_CLOCK_RATE}",
+                f"a=fmtp:{RTP_PAYLOAD_TYPE} {packetizer.sdp_fmtp(keyframe)}",
+                "a=control:trackID=0",
+                "",
+            ]
+        )
+
+    async def _setup(
+        self, mount: _RtspMount, transport: str
+    ) -> Tuple[str, Dict[str, str], bytes]:
+        if self.client is not None:
+            return "459 Aggregate Operation Not Allowed", {}, b""
+        params = dict(
+            p.split("=", 1) if "=" in p else (p, "")
+            for p in transport.split(";")
+        )
+        if "RTP/AVP/TCP" in transport:
+            channel = int(params.get("interleaved", "0-1").split("-")[0])
+            self.client = _RtspClient(
+                self.writer, self.server.queue_size, channel=channel
+            )
+            reply = f"RTP/AVP/TCP;unicast;interleaved={channel}-{channel + 1}"
+        elif "client_port" in params:
+            rtp_port = int(params["client_port"].split("-")[0])
+            peer = self.writer.get_extra_info("peername")[0]
+            loop = asyncio.get_running_loop()
+            udp, _ = await loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol,
+                local_addr=(self.server._host, 0),
+                remote_addr=(peer, rtp_port),
+            )
+            self.client = _RtspClient(
+                self.writer, self.server.queue_size, udp=udp  # type: ignore
+            )
+            server_port = udp.get_extra_info("sockname")[1]
+            reply = (
+                f"RTP/AVP;unicast;client_port={params['client_port']};"
+                f"server_port={server_port}-{server_port + 1}"
+            )
+        else:
+            return "461 Unsupported Transport", {}, b""
+        self.mount = mount
+        return (
+            "200 OK",
+            {
+                "Transport": f"{reply};ssrc={self.client.ssrc:08X}",
+                "Session": f"{self.session_id};timeout=60",
+            },
+            b"",
+        )
+
+    def _play(self) -> None:
+        assert self.mount is not None and self.client is not None
+        if self.client.playing:
+            # PLAY again, e.g. to resume; the client is already streaming
+            return
+        self.client.start()
+        self.mount.play(self.client)
+
+    def _respond(
+        self, cseq: str, status: str, headers: Dict[str, str], body: bytes
+    ) -> None:
+        lines = [f"RTSP/1.0 {status}", f"CSeq: {cseq}"]
+        if self.client is not None and "Session" not in headers:
+            headers["Session"] = self.session_id
+        lines.extend(f"{key}: {value}" for key, value in headers.items())
+        if body:
+            lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+
+    def close(self) -> None:
+        client, self.client = self.client, None
+        if client is not None:
+            client.stop()
+            if self.mount is not None:
+                self.mount.remove(client)
@@ -0,0 +1,533 @@
+from typing import TYPE_CHECKING, Any, Optional, Set, Tuple
+
+import logging
+import multiprocessing
+import secrets
+import threading
+import time
+from queue import Empty
+
+from .decoder import FrameDecoder, pts_from_frameinfo
+from .frame_convert import frame_to_ndarray
+from .tutk import tutk
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+_MAGIC = 0x70327063616D7231  # "p2pcamr1"
+_created: Set[str] = set()
+"""The names of the rings created by this process, or by its parent before a fork"""
+_HEADER_SIZE = 64
+_META_SIZE = 128
+_MAX_NDIM = 4
+
+# header fields, as uint64
+_H_MAGIC, _H_SLOTS, _H_SLOT_SIZE, _H_WRITE_SEQ, _H_ENDED = range(5)
+_HEADER_FIELDS = 5
+
+# slot metadata fields, as int64
+(
+    _M_SEQ,
+    _M_FRAME_NO,
+    _M_PTS,
+    _M_KEYFRAME,
+    _M_DTYPE,
+    _M_NBYTES,
+    _M_NDIM,
+    _M_SHAPE,
+) = range(8)
+
+
+def _slot_stride(slot_size: int) -> int:
+    return _META_SIZE + (slot_size + 63) // 64 * 64
+
+
+def _open(name: str) -> "shared_memory.SharedMemory":
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # before python 3.13, attaching registers the memory with the resource
+    # tracker, which unlinks it when the reader exits; only the writer owns it,
+    # so take the registration back.  Processes started by multiprocessing share
+    # their parent's tracker, and so, like the writer's own process, share the
+    # writer's registration, which must stay.
+    shm = shared_memory.SharedMemory(name=name)
+    if name not in _created and multiprocessing.parent_process() is None:
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore
+    return shm
+
+
+def _attach(name: str) -> Optional["shared_memory.SharedMemory"]:
+    """Attach to an existing ring, or return None if its writer is still setting
+    it up."""
+    try:
+        shm = _open(name)
+    except ValueError:
+        # created, but not sized yet
+        return None
+    header = np.ndarray((4,), dtype=np.uint64, buffer=shm.buf)
+    magic = int(header[_H_MAGIC])
+    del header
+    if magic == _MAGIC:
+        return shm
+    shm.close()
+    if magic != 0:
+        raise ValueError(f"{name} is not a SharedFrameRing")
+    return None
+
+
+class SharedFrame:
+    """
+    One frame read from a [SharedFrameReader][wyzecam.shared_ring.SharedFrameReader].
+
+    `array` is a read-only view straight into shared memory, so it is only good
+    until the writer wraps around the ring and reuses its slot.  Check `valid()`
+    after using it (or copy it first) to be sure it was not overwritten meanwhile.
+
+    :var seq: the sequence number of the frame; consecutive frames have consecutive
+              sequence numbers.
+    :var frame_no: the `frame_no` reported by the camera.
+    :var pts: the timestamp of the frame, in
+              [TIME_BASE][wyzecam.decoder.TIME_BASE] units.
+    :var is_keyframe: True if the frame was decoded from, or is, a keyframe.
+    :var array: the frame, as a numpy array.
+    """
+
+    def __init__(
+        self,
+        reader: "SharedFrameReader",
+        seq: int,
+        frame_no: int,
+        pts: int,
+        is_keyframe: bool,
+        array: "np.ndarray",
+    ) -> None:
+        self.reader = reader
+        self.seq = seq
+        self.frame_no = frame_no
+        self.pts = pts
+        self.is_keyframe = is_keyframe
+        self.array = array
+
+    @property
+    def timestamp(self) -> float:
+        """The timestamp of the frame, in fractional seconds."""
+        return self.pts / 1_000_000
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.array.shape
+
+    def valid(self) -> bool:
+        """False if the writer has started overwriting this frame's slot."""
+        return self.reader._slot_seq(self.seq) == self.seq
+
+
+class _SharedRingBase:
+    def __init__(self, shm: "shared_memory.SharedMemory") -> None:
+        self.shm = shm
+        self.header = np.ndarray(
+            (_HEADER_FIELDS,), dtype=np.uint64, buffer=shm.buf, offset=0
+        )
+        self.slots = int(self.header[_H_SLOTS])
+        self.slot_size = int(self.header[_H_SLOT_SIZE])
+        self.stride = _slot_stride(self.slot_size)
+        self.meta = [
+            np.ndarray(
+                (_META_SIZE // 8,),
+                dtype=np.int64,
+                buffer=shm.buf,
+                offset=_HEADER_SIZE + i * self.stride,
+            )
+            for i in range(self.slots)
+        ]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def write_seq(self) -> int:
+        """The sequence number of the last frame written; 0 before the first."""
+        return int(self.header[_H_WRITE_SEQ])
+
+    @property
+    def ended(self) -> bool:
+        """True once the writer will not write any more frames."""
+        return bool(self.header[_H_ENDED])
+
+    def _slot(self, seq: int) -> int:
+        return (seq - 1) % self.slots
+
+    def _slot_seq(self, seq: int) -> int:
+        return int(self.meta[self._slot(seq)][_M_SEQ])
+
+    def _data_offset(self, seq: int) -> int:
+        return _HEADER_SIZE + self._slot(seq) * self.stride + _META_SIZE
+
+    def close(self) -> None:
+        """Detach from the shared memory.  Any views into it must be gone first."""
+        self.meta = []
+        self.header = None
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SharedFrameRing(_SharedRingBase):
+    """
+    A ring of frames in shared memory, written by one process and read, without
+    copying, by any number of [SharedFrameReader][wyzecam.shared_ring.SharedFrameReader]s
+    in other processes.
+
+    Each of the `slots` slots holds one numpy array of up to `slot_size` bytes,
+    along with its `frame_no`, timestamp, keyframe flag, dtype and shape.  The
+    writer never waits for readers: once the ring is full, each new frame
+    overwrites the oldest.  Every frame gets the next sequence number, which
+    readers use to detect frames they missed, or that were overwritten while
+    they were reading them.
+
+    ```python
+    with SharedFrameRing("front-door", slots=8, slot_size=1920 * 1080 * 3) as ring:
+        for img, frame_info in sess.recv_video_frame_ndarray():
+            ring.put(img, frame_info)
+    ```
+
+    The ring owns the shared memory, and unlinks it when closed.  Readers stop
+    once the ring is closed, or `end()` is called, and they have read every frame
+    left in it.
+    """
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        slots: int = 8,
+        slot_size: int = 1920 * 1080 * 3,
+    ) -> None:
+        """Create a new ring.
+
+        :param name: the name readers attach with; a random name if not specified.
+        :param slots: the number of frames held.
+        :param slot_size: the largest frame that fits in the ring, in bytes.
+        """
+        if shared_memory is None or np is None:
+            raise RuntimeError(
+                "SharedFrameRing requires python 3.8+ and numpy. "
+                "Install with `pip install numpy` and try again."
+            )
+        assert slots > 0, "slots must be positive"
+        shm = shared_memory.SharedMemory(
+            name=name or f"p2pcam-{secrets.token_hex(4)}",
+            create=True,
+            size=_HEADER_SIZE + slots * _slot_stride(slot_size),
+        )
+        _created.add(shm.name)
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.uint64, buffer=shm.buf)
+        header[_H_SLOTS] = slots
+        header[_H_SLOT_SIZE] = slot_size
+        header[_H_WRITE_SEQ] = 0
+        header[_H_ENDED] = 0
+        header[_H_MAGIC] = _MAGIC
+        del header
+        super().__init__(shm)
+
+    def put(self, data: Any, frame_info: tutk.FrameInfoStruct) -> Optional[int]:
+        """Write a frame into the next slot, overwriting the oldest frame.
+
+        :param data: the frame, as a numpy array; or `bytes`, e.g. an encoded frame.
+        :param frame_info: the frame's metadata.
+        :returns: the sequence number of the frame, or None if it was larger than
+                  `slot_size` and was dropped.
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            array = np.frombuffer(data, dtype=np.uint8)
+        else:
+            array = np.asanyarray(data)
+        assert array.ndim <= _MAX_NDIM, f"at most {_MAX_NDIM} dimensions"
+        if array.nbytes > self.slot_size:
+            _Logger.warning(
+                f"Frame of {array.nbytes} bytes does not fit in a "
+                f"{self.slot_size} byte slot; dropped."
+            )
+            return None
+
+        seq = self.write_seq + 1
+        meta = self.meta[self._slot(seq)]
+        # readers check the sequence number before and after reading a slot, so
+        # invalidate it until the slot holds the new frame
+        meta[_M_SEQ] = 0
+        target = np.ndarray(
+            array.shape,
+            dtype=array.dtype,
+            buffer=self.shm.buf,
+            offset=self._data_offset(seq),
+        )
+        np.copyto(target, array)
+        del target
+        meta[_M_FRAME_NO] = frame_info.frame_no
+        meta[_M_PTS] = pts_from_frameinfo(frame_info)
+        meta[_M_KEYFRAME] = frame_info.is_keyframe
+        meta[_M_DTYPE] = ord(array.dtype.char)
+        meta[_M_NBYTES] = array.nbytes
+        meta[_M_NDIM] = array.ndim
+        meta[_M_SHAPE : _M_SHAPE + array.ndim] = array.shape
+        meta[_M_SEQ] = seq
+        self.header[_H_WRITE_SEQ] = seq
+        return seq
+
+    def end(self) -> None:
+        """Tell readers that no more frames will be written, so they stop once
+        they have read the frames in the ring."""
+        self.header[_H_ENDED] = 1
+
+    def close(self) -> None:
+        self.end()
+        super().close()
+        _created.discard(self.shm.name)
+        self.shm.unlink()
+
+
+class SharedFrameReader(_SharedRingBase):
+    """
+    Reads frames from a [SharedFrameRing][wyzecam.shared_ring.SharedFrameRing],
+    typically in another process, as zero-copy
+    [SharedFrame][wyzecam.shared_ring.SharedFrame]s.
+
+    A reader starts at the newest frame in the ring.  If it falls more than
+    `slots` frames behind the writer, it skips ahead to the oldest frame still in
+    the ring, and counts the frames it missed in `dropped`.
+
+    ```python
+    with SharedFrameReader("front-door") as reader:
+        while True:
+            frame = reader.get()
+            result = analyze(frame.array)
+            if frame.valid():
+                report(frame.frame_no, result)
+            del frame
+    ```
+
+    Views into shared memory must be released before the reader is closed.
+
+    :var next_seq: the sequence number of the next frame to read.
+    :var dropped: the number of frames overwritten before this reader got to them.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: Optional[float] = None,
+        poll_interval: float = 0.001,
+    ) -> None:
+        """Attach to a ring.
+
+        :param name: the name of the ring.
+        :param timeout: if specified, wait up to this many seconds for the ring to
+                        be created, instead of raising FileNotFoundError at once.
+        :param poll_interval: how often to check for a new frame, in seconds, when
+                              waiting for one.
+        """
+        if shared_memory is None or np is None:
+            raise RuntimeError(
+                "SharedFrameReader requires python 3.8+ and numpy. "
+                "Install with `pip install numpy` and try again."
+            )
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                shm = _attach(name)
+            except FileNotFoundError:
+                if deadline is None:
+                    raise
+                shm = None
+            if shm is not None:
+                break
+            if deadline is None or time.monotonic() > deadline:
+                raise FileNotFoundError(f"No SharedFrameRing named {name}")
+            time.sleep(poll_interval)
+        super().__init__(shm)
+        self.poll_interval = poll_interval
+        self.next_seq = max(self.write_seq, 1)
+        self.dropped = 0
+
+    def get(self, timeout: Optional[float] = None) -> Optional[SharedFrame]:
+        """Return the next frame, waiting for it if necessary.
+
+        :param timeout: the maximum number of seconds to wait, after which
+                        queue.Empty is raised.
+        :returns: the next frame, or None once the writer has ended the ring and
+                  every frame in it has been read.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # checked before write_seq, so no frame written before the end is
+            # missed
+            ended = self.ended
+            write_seq = self.write_seq
+            if self.next_seq <= write_seq:
+                oldest = write_seq - self.slots + 1
+                if self.next_seq < oldest:
+                    self.dropped += oldest - self.next_seq
+                    self.next_seq = oldest
+                frame = self._read(self.next_seq)
+                if frame is not None:
+                    self.next_seq += 1
+                    return frame
+                # overwritten as we read it; catch up with the writer
+                continue
+            if ended:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Empty()
+            time.sleep(self.poll_interval)
+
+    def _read(self, seq: int) -> Optional[SharedFrame]:
+        meta = self.meta[self._slot(seq)]
+        if meta[_M_SEQ] != seq:
+            return None
+        ndim = int(meta[_M_NDIM])
+        shape = tuple(int(n) for n in meta[_M_SHAPE : _M_SHAPE + ndim])
+        array = np.ndarray(
+            shape,
+            dtype=np.dtype(chr(meta[_M_DTYPE])),
+            buffer=self.shm.buf,
+            offset=self._data_offset(seq),
+        )
+        array.flags.writeable = False
+        frame = SharedFrame(
+            self,
+            seq,
+            int(meta[_M_FRAME_NO]),
+            int(meta[_M_PTS]),
+            bool(meta[_M_KEYFRAME]),
+            array,
+        )
+        if meta[_M_SEQ] != seq:
+            return None
+        return frame
+
+    def __iter__(self):
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+
+class SharedFramePublisher:
+    """
+    Publishes the video of a [P2PSession][wyzecam.iotc.P2PSession] into shared
+    memory from a background thread: decoded frames, as numpy arrays, into one
+    [SharedFrameRing][wyzecam.shared_ring.SharedFrameRing], and optionally the
+    encoded frames into another.
+
+    Consumers in other processes attach with a
+    [SharedFrameReader][wyzecam.shared_ring.SharedFrameReader], instead of having
+    every frame pickled through a `multiprocessing.Queue`.  The decoded ring is
+    created when the first frame has been decoded, sized to fit it; readers can
+    wait for it with the `timeout` argument of `SharedFrameReader`.
+
+    See: [wyzecam.iotc.P2PSession.publish_shared_frames][]
+
+    :var name: the name of the ring of decoded frames.
+    :var raw_name: the name of the ring of encoded frames, if any.
+    """
+
+    def __init__(
+        self,
+        session: "P2PSession",
+        name: Optional[str] = None,
+        slots: int = 8,
+        output_format: str = "bgr24",
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        interpolation: Optional[str] = None,
+        raw_slots: int = 0,
+        raw_slot_size: int = 1024 * 1024,
+    ) -> None:
+        assert output_format != "yuv420p", "a ring slot holds a single array"
+        self.session = session
+        self.name = name or f"p2pcam-{secrets.token_hex(4)}"
+        self.raw_name = f"{self.name}-raw" if raw_slots else None
+        self.slots = slots
+        self.output_format = output_format
+        self.width = width
+        self.height = height
+        self.interpolation = interpolation
+        self.ring: Optional[SharedFrameRing] = None
+        self.raw_ring: Optional[SharedFrameRing] = None
+        if self.raw_name is not None:
+            self.raw_ring = SharedFrameRing(
+                self.raw_name, raw_slots, raw_slot_size
+            )
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        assert self._thread is None, "SharedFramePublisher already started!"
+        self._thread = threading.Thread(target=self._publish, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop publishing, and unlink the rings."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for ring in (self.ring, self.raw_ring):
+            if ring is not None:
+                ring.close()
+        self.ring = self.raw_ring = None
+
+    def __enter__(self) -> "SharedFramePublisher":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _publish(self) -> None:
+        decoder = FrameDecoder()
+        try:
+            for frame_data, frame_info in self.session.recv_video_data(
+                stop=self._stopping
+            ):
+                if self.raw_ring is not None:
+                    self.raw_ring.put(frame_data, frame_info)
+                for frame, info in decoder.decode(frame_data, frame_info):
+                    img = frame_to_ndarray(
+                        frame,
+                        self.output_format,
+                        self.width,
+                        self.height,
+                        self.interpolation,
+                    )
+                    if self.ring is None:
+                        self.ring = SharedFrameRing(
+                            self.name, self.slots, img.nbytes
+                        )
+                    self.ring.put(img, info)
+        except Exception as e:
+            _Logger.warning(f"SharedFramePublisher stopped: {e!r}")
+        finally:
+            # rather than leave readers waiting for frames that never come
+            for ring in (self.ring, self.raw_ring):
+                if ring is not None:
+                    ring.end()
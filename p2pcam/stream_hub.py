@@ -0,0 +1,254 @@
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Tuple
+
+import logging
+import threading
+
+from .decoder import FrameDecoder
+from .frame_ring import FrameRing, OverflowPolicy
+from .tutk import tutk
+
+if TYPE_CHECKING:
+    from .iotc import P2PSession
+
+_Logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    One consumer of a [StreamHub][wyzecam.stream_hub.StreamHub].
+
+    Each subscription has its own bounded [FrameRing][wyzecam.frame_ring.FrameRing],
+    so a slow subscriber only ever drops its own frames.  Iterate over it to
+    receive frames, as `(frame_data, frame_info)` tuples for raw subscriptions or
+    `(av.VideoFrame, frame_info)` tuples for decoded ones.
+
+    :var decoded: True if this subscription receives decoded frames.
+    :var ring: the ring holding frames not yet consumed by this subscriber.
+    :var cursor: the `frame_no` of the last frame handed to this subscriber.
+    """
+
+    def __init__(
+        self,
+        hub: "StreamHub",
+        decoded: bool,
+        queue_size: int,
+        policy: OverflowPolicy,
+    ) -> None:
+        assert (
+            policy != OverflowPolicy.BLOCK
+        ), "a blocking subscriber would stall every other subscriber"
+        self.hub = hub
+        self.decoded = decoded
+        self.ring = FrameRing(queue_size, policy)
+        self.cursor: Optional[int] = None
+        self._replayed: List[bytes] = []
+
+    def get(
+        self, block: bool = True, timeout: Optional[float] = None
+    ) -> Optional[Tuple[Any, tutk.FrameInfoStruct]]:
+        """Return the next frame for this subscriber; see [FrameRing.get][wyzecam.frame_ring.FrameRing.get]."""
+        frame = self.ring.get(block, timeout)
+        if frame is not None:
+            self.cursor = frame[1].frame_no
+        return frame
+
+    def __iter__(self) -> Iterator[Tuple[Any, tutk.FrameInfoStruct]]:
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StreamHub:
+    """
+    Shares the video stream of one [P2PSession][wyzecam.iotc.P2PSession] between
+    any number of consumers.
+
+    A receive thread reads each encoded frame from the session once and hands the
+    same `bytes` object to every raw subscriber.  If any subscriber asked for
+    decoded frames, a single decode thread decodes the stream once and hands
+    each decoded frame to every decoded subscriber, so decoding never holds up
+    the raw subscribers and its cost does not grow with the number of viewers.
+    The decode thread stops when the last decoded subscriber leaves, or the hub
+    stops, and the next decoded subscriber starts a new one.
+
+    If the session keeps a [GopCache][wyzecam.gop_cache.GopCache], new subscribers
+    (and the decoder, when it starts) begin by replaying the cached GOP, so they
+    can decode right away instead of waiting for the next keyframe.
+
+    ```python
+    with StreamHub(sess) as hub:
+        recorder = hub.subscribe()
+        live_view = hub.subscribe(decoded=True)
+    ```
+    """
+
+    def __init__(self, session: "P2PSession") -> None:
+        self.session = session
+        self.subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._receive_thread: Optional[threading.Thread] = None
+        self._decode_thread: Optional[threading.Thread] = None
+        self._decoder_feed: Optional[Subscription] = None
+
+    def subscribe(
+        self,
+        decoded: bool = False,
+        queue_size: int = 30,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        replay_gop: bool = True,
+    ) -> Subscription:
+        """Add a subscriber to this hub.
+
+        :param decoded: receive decoded frames instead of raw frame data.
+        :param queue_size: the number of frames buffered for this subscriber.
+        :param policy: how to drop frames when this subscriber falls behind; `BLOCK`
+                       is not allowed, since it would stall every other subscriber.
+        :param replay_gop: start a raw subscriber with the session's cached GOP, if any.
+        :returns: a [Subscription][wyzecam.stream_hub.Subscription] to iterate over.
+        """
+        subscription = Subscription(self, decoded, queue_size, policy)
+        with self._lock:
+            if replay_gop and not decoded:
+                self._replay_gop(subscription)
+            self.subscribers = self.subscribers + [subscription]
+        if decoded:
+            self._ensure_decoder()
+        return subscription
+
+    def _replay_gop(self, subscription: Subscription) -> None:
+        # called with self._lock held, so no frame is published meanwhile
+        gop_cache = self.session.gop_cache
+        if gop_cache is None:
+            return
+        for frame_data, frame_info in gop_cache.frames():
+            subscription.ring.put(frame_data, frame_info)
+            subscription._replayed.append(frame_data)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self.subscribers = [
+                s for s in self.subscribers if s is not subscription
+            ]
+            last_decoded = subscription.decoded and not any(
+                s.decoded for s in self.subscribers
+            )
+        subscription.ring.close()
+        if last_decoded:
+            self._stop_decoder()
+
+    def start(self) -> None:
+        assert self._receive_thread is None, "StreamHub already started!"
+        self._stopping.clear()
+        self._receive_thread = threading.Thread(
+            target=self._receive, daemon=True
+        )
+        self._receive_thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        for subscription in self.subscribers:
+            subscription.ring.close()
+        for thread in (self._receive_thread, self._decode_thread):
+            if thread is not None:
+                thread.join()
+        self._receive_thread = None
+        # so the next decoded subscriber starts a new decoder
+        self._stop_decoder()
+
+    def __enter__(self) -> "StreamHub":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def publish(
+        self, frame_data: bytes, frame_info: tutk.FrameInfoStruct
+    ) -> None:
+        """Hand a raw frame to every raw subscriber."""
+        with self._lock:
+            for subscription in self.subscribers:
+                if subscription.decoded:
+                    continue
+                if subscription._replayed:
+                    # frames are cached before the hub publishes them, so the
+                    # tail of a replayed GOP may still be on its way here
+                    if any(f is frame_data for f in subscription._replayed):
+                        continue
+                    subscription._replayed = []
+                subscription.ring.put(frame_data, frame_info)
+
+    def _receive(self) -> None:
+        error: Optional[BaseException] = None
+        try:
+            for frame_data, frame_info in self.session.recv_video_data(
+                copy=True, stop=self._stopping
+            ):
+                self.publish(frame_data, frame_info)  # type: ignore
+        except Exception as e:
+            _Logger.warning(f"StreamHub stopped receiving: {e!r}")
+            error = e
+        for subscription in self.subscribers:
+            subscription.ring.close(error)
+
+    def _ensure_decoder(self) -> None:
+        with self._lock:
+            if self._decoder_feed is not None:
+                return
+            # only ever drop whole GOPs, so every frame decoded has its references
+            self._decoder_feed = Subscription(
+                self, False, 60, OverflowPolicy.DROP_GOP
+            )
+            self._replay_gop(self._decoder_feed)
+            self.subscribers = self.subscribers + [self._decoder_feed]
+            self._decode_thread = threading.Thread(
+                target=self._decode, args=(self._decoder_feed,), daemon=True
+            )
+            self._decode_thread.start()
+
+    def _stop_decoder(self) -> None:
+        with self._lock:
+            feed, self._decoder_feed = self._decoder_feed, None
+            thread, self._decode_thread = self._decode_thread, None
+            self.subscribers = [s for s in self.subscribers if s is not feed]
+        if feed is not None:
+            feed.ring.close()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _decode(self, feed: Subscription) -> None:
+        error: Optional[BaseException] = None
+        try:
+            decoder = FrameDecoder()
+            for frame_data, frame_info in feed:
+                for frame, info in decoder.decode(frame_data, frame_info):
+                    for subscription in self.subscribers:
+                        if subscription.decoded:
+                            subscription.ring.put(frame, info)
+        except Exception as e:
+            _Logger.warning(f"StreamHub stopped decoding: {e!r}")
+            error = e
+        with self._lock:
+            if feed is not self._decoder_feed:
+                # the last decoded subscriber left, and any decoded subscriber
+                # since then has a decoder of its own
+                return
+            subscribers = self.subscribers
+        for subscription in subscribers:
+            if subscription.decoded:
+                subscription.ring.close(error)
+        if error is not None:
+            # let the next decoded subscriber start over
+            self._stop_decoder()
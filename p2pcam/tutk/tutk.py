@@ -2,6 +2,7 @@ import typing
 from typing import Optional, Union
 
 import pathlib
+import threading
 from ctypes import (
     CDLL,
     Array,
@@ -85,6 +86,16 @@ AV_ER_LOSED_THIS_FRAME = -20014
 """/** The specified IOTC session ID is not valid */"""
 IOTC_ER_INVALID_SID = -14
 
+FRAME_DATA_MAX_LEN = 5 * 1024 * 1024
+"""
+The largest video frame, in bytes, that can be received by `av_recv_frame_data`.
+"""
+
+IOCTRL_DATA_MAX_LEN = 1024 * 1024
+"""
+The largest IOCtrl message, in bytes, that can be received by `av_recv_io_ctrl`.
+"""
+
 project_root = pathlib.Path(__file__).parent
 
 
@@ -219,6 +230,147 @@ class FrameInfoStruct(FormattedStructure):
         ("n_play_token", c_int32),
     ]
 
+    @property
+    def timestamp_seconds(self) -> float:
+        """The timestamp of the frame, in fractional seconds."""
+        return self.timestamp + self.timestamp_ms / 1_000_000
+
+
+class FrameBuffer:
+    """
+    A preallocated, reusable receive buffer for
+    [av_recv_frame_data_into][wyzecam.tutk.tutk.av_recv_frame_data_into].
+
+    All of the ctypes arguments passed to `avRecvFrameData2` are allocated once,
+    when the buffer is constructed, so receiving a frame into a `FrameBuffer`
+    does not allocate.  The payload is exposed as a `memoryview` over the
+    underlying storage, which is only valid until the buffer is released back
+    to its [FrameBufferPool][wyzecam.tutk.tutk.FrameBufferPool]; call
+    `tobytes()` if a copy needs to outlive the buffer.
+
+    :var frame_info: the [FrameInfoStruct][wyzecam.tutk.tutk.FrameInfoStruct]
+                     of the most recently received frame.
+    :var frame_index: the frame index of the most recently received frame.
+    :var max_len: the capacity of this buffer, in bytes.
+    """
+
+    def __init__(
+        self,
+        max_len: int = FRAME_DATA_MAX_LEN,
+        pool: Optional["FrameBufferPool"] = None,
+    ) -> None:
+        self.max_len = max_len
+        self.pool = pool
+        self._storage = bytearray(max_len)
+        self._view = memoryview(self._storage)
+        self._frame_data = (c_char * max_len).from_buffer(self._storage)
+        self._frame_data_actual_len = c_int()
+        self._frame_data_expected_len = c_int()
+        self._frame_info_actual_len = c_int()
+        self._frame_index = c_uint()
+        self.frame_info = FrameInfoStruct()
+        self._args = (
+            pointer(self._frame_data),
+            c_int(max_len),
+            pointer(self._frame_data_actual_len),
+            pointer(self._frame_data_expected_len),
+            pointer(self.frame_info),
+            c_int(sizeof(FrameInfoStruct)),
+            pointer(self._frame_info_actual_len),
+            pointer(self._frame_index),
+        )
+
+    @property
+    def frame_index(self) -> int:
+        return self._frame_index.value
+
+    def __len__(self) -> int:
+        return max(0, self._frame_data_actual_len.value)
+
+    @property
+    def data(self) -> memoryview:
+        """A zero-copy view of the payload of the most recently received frame."""
+        return self._view[: len(self)]
+
+    def tobytes(self) -> bytes:
+        """Copy the payload of the most recently received frame into `bytes`."""
+        return self._view[: len(self)].tobytes()
+
+    def release(self) -> None:
+        """Return this buffer to the pool it was acquired from, if any."""
+        if self.pool is not None:
+            self.pool.release(self)
+
+    def __enter__(self) -> "FrameBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class FrameBufferPool:
+    """
+    A thread-safe pool of [FrameBuffer][wyzecam.tutk.tutk.FrameBuffer]s.
+
+    `size` buffers are allocated up front; if more than that are checked out at
+    the same time, the pool grows rather than blocking, and the extra buffers
+    are kept for reuse once released.
+
+    :var allocated: the total number of buffers this pool has allocated.
+    """
+
+    def __init__(
+        self, size: int = 2, max_len: int = FRAME_DATA_MAX_LEN
+    ) -> None:
+        self.max_len = max_len
+        self._lock = threading.Lock()
+        self._free: typing.List[FrameBuffer] = [
+            FrameBuffer(max_len, self) for _ in range(size)
+        ]
+        self.allocated = size
+
+    def acquire(self) -> FrameBuffer:
+        """Check a buffer out of the pool, allocating one if none are free."""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.allocated += 1
+        return FrameBuffer(self.max_len, self)
+
+    def release(self, buffer: FrameBuffer) -> None:
+        """Return a buffer to the pool."""
+        with self._lock:
+            self._free.append(buffer)
+
+    @property
+    def available(self) -> int:
+        """The number of buffers currently free for reuse."""
+        return len(self._free)
+
+
+def av_recv_frame_data_into(
+    tutk_platform_av_lib: CDLL, av_chan_id: c_int, buffer: FrameBuffer
+) -> int:
+    """Receive frame data from an AV server into a preallocated buffer.
+
+    This is the allocation-free counterpart of
+    [av_recv_frame_data][wyzecam.tutk.tutk.av_recv_frame_data]; the payload,
+    frame info, and frame index are written into `buffer` instead of being
+    returned.
+
+    :param tutk_platform_lib: the c library loaded from the 'load_library' call.
+    :param av_chan_id: The channel ID of the AV channel to recv data on.
+    :param buffer: the [FrameBuffer][wyzecam.tutk.tutk.FrameBuffer] to receive into.
+    :return: the errno returned by avRecvFrameData2; 0 if a frame was received.
+    """
+    errno: int = tutk_platform_av_lib.avRecvFrameData2(
+        av_chan_id, *buffer._args
+    )
+    if errno < 0:
+        buffer._frame_data_actual_len.value = 0
+        return errno
+    return 0
+
 
 def av_recv_frame_data(
     tutk_platform_av_lib: CDLL, av_chan_id: c_int
@@ -233,7 +385,7 @@ def av_recv_frame_data(
     :param av_chan_id: The channel ID of the AV channel to recv data on.
     :return: a 4-tuple of errno, frame_data, frame_info, and frame_index
     """
-    frame_data_max_len = 5 * 1024 * 1024
+    frame_data_max_len = FRAME_DATA_MAX_LEN
     frame_data_actual_len = c_int()
     frame_data_expected_len = c_int()
     frame_data = (c_char * frame_data_max_len)()
@@ -281,7 +433,7 @@ def av_recv_io_ctrl(
               the io_ctrl_type, and the data in bytes)
     """
     pn_io_ctrl_type = c_uint()
-    ctl_data_len = 1024 * 1024
+    ctl_data_len = IOCTRL_DATA_MAX_LEN
     ctl_data = (c_char * ctl_data_len)()
     actual_len = tutk_platform_av_lib.avRecvIOCtrl(
         av_chan_id,
@@ -298,6 +450,64 @@ def av_recv_io_ctrl(
     )
 
 
+class IOCtrlBuffer:
+    """
+    A preallocated, reusable receive buffer for
+    [av_recv_io_ctrl_into][wyzecam.tutk.tutk.av_recv_io_ctrl_into].
+
+    Like a [FrameBuffer][wyzecam.tutk.tutk.FrameBuffer], every ctypes argument
+    of `avRecvIOCtrl` is allocated once, so waiting for IOCtrl messages, which
+    mostly means timing out again and again, does not allocate.  `view` is a
+    writable `memoryview` of the whole buffer, valid until the next receive.
+
+    :var io_ctrl_type: the IOCtrl type of the most recently received message.
+    :var max_len: the capacity of this buffer, in bytes.
+    """
+
+    def __init__(self, max_len: int = IOCTRL_DATA_MAX_LEN) -> None:
+        self.max_len = max_len
+        self.storage = bytearray(max_len)
+        self.view = memoryview(self.storage)
+        self._ctl_data = (c_char * max_len).from_buffer(self.storage)
+        self._io_ctrl_type = c_uint()
+        self._timeout_ms = c_int()
+        self._args = (
+            pointer(self._io_ctrl_type),
+            self._ctl_data,
+            c_int(max_len),
+            self._timeout_ms,
+        )
+
+    @property
+    def io_ctrl_type(self) -> int:
+        return self._io_ctrl_type.value
+
+
+def av_recv_io_ctrl_into(
+    tutk_platform_av_lib: CDLL,
+    av_chan_id: c_int,
+    buffer: IOCtrlBuffer,
+    timeout_ms: int,
+) -> int:
+    """Receive AV IO control into a preallocated buffer.
+
+    This is the allocation-free counterpart of
+    [av_recv_io_ctrl][wyzecam.tutk.tutk.av_recv_io_ctrl].
+
+    :param tutk_platform_lib: the c library loaded from the 'load_library' call.
+    :param av_chan_id: The channel ID of the AV channel to recv data on.
+    :param buffer: the [IOCtrlBuffer][wyzecam.tutk.tutk.IOCtrlBuffer] to receive
+                   into.
+    :param timeout_ms: the number of milliseconds to wait before timing out
+    :returns: the length of the io_ctrl received, or an error number.
+    """
+    buffer._timeout_ms.value = timeout_ms
+    actual_len: int = tutk_platform_av_lib.avRecvIOCtrl(
+        av_chan_id, *buffer._args
+    )
+    return actual_len
+
+
 def av_client_set_max_buf_size(tutk_platform_av_lib: CDLL, size: int) -> None:
     """Set the maximum video frame buffer used in AV client.
 
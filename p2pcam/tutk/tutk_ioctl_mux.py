@@ -1,9 +1,21 @@
-from typing import Any, DefaultDict, Dict, List, Optional, Tuple, Union
-
+from typing import (
+    Any,
+    Callable,
+    DefaultDict,
+    Deque,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import asyncio
+import concurrent.futures
 import logging
 import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from ctypes import CDLL, c_int
 from queue import Empty, Queue
 
@@ -32,28 +44,64 @@ class TutkIOCtrlFuture:
     def __init__(
         self,
         req: TutkWyzeProtocolMessage,
-        queue: Optional[
-            "Queue[Union[object, Tuple[int, int, int, bytes]]]"
-        ] = None,
         errcode: Optional[c_int] = None,
     ):
         self.req: TutkWyzeProtocolMessage = req
-        self.queue = queue
         self.expected_response_code = req.expected_response_code
         self.errcode: Optional[c_int] = errcode
         self.io_ctl_type: Optional[int] = None
         self.resp_protocol: Optional[int] = None
         self.resp_data: Optional[bytes] = None
+        self.deadline: Optional[float] = None
+        self._future: (
+            "concurrent.futures.Future[Tuple[int, int, int, bytes]]"
+        ) = concurrent.futures.Future()
+        if errcode:
+            self._future.set_exception(tutk.TutkError(errcode))
+        elif self.expected_response_code is None:
+            self._future.set_result((0, 0, 0, b""))
+
+    def _resolve(self, msg: Tuple[int, int, int, bytes]) -> None:
+        """Called by the listener with the response to this message."""
+        if not self._future.done():
+            self._future.set_result(msg)
+
+    def _fail(self, errcode: int) -> None:
+        """Called by the listener if no response can arrive any more."""
+        if not self._future.done():
+            self._future.set_exception(tutk.TutkError(errcode))
+
+    def cancel(self) -> bool:
+        """Stop waiting for the response.
+
+        The camera still answers the message, so the future keeps its place
+        among those waiting for the same code, and its response is discarded
+        when it arrives.
+
+        :returns: False if the response already arrived.
+        """
+        return self._future.cancel()
 
-    def result(self, block: bool = True, timeout: int = 10000) -> Optional[Any]:
+    def done(self) -> bool:
+        """True once the camera has responded, or the message has failed."""
+        return self._future.done()
+
+    def result(
+        self, block: bool = True, timeout: Optional[float] = 10.0
+    ) -> Optional[Any]:
         """
         Wait until the camera has responded to our message, and return the result.
 
+        The calling thread sleeps until the listener hands over the response,
+        so the result is available as soon as it arrives.
+
         :param block: wait until the camera has responded, or the timeout has been reached.
                       if False, returns immediately if we have already recieved a response,
                       otherwise raise queue.Empty.
-        :param timeout: the maximum number of milliseconds to wait for the response
-                        from the camera, after which queue.Empty will be raised.
+        :param timeout: the maximum number of seconds to wait for the response
+                        from the camera, after which queue.Empty will be raised;
+                        None to wait until the message expires, and
+                        tutk.TutkError is raised.
         :returns: the result of [`TutkWyzeProtocolMessage.parse_response`][wyzecam.tutk.tutk_protocol.TutkWyzeProtocolMessage.parse_response]
                   for the appropriate message.
         """
@@ -64,17 +112,15 @@ class TutkIOCtrlFuture:
         if self.expected_response_code is None:
             logger.warning("no response code!")
             return None
-        assert self.queue is not None, "Future created without error nor queue!"
 
-        msg = self.queue.get(block=block, timeout=timeout)
-        assert isinstance(
-            msg, tuple
-        ), "Expected a iotc result, instead got sentinel!"
+        if not block and not self._future.done():
+            raise Empty
+        try:
+            msg = self._future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise Empty from None
         actual_len, io_ctl_type, resp_protocol, data = msg
 
-        if actual_len < 0:
-            raise tutk.TutkError(self.errcode)
-
         self.io_ctl_type = io_ctl_type
         self.resp_protocol = resp_protocol
         self.resp_data = data
@@ -103,23 +149,60 @@ class TutkIOCtrlMux:
     This channel is used to authenticate the client with the camera prior to
     streaming audio or video data.
 
+    Responses carry the code of the message they answer, but nothing that tells
+    two messages with the same code apart, so the futures waiting for each
+    code form a queue, and the camera, which answers in order, answers its
+    head.  Sends are serialized, so the queue is always in the order the
+    messages went out, and commands may be pipelined freely, also with the
+    same code, from any number of threads.  A future that was cancelled, or whose
+    caller stopped waiting, keeps its place in the queue and discards its
+    response, so that response is not mistaken for that of a later message.
+    Only once no response has arrived `expire_after` seconds after sending is
+    a future given up on: it fails and leaves the queue.  Responses nobody is
+    waiting for are kept in `unclaimed`, up to the latest `max_unclaimed`.
+
     See: [wyzecam.iotc.WyzeIOTCSession.iotctrl_mux][]
     """
 
-    def __init__(self, tutk_platform_lib: CDLL, av_chan_id: c_int) -> None:
+    def __init__(
+        self,
+        tutk_platform_lib: CDLL,
+        av_chan_id: c_int,
+        expire_after: float = 60.0,
+        max_unclaimed: int = 32,
+    ) -> None:
         """Initialize the mux channel.
 
         :param tutk_platform_lib: the underlying c library used to communicate with the wyze
                                 device; see [tutk.load_library][wyzecam.tutk.tutk.load_library].
         :param av_chan_id: the channel id of the session this mux is created on.
+        :param expire_after: the number of seconds after which a message that
+                             has not been answered fails with
+                             `tutk.AV_ER_TIMEOUT`.
+        :param max_unclaimed: the number of unexpected responses to keep.
         """
         self.tutk_platform_lib = tutk_platform_lib
         self.av_chan_id = av_chan_id
+        self.expire_after = expire_after
         self.queues: DefaultDict[
             Union[str, int], "Queue[Union[object, Tuple[int, int, int, bytes]]]"
         ] = defaultdict(Queue)
+        self.waiters: DefaultDict[int, Deque[TutkIOCtrlFuture]] = defaultdict(
+            deque
+        )
+        self.unclaimed: Deque[Tuple[int, Tuple[int, int, int, bytes]]] = deque(
+            maxlen=max_unclaimed
+        )
+        self._waiters_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed_errcode: Optional[int] = None
         self.listener = TutkIOCtrlMuxListener(
-            tutk_platform_lib, av_chan_id, self.queues
+            tutk_platform_lib,
+            av_chan_id,
+            self.queues,
+            self._dispatch,
+            self._expire,
+            self._fail_waiters,
         )
 
     def start_listening(self) -> None:
@@ -155,6 +238,15 @@ class TutkIOCtrlMux:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop_listening()
 
+    async def __aenter__(self):
+        self.start_listening()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # joining the listener can take up to its receive timeout
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.stop_listening)
+
     def send_ioctl(
         self,
         msg: TutkWyzeProtocolMessage,
@@ -184,22 +276,126 @@ class TutkIOCtrlMux:
                 encoded_msg[0:16]
             )
         )
-        logger.debug("SEND", msg, encoded_msg_header, encoded_msg[16:])
-        errcode = tutk.av_send_io_ctrl(
-            self.tutk_platform_lib, self.av_chan_id, ctrl_type, encoded_msg
-        )
-        if errcode:
-            return TutkIOCtrlFuture(msg, errcode=errcode)
-        if not msg.expected_response_code:
+        logger.debug(f"SEND {msg} {encoded_msg_header} {encoded_msg[16:]!r}")
+        future = TutkIOCtrlFuture(msg)
+        code = msg.expected_response_code
+        if code:
+            self._expire()
+        else:
             logger.warning("no expected response code found")
-            return TutkIOCtrlFuture(msg)
 
-        return TutkIOCtrlFuture(msg, self.queues[msg.expected_response_code])
+        # futures are queued in the order their messages are sent, which is
+        # the order the camera answers them in
+        with self._send_lock:
+            if code:
+                # registered before sending, so even an instant response
+                # finds it
+                with self._waiters_lock:
+                    if self._closed_errcode is not None:
+                        # the listener has stopped; no response would be seen
+                        return TutkIOCtrlFuture(
+                            msg, errcode=self._closed_errcode
+                        )
+                    future.deadline = time.monotonic() + self.expire_after
+                    self.waiters[code].append(future)
+
+            errcode = tutk.av_send_io_ctrl(
+                self.tutk_platform_lib, self.av_chan_id, ctrl_type, encoded_msg
+            )
+            if errcode:
+                self._discard(future)
+                return TutkIOCtrlFuture(msg, errcode=errcode)
+        return future
+
+    async def send(
+        self,
+        msg: TutkWyzeProtocolMessage,
+        timeout: Optional[float] = 10.0,
+        ctrl_type: int = tutk.IOTYPE_USER_DEFINED_START,
+    ) -> Any:
+        """
+        Send a message to the camera, and wait for its response without blocking
+        the event loop.
+
+        The asyncio counterpart of `send_ioctl(msg).result()`: the listener
+        thread hands the response to the event loop with
+        `loop.call_soon_threadsafe`, so any number of commands, on any number
+        of sessions, can be awaited at once from one loop:
+
+        ```python
+        async with session.iotctrl_mux() as mux:
+            info, night = await asyncio.gather(
+                mux.send(K10020CheckCameraInfo()), mux.send(K10620CheckNight())
+            )
+        ```
+
+        If the command times out or is cancelled, its response is discarded
+        when it arrives, so it is not mistaken for that of a later command.
+
+        :param msg: the message to send; see `send_ioctl`.
+        :param timeout: the maximum number of seconds to wait for the response,
+                        after which asyncio.TimeoutError is raised; None to wait
+                        forever.
+        :param ctrl_type: see `send_ioctl`.
+        :returns: the result of [`TutkWyzeProtocolMessage.parse_response`][wyzecam.tutk.tutk_protocol.TutkWyzeProtocolMessage.parse_response]
+                  for the message.
+        """
+        future = self.send_ioctl(msg, ctrl_type)
+        # on timeout or cancellation, the future is cancelled with the awaited
+        # wrapper, and stays queued to absorb the late response
+        await asyncio.wait_for(asyncio.wrap_future(future._future), timeout)
+        return future.result(block=False)
+
+    def _discard(self, future: TutkIOCtrlFuture) -> None:
+        """Remove the future of a message that could not be sent."""
+        code = future.expected_response_code
+        if code:
+            with self._waiters_lock:
+                try:
+                    self.waiters[code].remove(future)
+                except ValueError:
+                    pass
+
+    def _dispatch(self, code: int, msg: Tuple[int, int, int, bytes]) -> None:
+        """Hand a response to the oldest future waiting for its code."""
+        self._expire()
+        with self._waiters_lock:
+            waiters = self.waiters.get(code)
+            future = waiters.popleft() if waiters else None
+        if future is not None:
+            if future.done():
+                logger.debug(f"Discarding response to cancelled {future}")
+            future._resolve(msg)
+        else:
+            logger.debug(f"Unclaimed response with code {code}")
+            self.unclaimed.append((code, msg))
+
+    def _expire(self) -> None:
+        """Give up on the futures that have waited too long."""
+        now = time.monotonic()
+        expired = []
+        with self._waiters_lock:
+            for waiters in self.waiters.values():
+                # futures are queued in the order of their deadlines
+                while waiters and waiters[0].deadline <= now:  # type: ignore
+                    expired.append(waiters.popleft())
+        for future in expired:
+            future._fail(tutk.AV_ER_TIMEOUT)
+
+    def _fail_waiters(self, errcode: int) -> None:
+        """Fail every pending future, and every later one, once the listener
+        has stopped receiving because of `errcode`."""
+        with self._waiters_lock:
+            self._closed_errcode = errcode
+            pending = [f for waiters in self.waiters.values() for f in waiters]
+            self.waiters.clear()
+        for future in pending:
+            future._fail(errcode)
 
     def waitfor(
         self,
         futures: Union[TutkIOCtrlFuture, List[TutkIOCtrlFuture]],
-        timeout: Optional[int] = None,
+        timeout: Optional[float] = None,
     ) -> Union[Any, List[Any]]:
         """Wait for the responses of one or more `TutkIOCtrlFuture`s.
 
@@ -213,7 +409,9 @@ class TutkIOCtrlMux:
 
         This allows you to wait for a set of `TutkIOCtrlFuture`s to respond in
         any order, and allows you to send multiple commands to the camera without
-        waiting for each one to return before sending another.
+        waiting for each one to return before sending another.  The call returns
+        as soon as the last response arrives, or after `timeout` seconds, in which
+        case the results of the futures that have not responded are None.
 
         If you are sending one command at a time, consider using
         `TutkIOCtrlFuture.result()` directly:
@@ -230,30 +428,41 @@ class TutkIOCtrlMux:
         if isinstance(futures, TutkIOCtrlFuture):
             futures = [futures]
             unwrap_single_item = True
-        results = [None] * len(futures)
-        start = time.time()
-        while (timeout is None or time.time() - start <= timeout) and any(
-            result is None for result in results
-        ):
-            all_success = True
-            for i, future in enumerate(futures):
-                if results[i] is not None:
-                    continue
-
-                try:
-                    result = future.result(block=False)
-                    results[i] = result
-                except Empty:
-                    all_success = False
-            # if we don't get all of them this pass, wait a short period before checking again
-            if not all_success:
-                time.sleep(0.1)
+        concurrent.futures.wait(
+            [future._future for future in futures], timeout=timeout
+        )
+        results = [
+            future.result(block=False) if future.done() else None
+            for future in futures
+        ]
 
         if unwrap_single_item:
             return results[0]
         else:
             return results
 
+    def gather(
+        self,
+        msgs: Sequence[TutkWyzeProtocolMessage],
+        timeout: Optional[float] = None,
+        ctrl_type: int = tutk.IOTYPE_USER_DEFINED_START,
+    ) -> List[Any]:
+        """Send several messages at once, and wait for all of their responses.
+
+        ```python
+        with session.ioctrl_mux() as mux:
+            info, night = mux.gather([K10020CheckCameraInfo(), K10620CheckNight()])
+        ```
+
+        :param msgs: the messages to send, in order.
+        :param timeout: the maximum number of seconds to wait for the responses.
+        :param ctrl_type: see `send_ioctl`.
+        :returns: the results of the messages, in the order they were given; see
+                  `waitfor`.
+        """
+        futures = [self.send_ioctl(msg, ctrl_type) for msg in msgs]
+        return self.waitfor(futures, timeout)
+
 
 class TutkIOCtrlMuxListener(threading.Thread):
     def __init__(
@@ -263,15 +472,27 @@ class TutkIOCtrlMuxListener(threading.Thread):
         queues: DefaultDict[
             Union[int, str], "Queue[Union[object, Tuple[int, int, int, bytes]]]"
         ],
+        dispatch: Callable[[int, Tuple[int, int, int, bytes]], None],
+        expire: Callable[[], None],
+        fail: Callable[[int], None],
     ):
         super().__init__()
         self.tutk_platform_lib = tutk_platform_lib
         self.av_chan_id = av_chan_id
         self.queues = queues
+        self.dispatch = dispatch
+        self.expire = expire
+        self.fail = fail
 
     def run(self) -> None:
         timeout_ms = 1000
         logger.info(f"Now listening on channel id {self.av_chan_id}")
+        # one buffer for the lifetime of the channel, with the header read in
+        # place; only the payloads of actual messages are copied out of it
+        buffer = tutk.IOCtrlBuffer()
+        header = tutk_protocol.TutkWyzeProtocolHeader.from_buffer(
+            buffer.storage
+        )
 
         while True:
             try:
@@ -286,20 +507,36 @@ class TutkIOCtrlMuxListener(threading.Thread):
             except Empty:
                 pass
 
-            actual_len, io_ctl_type, data = tutk.av_recv_io_ctrl(
-                self.tutk_platform_lib, self.av_chan_id, timeout_ms
+            actual_len = tutk.av_recv_io_ctrl_into(
+                self.tutk_platform_lib, self.av_chan_id, buffer, timeout_ms
             )
             if actual_len == tutk.AV_ER_TIMEOUT:
+                self.expire()
                 continue
-            elif actual_len == tutk.AV_ER_SESSION_CLOSE_BY_REMOTE:
-                logger.warning(
-                    "Connection closed by remote. Closing connection."
-                )
+            elif actual_len < 0:
+                if actual_len == tutk.AV_ER_SESSION_CLOSE_BY_REMOTE:
+                    logger.warning(
+                        "Connection closed by remote. Closing connection."
+                    )
+                else:
+                    logger.warning(
+                        f"avRecvIOCtrl failed with {actual_len}. "
+                        "Closing connection."
+                    )
+                self.fail(actual_len)
                 break
 
-            header, payload = tutk_protocol.decode(data)
+            try:
+                tutk_protocol.check_header(header, actual_len)
+            except tutk_protocol.TutkWyzeProtocolError as e:
+                logger.warning(f"Ignoring malformed IOCtrl message: {e}")
+                continue
+            payload = (
+                buffer.view[16:actual_len].tobytes() if header.txt_len else None
+            )
             logger.debug(f"RECV {header}: {repr(payload)}")
 
-            self.queues[header.code].put(
-                (actual_len, io_ctl_type, header.protocol, payload)
+            self.dispatch(
+                header.code,
+                (actual_len, buffer.io_ctrl_type, header.protocol, payload),
             )
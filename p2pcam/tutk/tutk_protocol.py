@@ -375,24 +375,38 @@ def decode(buf):
         raise TutkWyzeProtocolError("IOCtrl message too short")
 
     header = TutkWyzeProtocolHeader.from_buffer_copy(buf)
+    check_header(header, len(buf))
+
+    data = None
+    if header.txt_len > 0:
+        data = buf[16 : header.txt_len + 16]
+    return header, data
+
+
+def check_header(header: TutkWyzeProtocolHeader, msg_len: int) -> None:
+    """Validate the header of a received message of `msg_len` bytes, raising
+    [TutkWyzeProtocolError][wyzecam.tutk.tutk_protocol.TutkWyzeProtocolError]
+    if it is malformed.
+
+    Use this with a header mapped onto a receive buffer by
+    `TutkWyzeProtocolHeader.from_buffer`, to read messages without copying
+    their headers.
+    """
+    if msg_len < 16:
+        raise TutkWyzeProtocolError("IOCtrl message too short")
 
     if header.prefix != b"HL":
         raise TutkWyzeProtocolError(
             "IOCtrl message begin with the prefix (Expected 'HL')"
         )
 
-    if header.txt_len + 16 != len(buf):
+    if header.txt_len + 16 != msg_len:
         raise TutkWyzeProtocolError(
             f"Encoded length doesn't match message size "
             f"(header says {header.txt_len + 16}, "
-            f"got message of len {len(buf)}"
+            f"got message of len {msg_len}"
         )
 
-    data = None
-    if header.txt_len > 0:
-        data = buf[16 : header.txt_len + 16]
-    return header, data
-
 
 def respond_to_ioctrl_10001(
     data: bytes,
@@ -0,0 +1,59 @@
+import random
+
+from p2pcam.activity import FrameSizeActivity, FrameSizeBaseline
+from p2pcam.decoder import FrameDecoder
+from p2pcam.mock.mock_tutk_library import encode_test_video  # type: ignore
+from p2pcam.tutk import tutk
+
+
+def frame_info(i: int, frame_len: int) -> tutk.FrameInfoStruct:
+    micros = i * 50_000
+    return tutk.FrameInfoStruct(
+        codec_id=78,
+        is_keyframe=i % 20 == 0,
+        timestamp=1_600_000_000 + micros // 1_000_000,
+        timestamp_ms=micros % 1_000_000,
+        frame_len=frame_len,
+        frame_no=i,
+    )
+
+
+def test_baseline_flags_jumps() -> None:
+    rng = random.Random(0)
+    baseline = FrameSizeBaseline()
+    flagged = [baseline.update(rng.randint(900, 1100)) for _ in range(200)]
+    assert not any(flagged)
+    assert 950 < baseline.mean < 1050
+    assert baseline.update(5000)
+    assert not baseline.update(1000)
+
+
+def test_activity_selects_only_around_motion() -> None:
+    rng = random.Random(0)
+    activity = FrameSizeActivity(hold=1.0)
+    # motion from frame 205 to 214, at 20 frames per second
+    sizes = [
+        rng.randint(4000, 6000) if 205 <= i < 215 else rng.randint(900, 1100)
+        for i in range(400)
+    ]
+    selected = [
+        i for i, size in enumerate(sizes) if activity.wants(frame_info(i, size))
+    ]
+    # the half second of motion, and the second after its last frame
+    assert selected == list(range(205, 234))
+    assert activity.selected == 29
+    assert not activity.active
+
+
+def test_decoder_decodes_only_selected_frames() -> None:
+    frames = encode_test_video(60, framerate=20, gop_size=20)
+    activity = FrameSizeActivity(FrameSizeBaseline(warmup=5), hold=0.22)
+    decoder = FrameDecoder(selection=activity)
+    decoded = []
+    for i, (frame_data, info) in enumerate(frames):
+        # pretend frames 45 and 46 are much larger than usual
+        info.frame_len = 50_000 if i in (45, 46) else 1000
+        decoded.extend(
+            info.frame_no for _, info in decoder.decode(frame_data, info)
+        )
+    assert decoded == [45, 46, 47, 48, 49, 50]
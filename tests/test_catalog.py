@@ -0,0 +1,76 @@
+import pytest
+from p2pcam.catalog import ArchiveCatalog
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+from p2pcam.recorder import SegmentRecorder
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    session = mock_session(MockTutkLibrary())
+    catalog = ArchiveCatalog(str(tmp_path / "catalog.db"))
+    recorder = SegmentRecorder(
+        session,
+        str(tmp_path),
+        segment_seconds=2.0,
+        on_segment=catalog.indexer(session),
+    )
+    try:
+        for frame in encode_test_video(100, framerate=20, gop_size=10):
+            recorder.write(*frame)
+        recorder.close()
+    finally:
+        P2PPlatform.unload_Platform()
+    yield catalog, recorder.segments, session.camera.mac
+    catalog.close()
+
+
+def test_seek_finds_the_keyframe_before(catalog) -> None:
+    catalog, segments, mac = catalog
+    start = segments[0].start
+
+    point = catalog.seek(mac, start + 2.75)
+    assert point.path == segments[1].path
+    assert point.time == pytest.approx(start + 2.5)
+    assert point.offset > 0
+
+    assert catalog.seek(mac, start - 1) is None
+    assert catalog.seek(mac, segments[-1].end + 1) is None
+    assert catalog.seek("ffffffffffff", start + 1) is None
+    overlapping = catalog.segments(mac, start + 1.9, start + 2.1)
+    assert [s.path for s in overlapping] == [s.path for s in segments[:2]]
+
+
+def test_frames_around(catalog) -> None:
+    catalog, segments, mac = catalog
+    t = segments[0].start + 3.0
+    frames = list(catalog.frames_around(mac, t, before=0.2, after=0.2))
+    assert [round(ts - t, 2) for _, ts in frames] == [
+        -0.2,
+        -0.15,
+        -0.1,
+        -0.05,
+        0.0,
+        0.05,
+        0.1,
+        0.15,
+        0.2,
+    ]
+
+
+def test_markers(catalog) -> None:
+    catalog, segments, mac = catalog
+    start = segments[0].start
+    catalog.add_marker(mac, start + 1, start + 2)
+    catalog.add_marker(mac, start + 4, kind="doorbell")
+
+    markers = catalog.markers(mac, start, start + 5)
+    assert [m.start - start for m in markers] == [1, 4]
+    [marker] = catalog.markers(mac, start + 1.5, start + 5, kind="motion")
+    assert marker.end == start + 2
+    assert catalog.remove_segments(start + 4.5) == 2
+    assert catalog.seek(mac, start + 1) is None
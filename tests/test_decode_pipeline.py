@@ -0,0 +1,31 @@
+import time
+
+from p2pcam.decode_pipeline import DecodePipeline
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+
+
+def test_pipeline_decodes_and_converts() -> None:
+    lib = MockTutkLibrary()
+    start = time.monotonic()
+    for i, frame in enumerate(encode_test_video(20, framerate=50)):
+        lib.push_frame(*frame, available_at=start + i / 50)
+    try:
+        session = mock_session(lib)
+        with DecodePipeline(session, thread_type="SLICE") as pipeline:
+            frames = []
+            for img, frame_info in pipeline:
+                frames.append(frame_info.frame_no)
+                if len(frames) == 15:
+                    break
+            stats = pipeline.stats()
+    finally:
+        P2PPlatform.unload_Platform()
+    assert img.shape == (48, 64, 3)
+    assert frames == list(range(15))
+    assert stats["receive"]["dropped"] == 0
+    assert stats["convert"]["frames"] >= 15
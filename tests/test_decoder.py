@@ -0,0 +1,76 @@
+import pytest
+from p2pcam.decoder import (
+    EveryNthFrame,
+    FrameDecoder,
+    FrameInterval,
+    KeyframesOnly,
+    pts_from_frameinfo,
+)
+from p2pcam.mock.mock_tutk_library import encode_test_video  # type: ignore
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return encode_test_video(30, framerate=20, gop_size=10)
+
+
+def _decoded_frame_nos(decoder, frames):
+    return [
+        info.frame_no
+        for frame_data, frame_info in frames
+        for _, info in decoder.decode(frame_data, frame_info)
+    ]
+
+
+def test_keyframes_only(frames) -> None:
+    assert _decoded_frame_nos(FrameDecoder(KeyframesOnly()), frames) == [
+        0,
+        10,
+        20,
+    ]
+
+
+def test_every_nth_frame(frames) -> None:
+    decoder = FrameDecoder(EveryNthFrame(7))
+    assert _decoded_frame_nos(decoder, frames) == [0, 7, 14, 21, 28]
+
+
+def test_frame_interval_matches_full_decode(frames) -> None:
+    selected = FrameDecoder(FrameInterval(250))
+    selected_frames = [
+        (info.frame_no, frame.to_ndarray(format="gray"))
+        for frame_data, frame_info in frames
+        for frame, info in selected.decode(frame_data, frame_info)
+    ]
+    assert [frame_no for frame_no, _ in selected_frames] == [
+        0,
+        5,
+        10,
+        15,
+        20,
+        25,
+    ]
+
+    everything = FrameDecoder(EveryNthFrame(1))
+    full = {
+        info.frame_no: frame.to_ndarray(format="gray")
+        for frame_data, frame_info in frames
+        for frame, info in everything.decode(frame_data, frame_info)
+    }
+    for frame_no, img in selected_frames:
+        assert (img == full[frame_no]).all()
+
+
+def test_frames_keep_their_timestamps(frames) -> None:
+    decoder = FrameDecoder(thread_type="FRAME", thread_count=4)
+    decoded = [
+        (frame, info)
+        for frame_data, frame_info in frames
+        for frame, info in decoder.decode(frame_data, frame_info)
+    ]
+    assert decoded
+    for frame, info in decoded:
+        assert frame.pts == pts_from_frameinfo(info)
+        assert float(frame.pts * frame.time_base) == pytest.approx(
+            info.timestamp_seconds
+        )
@@ -0,0 +1,72 @@
+import av
+import pytest
+from p2pcam.event_recorder import EventRecorder, PacketBuffer
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return encode_test_video(100, framerate=20, gop_size=10)
+
+
+def test_packet_buffer_keeps_a_keyframe(frames) -> None:
+    buffer = PacketBuffer(seconds=1.0)
+    for frame in frames[3:10]:
+        buffer.add(*frame)
+    assert len(buffer) == 0
+    for frame in frames[10:]:
+        buffer.add(*frame)
+        held = buffer.frames()
+        assert held[0][1].is_keyframe
+        # at most the pre-roll plus one keyframe interval
+        assert len(held) <= 30
+    assert held[-1][1].timestamp_seconds - held[0][1].timestamp_seconds >= 1.0
+    assert buffer.byte_size == sum(len(data) for data, _ in held)
+
+
+def test_clip_includes_pre_roll(tmp_path, frames) -> None:
+    session = mock_session(MockTutkLibrary())
+    try:
+        recorder = EventRecorder(
+            session, str(tmp_path), pre_roll=1.0, post_roll=1.0
+        )
+        for i, frame in enumerate(frames):
+            if i == 60:
+                recorder.trigger()
+            recorder.write(*frame)
+        recorder.close()
+    finally:
+        P2PPlatform.unload_Platform()
+
+    [clip] = recorder.clips
+    # from the keyframe a second before the trigger, until a second after it
+    assert clip.frames == 41
+    assert clip.duration == pytest.approx(2.0)
+    with av.open(clip.path) as container:
+        assert len(list(container.decode(video=0))) == 41
+
+
+def test_retrigger_never_overwrites_a_clip(tmp_path, frames) -> None:
+    session = mock_session(MockTutkLibrary())
+    try:
+        recorder = EventRecorder(
+            session, str(tmp_path), pre_roll=2.0, post_roll=0.2
+        )
+        for i, frame in enumerate(frames):
+            if i in (60, 70):
+                recorder.trigger()
+            recorder.write(*frame)
+        recorder.close()
+    finally:
+        P2PPlatform.unload_Platform()
+
+    first, second = recorder.clips
+    # both start within the same second, which the default name resolves to
+    assert int(first.start) == int(second.start)
+    assert second.path == first.path[: -len(".mp4")] + "-1.mp4"
+    assert len(list(tmp_path.iterdir())) == 2
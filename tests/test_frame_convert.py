@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from p2pcam.decoder import FrameDecoder
+from p2pcam.frame_convert import frame_to_ndarray
+from p2pcam.mock.mock_tutk_library import encode_test_video  # type: ignore
+from p2pcam.motion import MotionDetector
+
+
+@pytest.fixture(scope="module")
+def decoded_frames():
+    decoder = FrameDecoder(selection=None)
+    return [
+        frame
+        for frame_data, frame_info in encode_test_video(4)
+        for frame, _ in decoder.decode(frame_data, frame_info)
+    ]
+
+
+def test_y_plane_is_a_view(decoded_frames) -> None:
+    frame = decoded_frames[0]
+    y = frame_to_ndarray(frame, "y")
+    assert y.shape == (48, 64)
+    assert not y.flags.writeable
+    assert not y.flags.owndata
+    assert (y == frame.to_ndarray()[:48]).all()
+
+
+def test_yuv420p_planes(decoded_frames) -> None:
+    y, u, v = frame_to_ndarray(decoded_frames[0], "yuv420p")
+    assert y.shape == (48, 64)
+    assert u.shape == v.shape == (24, 32)
+
+
+@pytest.mark.parametrize("output_format", ["y", "gray", "bgr24", "rgb24"])
+def test_scaled(decoded_frames, output_format) -> None:
+    img = frame_to_ndarray(
+        decoded_frames[0], output_format, 32, 24, interpolation="AREA"
+    )
+    assert img.shape[:2] == (24, 32)
+
+
+def test_scaled_y_keeps_the_luma_range(decoded_frames) -> None:
+    frame = decoded_frames[0]
+    y = frame_to_ndarray(frame, "y")
+    scaled = frame_to_ndarray(frame, "y", 32, 24, interpolation="AREA")
+    assert abs(float(y.mean()) - float(scaled.mean())) < 2
+    assert scaled.min() >= 16 and scaled.max() <= 235
+
+
+def test_motion_detector_accepts_y_plane(decoded_frames) -> None:
+    detector = MotionDetector()
+    assert detector.detect(frame_to_ndarray(decoded_frames[0], "y")) is None
+    annotated, thresh = detector.detect(
+        frame_to_ndarray(decoded_frames[1], "y")
+    )
+    assert annotated.shape == (48, 64, 3)
+    assert thresh.shape == (48, 64)
+    assert thresh.dtype == np.uint8
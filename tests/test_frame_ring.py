@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+from p2pcam.frame_ring import FrameRing, OverflowPolicy
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    mock_session,
+)
+from p2pcam.tutk import tutk
+
+
+def _frame(frame_no, is_keyframe=False):
+    return bytes([frame_no]), tutk.FrameInfoStruct(
+        frame_no=frame_no, is_keyframe=is_keyframe
+    )
+
+
+def test_drop_oldest() -> None:
+    ring = FrameRing(capacity=2)
+    for i in range(4):
+        ring.put(*_frame(i))
+    assert [info.frame_no for _, info in ring.frames] == [2, 3]
+    assert ring.dropped[OverflowPolicy.DROP_OLDEST] == 2
+
+
+def test_drop_non_keyframes_first() -> None:
+    ring = FrameRing(capacity=3, policy=OverflowPolicy.DROP_NON_KEYFRAMES)
+    ring.put(*_frame(0, is_keyframe=True))
+    for i in range(1, 4):
+        ring.put(*_frame(i))
+    assert [info.frame_no for _, info in ring.frames] == [0, 2, 3]
+    assert ring.dropped[OverflowPolicy.DROP_NON_KEYFRAMES] == 1
+    assert ring.dropped[OverflowPolicy.DROP_OLDEST] == 0
+
+
+def test_drop_gop_keeps_reference_chains_whole() -> None:
+    ring = FrameRing(capacity=5, policy=OverflowPolicy.DROP_GOP)
+    for i in range(5):
+        ring.put(*_frame(i, is_keyframe=i % 3 == 0))
+    # full: 0K 1 2 3K 4; the first GOP goes to make room
+    ring.put(*_frame(5))
+    assert [info.frame_no for _, info in ring.frames] == [3, 4, 5]
+    for i in range(6, 8):
+        ring.put(*_frame(i))
+    # full again with a single GOP: it all goes, and so does the rest of it
+    ring.put(*_frame(8))
+    ring.put(*_frame(9))
+    assert len(ring) == 0
+    ring.put(*_frame(10, is_keyframe=True))
+    ring.put(*_frame(11))
+    assert [info.frame_no for _, info in ring.frames] == [10, 11]
+    assert ring.dropped[OverflowPolicy.DROP_GOP] == 10
+
+
+def test_block_waits_for_consumer() -> None:
+    ring = FrameRing(capacity=1, policy=OverflowPolicy.BLOCK)
+    ring.put(*_frame(0))
+    producer = threading.Thread(target=ring.put, args=_frame(1))
+    producer.start()
+    producer.join(0.05)
+    assert producer.is_alive()
+    assert ring.get()[1].frame_no == 0  # type: ignore
+    producer.join(1)
+    assert ring.get()[1].frame_no == 1  # type: ignore
+    assert ring.blocked == 1
+
+
+def test_session_receiver_thread() -> None:
+    lib = MockTutkLibrary()
+    try:
+        session = mock_session(lib)
+        for i in range(5):
+            lib.push_frame(*_frame(i, is_keyframe=i == 0))
+        session.start_receiver(capacity=10)
+        frames = session.recv_video_data(timeout=1)
+        assert [next(frames)[1].frame_no for _ in range(5)] == list(range(5))
+        session._disconnect()
+        assert session.receiver is None
+        with pytest.raises(StopIteration):
+            next(frames)
+    finally:
+        P2PPlatform.unload_Platform()
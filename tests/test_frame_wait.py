@@ -0,0 +1,55 @@
+import time
+
+import pytest
+from p2pcam.frame_wait import AdaptiveFrameWait, FixedIntervalWait
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    mock_session,
+)
+from p2pcam.tutk import tutk
+
+
+@pytest.fixture
+def tutk_platform_lib():
+    lib = MockTutkLibrary()
+    yield lib
+    P2PPlatform.unload_Platform()
+
+
+def _mean_latency(lib, session, framerate=20, num_frames=10):
+    start = time.monotonic() + 0.05
+    schedule = [start + i / framerate for i in range(num_frames)]
+    for available_at in schedule:
+        lib.push_frame(
+            b"\x00" * 64,
+            tutk.FrameInfoStruct(framerate=framerate),
+            available_at=available_at,
+        )
+    latencies = []
+    for i, buffer in enumerate(session.recv_video_buffers()):
+        latencies.append(time.monotonic() - schedule[i])
+        buffer.release()
+        if i == num_frames - 1:
+            break
+    return sum(latencies[1:]) / (num_frames - 1)
+
+
+def test_adaptive_wait_beats_fixed_polling(tutk_platform_lib) -> None:
+    fixed = _mean_latency(
+        tutk_platform_lib,
+        mock_session(tutk_platform_lib, frame_wait=FixedIntervalWait()),
+    )
+    P2PPlatform.unload_Platform()
+    adaptive = _mean_latency(
+        tutk_platform_lib,
+        mock_session(tutk_platform_lib, frame_wait=AdaptiveFrameWait()),
+    )
+    assert adaptive < fixed
+
+
+def test_recv_video_data_timeout(tutk_platform_lib) -> None:
+    session = mock_session(tutk_platform_lib)
+    with pytest.raises(tutk.TutkError) as excinfo:
+        next(session.recv_video_data(timeout=0.05))
+    assert excinfo.value.args[0] == tutk.AV_ER_TIMEOUT
@@ -0,0 +1,143 @@
+import asyncio
+import io
+
+import av
+import pytest
+from aiohttp import ClientSession
+from p2pcam.hls import HlsPackager
+from p2pcam.hls_server import HlsServer
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return encode_test_video(100, framerate=20, gop_size=20)
+
+
+@pytest.fixture
+def packager():
+    session = mock_session(MockTutkLibrary())
+    try:
+        yield HlsPackager(
+            session, segment_duration=1.0, part_duration=0.25, max_segments=8
+        )
+    finally:
+        P2PPlatform.unload_Platform()
+
+
+def test_segments_start_with_keyframes(packager, frames) -> None:
+    for frame in frames:
+        packager.write(*frame)
+    packager.close()
+
+    segments = list(packager.segments)
+    assert [s.msn for s in segments] == list(range(5))
+    assert all(s.complete for s in segments)
+    for segment in segments:
+        assert segment.duration == pytest.approx(1.0)
+        assert segment.parts[0].independent
+        assert [p.independent for p in segment.parts[1:]] == [False] * 3
+        # the init section and a segment make a playable file
+        data = packager.init_sections[segment.init_id] + segment.data
+        with av.open(io.BytesIO(data)) as container:
+            assert len(list(container.decode(video=0))) == 20
+
+
+def test_playlist(packager, frames) -> None:
+    for frame in frames[:50]:
+        packager.write(*frame)
+
+    playlist = packager.playlist().splitlines()
+    assert playlist[0] == "#EXTM3U"
+    assert "#EXT-X-MEDIA-SEQUENCE:0" in playlist
+    assert '#EXT-X-MAP:URI="init0.mp4"' in playlist
+    assert [line for line in playlist if line.startswith("segment")] == [
+        "segment0.m4s",
+        "segment1.m4s",
+    ]
+    # the segment in progress is listed as parts only
+    assert '#EXT-X-PART:DURATION=0.25000,URI="part2.0.m4s",INDEPENDENT=YES' in (
+        playlist
+    )
+    assert playlist[-1].startswith('#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part2.')
+    assert packager.has_part(2, 0)
+    assert not packager.has_part(2)
+
+
+def test_eviction(packager) -> None:
+    for frame in encode_test_video(200, framerate=20, gop_size=20):
+        packager.write(*frame)
+    assert len(packager.segments) == 8
+    assert packager.segments[0].msn > 0
+
+
+def test_blocking_playlist_reload(packager, frames) -> None:
+    async def fetch():
+        server = HlsServer({"cam": packager})
+        await server.start("127.0.0.1", 0)
+        try:
+            base = f"http://127.0.0.1:{server.ports[0]}/cam"
+            async with ClientSession() as client:
+                blocked = asyncio.ensure_future(
+                    client.get(f"{base}/index.m3u8?_HLS_msn=1&_HLS_part=0")
+                )
+                await asyncio.sleep(0.1)
+                assert not blocked.done()
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    None, lambda: [packager.write(*f) for f in frames[:30]]
+                )
+                response = await blocked
+                playlist = await response.text()
+                part = await client.get(f"{base}/part1.0.m4s")
+                init = await client.get(f"{base}/init0.mp4")
+                missing = await client.get(f"{base}/init9.mp4")
+                return (
+                    playlist,
+                    response.content_type,
+                    await part.read(),
+                    await init.read(),
+                    missing.status,
+                )
+        finally:
+            await server.stop()
+
+    playlist, content_type, part, init, missing = asyncio.run(fetch())
+    assert 'URI="part1.0.m4s"' in playlist
+    assert content_type == "application/vnd.apple.mpegurl"
+    assert part == packager.part(1, 0).data
+    assert init == packager.init_sections[0]
+    assert missing == 404
+
+
+def test_far_future_msn_is_rejected_and_stop_removes_listeners(
+    packager, frames
+) -> None:
+    for frame in frames[:30]:
+        packager.write(*frame)
+
+    async def fetch():
+        server = HlsServer({"cam": packager}, block_timeout=5)
+        await server.start("127.0.0.1", 0)
+        try:
+            assert len(packager.listeners) == 1
+            base = f"http://127.0.0.1:{server.ports[0]}/cam"
+            async with ClientSession() as client:
+                loop = asyncio.get_running_loop()
+                start = loop.time()
+                far = await client.get(
+                    f"{base}/index.m3u8?_HLS_msn={packager.last_msn + 3}"
+                )
+                return far.status, loop.time() - start
+        finally:
+            await server.stop()
+
+    status, elapsed = asyncio.run(fetch())
+    assert status == 400
+    assert elapsed < 1
+    assert packager.listeners == []
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+
+import pytest
+from p2pcam.mock.mock_tutk_library import MockTutkLibrary  # type: ignore
+from p2pcam.tutk import tutk, tutk_protocol
+from p2pcam.tutk.tutk_ioctl_mux import TutkIOCtrlMux
+
+
+def response(code: int, data: bytes) -> bytes:
+    return tutk_protocol.encode(code, len(data), data)
+
+
+def camera(request: bytes) -> bytes:
+    """Answers the way a camera would."""
+    header, _ = tutk_protocol.decode(request)
+    if header.code == 10020:
+        return response(10021, json.dumps({"basicInfo": {}}).encode())
+    if header.code == 10056:
+        return response(10057, b"\x01")
+    return response(header.code + 1, b"")
+
+
+def test_result_wakes_on_response() -> None:
+    lib = MockTutkLibrary()
+    with TutkIOCtrlMux(lib, 0) as mux:
+        future = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        with pytest.raises(queue.Empty):
+            future.result(block=False)
+        threading.Timer(
+            0.2, lib.push_ioctrl, (response(10021, b'{"a": 1}'),)
+        ).start()
+        start = time.monotonic()
+        assert future.result(timeout=5) == {"a": 1}
+        assert time.monotonic() - start < 1
+    assert future.resp_protocol == 1
+    assert lib.sent_ioctrl[0][0] == tutk.IOTYPE_USER_DEFINED_START
+
+
+def test_result_timeout_is_in_seconds() -> None:
+    with TutkIOCtrlMux(MockTutkLibrary(), 0) as mux:
+        future = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        start = time.monotonic()
+        with pytest.raises(queue.Empty):
+            future.result(timeout=0.1)
+        assert time.monotonic() - start < 1
+        assert mux.waitfor(future, timeout=0.1) is None
+
+
+def test_gather() -> None:
+    lib = MockTutkLibrary()
+    lib.ioctrl_responder = camera
+    with TutkIOCtrlMux(lib, 0) as mux:
+        results = mux.gather(
+            [
+                tutk_protocol.K10020CheckCameraInfo(),
+                tutk_protocol.K10056SetResolvingBit(),
+                tutk_protocol.K10020CheckCameraInfo(),
+            ],
+            timeout=5,
+        )
+    assert results == [{"basicInfo": {}}, True, {"basicInfo": {}}]
+    assert len(lib.sent_ioctrl) == 3
+
+
+def test_remote_close_fails_pending() -> None:
+    lib = MockTutkLibrary()
+    with TutkIOCtrlMux(lib, 0) as mux:
+        future = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        lib.close_ioctrl()
+        with pytest.raises(tutk.TutkError):
+            future.result(timeout=5)
+
+
+def test_async_send_many_sessions() -> None:
+    libs = [MockTutkLibrary() for _ in range(4)]
+    for lib in libs:
+        lib.ioctrl_responder = camera
+
+    async def main() -> list:
+        muxes = [TutkIOCtrlMux(lib, 0) for lib in libs]
+        for mux in muxes:
+            await mux.__aenter__()
+        try:
+            return await asyncio.gather(
+                *(
+                    mux.send(tutk_protocol.K10056SetResolvingBit(), timeout=5)
+                    for mux in muxes
+                    for _ in range(100)
+                )
+            )
+        finally:
+            for mux in muxes:
+                await mux.__aexit__(None, None, None)
+
+    assert asyncio.run(main()) == [True] * 400
+
+
+def test_async_timeout_discards_waiter() -> None:
+    lib = MockTutkLibrary()
+
+    async def main() -> None:
+        async with TutkIOCtrlMux(lib, 0) as mux:
+            with pytest.raises(asyncio.TimeoutError):
+                await mux.send(tutk_protocol.K10020CheckCameraInfo(), 0.1)
+
+            task = asyncio.ensure_future(
+                mux.send(tutk_protocol.K10020CheckCameraInfo())
+            )
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert len(mux.waiters[10021]) == 2
+
+            # the late responses are absorbed, so the next command gets its own
+            lib.push_ioctrl(response(10021, b'{"late": 1}'))
+            lib.push_ioctrl(response(10021, b'{"late": 2}'))
+            lib.ioctrl_responder = camera
+            info = await mux.send(tutk_protocol.K10020CheckCameraInfo())
+            assert info == {"basicInfo": {}}
+            assert not mux.waiters[10021]
+
+    asyncio.run(main())
+
+
+def test_same_code_responses_go_to_senders_in_order() -> None:
+    lib = MockTutkLibrary()
+    with TutkIOCtrlMux(lib, 0) as mux:
+        results = [None, None]
+
+        def send(i: int) -> None:
+            msg = tutk_protocol.K10020CheckCameraInfo()
+            results[i] = mux.send_ioctl(msg).result(timeout=5)
+
+        first = threading.Thread(target=send, args=(0,))
+        first.start()
+        while not mux.waiters[10021]:
+            time.sleep(0.01)
+        second = threading.Thread(target=send, args=(1,))
+        second.start()
+        while len(mux.waiters[10021]) < 2:
+            time.sleep(0.01)
+        lib.push_ioctrl(response(10021, b"1"))
+        lib.push_ioctrl(response(10021, b"2"))
+        first.join()
+        second.join()
+    assert results == [1, 2]
+
+
+class Echo(tutk_protocol.TutkWyzeProtocolMessage):
+    expected_response_code = 10001
+
+    def __init__(self, payload: bytes) -> None:
+        super().__init__(10000)
+        self.payload = payload
+
+    def encode(self) -> bytes:
+        return tutk_protocol.encode(self.code, len(self.payload), self.payload)
+
+
+def test_racing_senders_of_one_code_get_their_own_responses() -> None:
+    lib = MockTutkLibrary()
+    sending = threading.Event()
+
+    def echo(request: bytes) -> bytes:
+        payload = request[16:]
+        if payload == b"slow":
+            # the second sender tries to overtake the first on the wire
+            sending.set()
+            time.sleep(0.2)
+        return response(10001, payload)
+
+    lib.ioctrl_responder = echo
+    with TutkIOCtrlMux(lib, 0) as mux:
+        results = {}
+
+        def send(payload: bytes) -> None:
+            results[payload] = mux.send_ioctl(Echo(payload)).result(timeout=5)
+
+        slow = threading.Thread(target=send, args=(b"slow",))
+        slow.start()
+        assert sending.wait(5)
+        fast = threading.Thread(target=send, args=(b"fast",))
+        fast.start()
+        slow.join()
+        fast.join()
+    assert results == {b"slow": b"slow", b"fast": b"fast"}
+
+
+def test_cancelled_waiters_absorb_their_response() -> None:
+    lib = MockTutkLibrary()
+    with TutkIOCtrlMux(lib, 0, expire_after=0.2) as mux:
+        expired = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        with pytest.raises(tutk.TutkError):
+            expired.result(timeout=5)
+        assert not mux.waiters[10021]
+
+        mux.expire_after = 60
+        cancelled = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        assert cancelled.cancel()
+        answered = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        lib.push_ioctrl(response(10021, b"1"))
+        lib.push_ioctrl(response(10021, b"2"))
+        assert answered.result(timeout=5) == 2
+        assert not mux.unclaimed
+
+
+def test_unclaimed_responses_are_bounded() -> None:
+    lib = MockTutkLibrary()
+    with TutkIOCtrlMux(lib, 0, max_unclaimed=2) as mux:
+        for i in range(5):
+            lib.push_ioctrl(response(10003, bytes([i])))
+        lib.ioctrl_responder = camera
+        # answered after the unsolicited messages, so they have been handled
+        mux.send_ioctl(tutk_protocol.K10056SetResolvingBit()).result(timeout=5)
+    assert [(code, msg[3]) for code, msg in mux.unclaimed] == [
+        (10003, b"\x03"),
+        (10003, b"\x04"),
+    ]
+
+
+def test_listener_survives_malformed_messages_and_fails_on_errors() -> None:
+    lib = MockTutkLibrary()
+    with TutkIOCtrlMux(lib, 0) as mux:
+        future = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        lib.push_ioctrl(b"XX" + bytes(14))
+        lib.push_ioctrl(response(10021, b'{"a": 1}'))
+        assert future.result(timeout=5) == {"a": 1}
+
+        pending = mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo())
+        lib.push_ioctrl_error(tutk.IOTC_ER_INVALID_SID)
+        with pytest.raises(tutk.TutkError):
+            pending.result(timeout=5)
+        with pytest.raises(tutk.TutkError):
+            mux.send_ioctl(tutk_protocol.K10020CheckCameraInfo()).result(0)
@@ -0,0 +1,60 @@
+import asyncio
+
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    mock_session,
+)
+from p2pcam.tutk import tutk
+
+
+def test_arecv_video_data() -> None:
+    lib = MockTutkLibrary()
+    for i in range(5):
+        lib.push_frame(bytes([i]) * 8, tutk.FrameInfoStruct(frame_no=i))
+
+    async def receive(session):
+        received = []
+        async for frame_data, frame_info in session.arecv_video_data(2):
+            received.append((frame_data, frame_info.frame_no))
+            if len(received) == 3:
+                break
+        return received
+
+    try:
+        session = mock_session(lib)
+        received = asyncio.run(receive(session))
+    finally:
+        P2PPlatform.unload_Platform()
+    assert received == [(bytes([i]) * 8, i) for i in range(3)]
+
+
+def test_aexit_joins_unclosed_generators_before_disconnecting() -> None:
+    lib = MockTutkLibrary()
+    for i in range(5):
+        lib.push_frame(bytes([i]) * 8, tutk.FrameInfoStruct(frame_no=i))
+    alive_at_stop = []
+
+    async def receive(session):
+        frames = session.arecv_video_data(1)
+        # stop consuming without closing the generator, with its thread
+        # waiting for room in the queue
+        await frames.__anext__()
+        await asyncio.sleep(0.1)
+        [producer] = list(session._async_producers)
+        disconnect = session._disconnect
+
+        def _disconnect():
+            alive_at_stop.append(producer.is_alive())
+            disconnect()
+
+        session._disconnect = _disconnect
+        await session.__aexit__(None, None, None)
+        await frames.aclose()
+
+    try:
+        session = mock_session(lib)
+        asyncio.run(receive(session))
+    finally:
+        P2PPlatform.unload_Platform()
+    assert alive_at_stop == [False]
@@ -0,0 +1,103 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from p2pcam.motion import MotionDetector, MotionGrid
+
+
+def frame_with_square(x: int, y: int, size: int = 120) -> np.ndarray:
+    frame = np.zeros((720, 1280, 3), np.uint8)
+    frame[y : y + size, x : x + size] = 255
+    return frame
+
+
+@pytest.mark.parametrize("analysis_width", [None, 320])
+def test_boxes_in_full_frame_coordinates(analysis_width) -> None:
+    detector = MotionDetector(analysis_width=analysis_width)
+    assert detector.detect(frame_with_square(100, 200)) is None
+    annotated, thresh = detector.detect(frame_with_square(400, 200))
+
+    assert annotated.shape == (720, 1280, 3)
+    assert thresh.shape == (
+        (720, 1280) if analysis_width is None else (180, 320)
+    )
+    # the square left one place and arrived in another
+    boxes = sorted(detector.boxes)
+    assert len(boxes) == 2
+    for (x, y, w, h), expected_x in zip(boxes, (100, 400)):
+        assert abs(x - expected_x) <= 16 and abs(y - 200) <= 16
+        assert 120 <= w <= 150 and 120 <= h <= 150
+
+
+def test_regions_of_interest() -> None:
+    detector = MotionDetector(analysis_width=320, regions=[(300, 0, 400, 720)])
+    detector.detect_boxes(frame_with_square(100, 200))
+    detector.detect_boxes(frame_with_square(400, 200))
+    [(x, _, _, _)] = detector.boxes
+    assert abs(x - 400) <= 16
+
+    detector.detect_boxes(frame_with_square(900, 200))
+    detector.detect_boxes(frame_with_square(1000, 200))
+    assert detector.boxes == []
+
+
+def test_average_background_catches_slow_motion() -> None:
+    # a dim square moving one pixel per frame barely changes between frames
+    def frame(i):
+        image = np.full((240, 320), 40, np.uint8)
+        image[100:160, 50 + i : 110 + i] = 80
+        return image
+
+    previous = MotionDetector(threshold=20)
+    average = MotionDetector(threshold=20, background="average")
+    for i in range(30):
+        previous.detect_boxes(frame(i))
+        average.detect_boxes(frame(i))
+    assert previous.boxes == []
+    assert average.boxes
+
+
+@pytest.mark.parametrize("background", ["previous", "average", "mog2"])
+def test_steady_state_allocates_no_images(background) -> None:
+    frames = [frame_with_square(100 + i * 20, 200) for i in range(10)]
+    detector = MotionDetector(analysis_width=320, background=background)
+    for frame in frames[:3]:
+        detector.detect_boxes(frame)
+
+    tracemalloc.start()
+    for frame in frames[3:]:
+        detector.detect_boxes(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # far less than one 320x180 analysis image
+    assert peak < 320 * 180 // 4
+
+
+def test_motion_grid_scores_cells() -> None:
+    grid = MotionGrid(rows=4, cols=4)
+    still = np.zeros((120, 160), np.uint8)
+    moved = still.copy()
+    moved[0:30, 40:60] = 255  # half of the cell in row 0, column 1
+
+    assert grid.update(still) is None
+    scores = grid.update(moved)
+    assert scores.shape == (4, 4)
+    assert scores[0, 1] == pytest.approx(0.5)
+    assert scores.sum() == pytest.approx(0.5)
+
+    grid.update(moved)
+    assert grid.heatmap[0, 1] == pytest.approx(0.5 * grid.decay)
+    assert grid.active_cells().sum() == 1
+
+
+def test_motion_grid_batches_cameras() -> None:
+    grid = MotionGrid(rows=2, cols=2)
+    batch = np.zeros((3, 60, 80), np.uint8)
+    grid.update(batch)
+    batch = batch.copy()
+    batch[1, 30:60, 40:80] = 255
+    scores = grid.update(batch)
+    assert scores.shape == (3, 2, 2)
+    assert scores[1, 1, 1] == 1.0
+    assert scores.sum() == 1.0
+    assert grid.active_cells().shape == (3, 2, 2)
@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+import pytest
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+from p2pcam.motion_pool import MotionPool
+from p2pcam.shared_ring import SharedFrameRing
+from p2pcam.tutk import tutk
+
+
+def test_cameras_are_pinned_to_workers() -> None:
+    with MotionPool(processes=2, start_method="fork") as pool, SharedFrameRing(
+        slots=4, slot_size=120 * 160
+    ) as still, SharedFrameRing(slots=4, slot_size=120 * 160) as moving:
+        assert pool.add_camera("still", still.name) == 0
+        assert pool.add_camera("moving", moving.name, min_area=100) == 1
+        assert pool.cameras == {"still": 0, "moving": 1}
+        time.sleep(0.2)
+
+        for i in range(5):
+            info = tutk.FrameInfoStruct(frame_no=i, timestamp=1600000000 + i)
+            image = np.zeros((120, 160), np.uint8)
+            still.put(image, info)
+            image[40:80, i * 30 : i * 30 + 40] = 255
+            moving.put(image, info)
+            time.sleep(0.05)
+
+        events = [pool.get(timeout=5) for _ in range(4)]
+    assert {event.camera for event in events} == {"moving"}
+    assert [event.frame_no for event in events] == [1, 2, 3, 4]
+    assert events[0].timestamp == 1600000001
+    assert all(event.boxes and 0 < event.score < 1 for event in events)
+
+
+def test_watch_session() -> None:
+    lib = MockTutkLibrary()
+    session = mock_session(lib)
+    try:
+        with MotionPool(processes=1, start_method="fork") as pool:
+            pool.watch(session, camera="door", min_area=10)
+            start = time.monotonic()
+            for i, frame in enumerate(encode_test_video(40)):
+                # paced, since the worker attaches once the first is published
+                lib.push_frame(*frame, available_at=start + i * 0.05)
+            event = pool.get(timeout=10)
+    finally:
+        P2PPlatform.unload_Platform()
+    assert event.camera == "door"
+    assert event.boxes
+
+
+def test_failing_camera_is_dropped_and_dead_workers_raise() -> None:
+    with MotionPool(processes=1, start_method="fork") as pool, SharedFrameRing(
+        slots=4, slot_size=120 * 160
+    ) as broken, SharedFrameRing(slots=4, slot_size=120 * 160) as moving:
+        pool.add_camera("broken", broken.name, background="bogus")
+        pool.add_camera("moving", moving.name, min_area=100)
+        time.sleep(0.2)
+        for i in range(3):
+            info = tutk.FrameInfoStruct(frame_no=i, timestamp=1600000000 + i)
+            image = np.zeros((120, 160), np.uint8)
+            broken.put(image, info)
+            image[40:80, i * 30 : i * 30 + 40] = 255
+            moving.put(image, info)
+            time.sleep(0.05)
+        assert pool.get(timeout=5).camera == "moving"
+
+        pool._workers[0].terminate()
+        with pytest.raises(RuntimeError):
+            # after any events the worker reported before it died
+            for _ in range(3):
+                pool.get(timeout=5)
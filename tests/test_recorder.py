@@ -0,0 +1,66 @@
+import os
+import time
+
+import av
+import pytest
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+from p2pcam.recorder import SegmentRecorder
+
+
+@pytest.fixture
+def session():
+    yield mock_session(MockTutkLibrary())
+    P2PPlatform.unload_Platform()
+
+
+@pytest.mark.parametrize(
+    "container,codec", [("mp4", "h264"), ("mkv", "h264"), ("mp4", "hevc")]
+)
+def test_segments_cut_on_keyframes(tmp_path, session, container, codec) -> None:
+    frames = encode_test_video(45, framerate=20, gop_size=10, codec=codec)
+    recorder = SegmentRecorder(
+        session, str(tmp_path), container, segment_seconds=0.9
+    )
+    # frames before the first keyframe cannot start a segment
+    recorder.write(*frames[1])
+    for frame in frames:
+        recorder.write(*frame)
+    recorder.close()
+
+    assert recorder.skipped == 1
+    assert [s.frames for s in recorder.segments] == [20, 20, 5]
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(s.path) for s in recorder.segments
+    )
+    for segment in recorder.segments:
+        assert segment.codec_name == codec
+        with av.open(segment.path) as recording:
+            stream = recording.streams.video[0]
+            assert (
+                stream.codec_context.width,
+                stream.codec_context.height,
+            ) == (
+                64,
+                48,
+            )
+            decoded = list(recording.decode(stream))
+        assert len(decoded) == segment.frames
+        assert decoded[-1].time == pytest.approx(segment.duration, abs=0.01)
+
+
+def test_records_session(tmp_path, session) -> None:
+    for frame in encode_test_video(30):
+        session.av_lib.push_frame(*frame)
+    with SegmentRecorder(session, str(tmp_path), segment_bytes=1) as recorder:
+        deadline = time.monotonic() + 5
+        while len(recorder.segments) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert [s.frames for s in recorder.segments] == [10, 10, 10]
+    paths = {s.path for s in recorder.segments}
+    assert len(paths) == 3
+    assert all(os.path.exists(path) for path in paths)
@@ -0,0 +1,146 @@
+import asyncio
+import struct
+import threading
+import time
+
+import av
+import pytest
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+from p2pcam.rtsp import RtpPacketizer, RtspServer, _RtspClient, split_nal_units
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return encode_test_video(60, width=320, height=240, gop_size=20)
+
+
+def test_packetizer_fragments_large_nal_units(frames) -> None:
+    packetizer = RtpPacketizer("h264", mtu=100)
+    keyframe = frames[0][0]
+    payloads = packetizer.packetize(keyframe)
+    assert all(len(p) <= 100 for p in payloads)
+
+    # reassemble the fragmentation units
+    units, fragment = [], b""
+    for payload in payloads:
+        if payload[0] & 0x1F != 28:
+            units.append(payload)
+            continue
+        if payload[1] & 0x80:
+            fragment = bytes([(payload[0] & 0xE0) | (payload[1] & 0x1F)])
+        fragment += payload[2:]
+        if payload[1] & 0x40:
+            units.append(fragment)
+    assert units == [u for u in split_nal_units(keyframe) if u[0] & 0x1F != 9]
+    assert "sprop-parameter-sets=" in packetizer.sdp_fmtp(keyframe)
+
+
+@pytest.mark.parametrize("transport", ["tcp", "udp"])
+def test_restream(frames, transport) -> None:
+    lib = MockTutkLibrary()
+    start = time.monotonic()
+    for i, (frame_data, frame_info) in enumerate(frames):
+        lib.push_frame(frame_data, frame_info, available_at=start + i * 0.05)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        session = mock_session(lib)
+        server = RtspServer({"cam": session})
+        asyncio.run_coroutine_threadsafe(
+            server.start("127.0.0.1", 0), loop
+        ).result()
+        url = f"rtsp://127.0.0.1:{server.ports[0]}/cam"
+        # join mid-stream, after the first keyframe has gone by
+        time.sleep(0.5)
+        with av.open(
+            url, options={"rtsp_transport": transport}, timeout=5
+        ) as container:
+            decoded = []
+            for frame in container.decode(video=0):
+                decoded.append(frame)
+                if len(decoded) == 30:
+                    break
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        P2PPlatform.unload_Platform()
+
+    assert decoded[0].width == 320
+    assert decoded[0].key_frame
+
+
+def test_slow_client_skips_to_next_keyframe() -> None:
+    async def offer():
+        client = _RtspClient(None, queue_size=5, channel=0)  # type: ignore
+        for i in range(25):
+            client.offer(([b"x"], i, i % 10 == 0))
+        return client
+
+    client = asyncio.run(offer())
+    # 0-4 are dropped when 5 overflows, then 5-9 wait for the keyframe at 10;
+    # likewise for 10-19
+    assert [timestamp for _, timestamp, _ in client.frames] == list(
+        range(20, 25)
+    )
+    assert client.dropped == 20
+
+
+def test_play_is_idempotent_and_teardown_keeps_session(frames) -> None:
+    lib = MockTutkLibrary()
+    for frame_data, frame_info in frames:
+        lib.push_frame(frame_data, frame_info)
+
+    async def request(reader, writer, cseq, method, url, headers=""):
+        writer.write(
+            f"{method} {url} RTSP/1.0\r\nCSeq: {cseq}\r\n{headers}\r\n".encode()
+        )
+        while True:
+            first = await reader.readexactly(1)
+            if first == b"$":
+                # an interleaved RTP packet
+                _, size = struct.unpack(">BH", await reader.readexactly(3))
+                await reader.readexactly(size)
+                continue
+            response = first + await reader.readuntil(b"\r\n\r\n")
+            return response.decode()
+
+    async def main():
+        server = RtspServer({"cam": session})
+        await server.start("127.0.0.1", 0)
+        url = f"rtsp://127.0.0.1:{server.ports[0]}/cam"
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", server.ports[0]
+        )
+        try:
+            await request(
+                reader,
+                writer,
+                1,
+                "SETUP",
+                url + "/trackID=0",
+                "Transport: RTP/AVP/TCP;unicast;interleaved=0-1\r\n",
+            )
+            for cseq in (2, 3):
+                assert " 200 " in await request(
+                    reader, writer, cseq, "PLAY", url
+                )
+            assert len(server.mounts["cam"].clients) == 1
+            response = await request(reader, writer, 4, "TEARDOWN", url)
+            assert "Session: " in response
+            assert server.mounts["cam"].clients == []
+        finally:
+            writer.close()
+            await server.stop()
+
+    try:
+        session = mock_session(lib)
+        asyncio.run(main())
+    finally:
+        P2PPlatform.unload_Platform()
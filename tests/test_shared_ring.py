@@ -0,0 +1,129 @@
+import multiprocessing
+import subprocess
+import sys
+from queue import Empty
+
+import numpy as np
+import pytest
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+from p2pcam.shared_ring import SharedFrameReader, SharedFrameRing
+from p2pcam.tutk import tutk
+
+
+def _info(frame_no: int) -> tutk.FrameInfoStruct:
+    return tutk.FrameInfoStruct(
+        frame_no=frame_no, timestamp=1600000000, timestamp_ms=frame_no * 1000
+    )
+
+
+def test_zero_copy_views_and_metadata() -> None:
+    with SharedFrameRing(slots=4, slot_size=64 * 48 * 3) as ring:
+        with SharedFrameReader(ring.name) as reader:
+            img = np.full((48, 64, 3), 7, dtype=np.uint8)
+            assert ring.put(img, _info(0)) == 1
+            frame = reader.get(timeout=1)
+            assert frame.frame_no == 0
+            assert frame.shape == (48, 64, 3)
+            assert frame.timestamp == 1600000000
+            assert not frame.array.flags.writeable
+            assert (frame.array == 7).all()
+            assert frame.valid()
+            with pytest.raises(Empty):
+                reader.get(timeout=0.01)
+            del frame
+
+
+def test_reader_detects_overrun() -> None:
+    with SharedFrameRing(slots=4, slot_size=16) as ring:
+        with SharedFrameReader(ring.name) as reader:
+            ring.put(b"first", _info(0))
+            frame = reader.get(timeout=1)
+            for i in range(1, 10):
+                ring.put(b"frame %d" % i, _info(i))
+            # the first frame's slot has since been reused
+            assert not frame.valid()
+            del frame
+            assert reader.get(timeout=1).frame_no == 6
+            assert reader.dropped == 5
+            assert ring.put(b"x" * 17, _info(10)) is None
+
+
+def _sum_frames(name, results) -> None:
+    with SharedFrameReader(name, timeout=5) as reader:
+        for _ in range(3):
+            frame = reader.get(timeout=5)
+            results.put((frame.frame_no, int(frame.array.sum())))
+            del frame
+
+
+def test_publisher_feeds_another_process() -> None:
+    ctx = multiprocessing.get_context("fork")
+    lib = MockTutkLibrary()
+    session = mock_session(lib)
+    results = ctx.Queue()
+    publisher = session.publish_shared_frames(output_format="gray", slots=30)
+    try:
+        reader = ctx.Process(target=_sum_frames, args=(publisher.name, results))
+        reader.start()
+        for frame_data, frame_info in encode_test_video(20):
+            lib.push_frame(frame_data, frame_info)
+        summed = [results.get(timeout=10) for _ in range(3)]
+        reader.join(timeout=10)
+    finally:
+        publisher.stop()
+        P2PPlatform.unload_Platform()
+    frame_nos = [frame_no for frame_no, _ in summed]
+    assert frame_nos == list(range(frame_nos[0], frame_nos[0] + 3))
+    assert all(total > 0 for _, total in summed)
+
+
+def test_unrelated_reader_does_not_unlink_the_ring() -> None:
+    with SharedFrameRing(slots=2, slot_size=16) as ring:
+        ring.put(np.zeros(16, np.uint8), _info(0))
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "from p2pcam.shared_ring import SharedFrameReader; "
+                f"SharedFrameReader({ring.name!r}).close()",
+            ],
+            check=True,
+            timeout=30,
+        )
+        # the reader's resource tracker has exited, without unlinking it
+        reader = SharedFrameReader(ring.name)
+        assert reader.get(timeout=1).frame_no == 0
+        reader.close()
+
+
+def test_readers_stop_when_the_publisher_dies() -> None:
+    lib = MockTutkLibrary()
+    receive = lib.avRecvFrameData2
+
+    def recv_until_closed(*args):
+        if not lib.frames:
+            return tutk.AV_ER_SESSION_CLOSE_BY_REMOTE
+        return receive(*args)
+
+    lib.avRecvFrameData2 = recv_until_closed
+    for frame_data, frame_info in encode_test_video(5):
+        lib.push_frame(frame_data, frame_info)
+    session = mock_session(lib)
+    publisher = session.publish_shared_frames(raw_slots=8)
+    try:
+        with SharedFrameReader(publisher.raw_name, timeout=5) as reader:
+            reader.next_seq = 1
+            frames = [reader.get(timeout=5) for _ in range(5)]
+            assert [frame.seq for frame in frames] == [1, 2, 3, 4, 5]
+            del frames
+            assert reader.get(timeout=5) is None
+            assert reader.ended
+            assert list(reader) == []
+    finally:
+        publisher.stop()
+        P2PPlatform.unload_Platform()
@@ -0,0 +1,124 @@
+import pytest
+from p2pcam.frame_ring import OverflowPolicy
+from p2pcam.gop_cache import GopCache
+from p2pcam.iotc import P2PPlatform
+from p2pcam.mock.mock_tutk_library import (  # type: ignore
+    MockTutkLibrary,
+    encode_test_video,
+    mock_session,
+)
+from p2pcam.stream_hub import StreamHub
+from p2pcam.tutk import tutk
+
+
+@pytest.fixture
+def session():
+    lib = MockTutkLibrary()
+    for frame_data, frame_info in encode_test_video(20):
+        lib.push_frame(frame_data, frame_info)
+    yield mock_session(lib)
+    P2PPlatform.unload_Platform()
+
+
+def test_fan_out_raw_and_decoded(session) -> None:
+    hub = StreamHub(session)
+    fast = hub.subscribe(queue_size=20)
+    slow = hub.subscribe(queue_size=5)
+    decoded = hub.subscribe(decoded=True, queue_size=20)
+    hub.start()
+
+    raw_frames = [fast.get(timeout=2) for _ in range(20)]
+    assert [info.frame_no for _, info in raw_frames] == list(range(20))
+    decoded_frames = [decoded.get(timeout=2) for _ in range(20)]
+    assert decoded_frames[0][0].width == 64  # type: ignore
+    assert [info.frame_no for _, info in decoded_frames] == list(range(20))
+    hub.stop()
+
+    # the slow subscriber never read, and only ever lost its own frames
+    assert len(slow.ring) == 5
+    assert slow.ring.dropped[OverflowPolicy.DROP_OLDEST] == 15
+    assert slow.ring.frames[-1][0] is raw_frames[-1][0]
+
+
+def test_blocking_subscriber_rejected(session) -> None:
+    with pytest.raises(AssertionError):
+        StreamHub(session).subscribe(policy=OverflowPolicy.BLOCK)
+
+
+def test_late_subscriber_replays_gop() -> None:
+    lib = MockTutkLibrary()
+    frames = encode_test_video(15)
+    for frame_data, frame_info in frames:
+        lib.push_frame(frame_data, frame_info)
+    try:
+        session = mock_session(lib, gop_cache_max_bytes=1024 * 1024)
+        hub = StreamHub(session)
+        # subscribe before the hub starts receiving, so no frame is missed
+        early = hub.subscribe()
+        with hub:
+            for _ in range(15):
+                early.get(timeout=2)
+            assert session.gop_cache.gop_length == 5
+
+            late = hub.subscribe()
+            replayed = [late.get(timeout=1)[1] for _ in range(5)]
+            assert replayed[0].is_keyframe
+            assert [info.frame_no for info in replayed] == list(range(10, 15))
+
+            lib.push_frame(*frames[0])
+            assert late.get(timeout=2)[1].frame_no == 0
+    finally:
+        P2PPlatform.unload_Platform()
+
+
+def test_gop_cache_memory_cap() -> None:
+    cache = GopCache(max_bytes=100)
+    cache.add(b"k" * 60, tutk.FrameInfoStruct(is_keyframe=1))
+    cache.add(b"p" * 30, tutk.FrameInfoStruct())
+    assert (cache.gop_length, cache.byte_size) == (2, 90)
+    cache.add(b"p" * 30, tutk.FrameInfoStruct())
+    assert (cache.gop_length, cache.byte_size) == (2, 90)
+    # a frame that would fit must not follow the one that was left out
+    cache.add(b"p" * 5, tutk.FrameInfoStruct())
+    assert cache.gop_length == 2
+    assert cache.frames()[0][1].is_keyframe
+
+    cache.add(b"k" * 20, tutk.FrameInfoStruct(is_keyframe=1))
+    cache.add(b"p" * 5, tutk.FrameInfoStruct())
+    assert (cache.gop_length, cache.byte_size) == (2, 25)
+    cache.add(b"k" * 200, tutk.FrameInfoStruct(is_keyframe=1))
+    cache.add(b"p" * 5, tutk.FrameInfoStruct())
+    assert (cache.gop_length, cache.byte_size) == (0, 0)
+
+
+def test_decoder_error_closes_decoded_subscribers(session, monkeypatch) -> None:
+    class BrokenDecoder:
+        def decode(self, frame_data, frame_info):
+            raise ValueError("corrupt frame")
+
+    monkeypatch.setattr("p2pcam.stream_hub.FrameDecoder", BrokenDecoder)
+    with StreamHub(session) as hub:
+        raw = hub.subscribe()
+        decoded = hub.subscribe(decoded=True)
+        with pytest.raises(ValueError):
+            decoded.get(timeout=2)
+        assert raw.get(timeout=2) is not None
+
+
+def test_decoder_stops_with_its_last_subscriber_and_restarts(session) -> None:
+    frames = encode_test_video(10)
+    hub = StreamHub(session)
+    with hub:
+        decoded = hub.subscribe(decoded=True, queue_size=20)
+        assert decoded.get(timeout=2) is not None
+        decoder = hub._decode_thread
+        decoded.close()
+        decoder.join(timeout=2)
+        assert not decoder.is_alive()
+        assert hub.subscribers == []
+
+    with hub:
+        decoded = hub.subscribe(decoded=True, queue_size=20)
+        for frame_data, frame_info in frames:
+            session.av_lib.push_frame(frame_data, frame_info)
+        assert decoded.get(timeout=2)[0].width == 64  # type: ignore
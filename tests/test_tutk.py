@@ -0,0 +1,66 @@
+import tracemalloc
+
+from p2pcam.mock.mock_tutk_library import MockTutkLibrary  # type: ignore
+from p2pcam.tutk import tutk
+
+
+def test_av_recv_frame_data_into_reuses_buffer() -> None:
+    lib = MockTutkLibrary()
+    lib.push_frame(b"\x00\x00\x00\x01first", tutk.FrameInfoStruct(frame_no=1))
+    lib.push_frame(b"second", tutk.FrameInfoStruct(frame_no=2))
+    pool = tutk.FrameBufferPool(size=1, max_len=1024)
+
+    with pool.acquire() as buffer:
+        assert tutk.av_recv_frame_data_into(lib, 0, buffer) == 0
+        assert buffer.data == b"\x00\x00\x00\x01first"
+        assert buffer.frame_info.frame_no == 1
+        assert buffer.frame_index == 0
+    assert pool.available == 1
+
+    with pool.acquire() as again:
+        assert again is buffer
+        assert tutk.av_recv_frame_data_into(lib, 0, again) == 0
+        assert again.tobytes() == b"second"
+        assert again.frame_info.frame_no == 2
+        assert (
+            tutk.av_recv_frame_data_into(lib, 0, again)
+            == tutk.AV_ER_DATA_NOREADY
+        )
+        assert len(again) == 0
+    assert pool.allocated == 1
+
+
+def test_frame_buffer_pool_grows_when_exhausted() -> None:
+    pool = tutk.FrameBufferPool(size=1, max_len=16)
+    first, second = pool.acquire(), pool.acquire()
+    assert first is not second
+    assert pool.allocated == 2
+    first.release()
+    second.release()
+    assert pool.available == 2
+
+
+def test_idle_io_ctrl_receive_does_not_allocate() -> None:
+    lib = MockTutkLibrary()
+    buffer = tutk.IOCtrlBuffer()
+
+    tracemalloc.start()
+    tutk.av_recv_io_ctrl(lib, 0, 1)
+    _, allocating_peak = tracemalloc.get_traced_memory()
+    # restart rather than reset_peak, which needs Python 3.9
+    tracemalloc.stop()
+    tracemalloc.start()
+    for _ in range(20):
+        assert (
+            tutk.av_recv_io_ctrl_into(lib, 0, buffer, 1) == tutk.AV_ER_TIMEOUT
+        )
+    _, reusing_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # a fresh receive buffer for every timeout, against none at all
+    assert allocating_peak >= tutk.IOCTRL_DATA_MAX_LEN
+    assert reusing_peak < 4096
+
+    lib.push_ioctrl(b"HL\x01\x00", io_ctrl_type=0x100)
+    assert tutk.av_recv_io_ctrl_into(lib, 0, buffer, 1) == 4
+    assert buffer.view[:4] == b"HL\x01\x00"
+    assert buffer.io_ctrl_type == 0x100